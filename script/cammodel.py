@@ -0,0 +1,106 @@
+"""
+pixel -> angle lookup tables for the stereo camera model
+
+the tables are built once per (image size, coefficients, hdev) and cached
+on disk as memory-mapped .npy files, so measurement and overlay tools only
+pay for a lookup per point. Longitude only depends on the column and
+latitude only on the row, so one table per axis gives the same bilinear
+result as full (height, width) tables
+"""
+
+import hashlib
+import json
+import os
+import numpy as np
+
+
+class CameraModel:
+    """
+    Per-pixel longitude/latitude (degrees) of the left and right cameras.
+
+    lon = 90 -/+ lon_coef_a * atan(lon_coef_t * px) - hdev  (left/right)
+    lat = lat_coef_a * atan(lat_coef_t * py)
+
+    with px, py measured from the image center, py pointing up.
+    """
+
+    SIDES = ("left", "right")
+
+    def __init__(self, width, height, lon_coef_a, lon_coef_t, lat_coef_a, lat_coef_t,
+                 hdev, cache_dir="./cache/cammodel"):
+        self.width      = int(width)
+        self.height     = int(height)
+        self.params     = {
+            "width"         : self.width,
+            "height"        : self.height,
+            "lon_coef_a"    : float(lon_coef_a),
+            "lon_coef_t"    : float(lon_coef_t),
+            "lat_coef_a"    : float(lat_coef_a),
+            "lat_coef_t"    : float(lat_coef_t),
+            "hdev"          : float(hdev)
+        }
+        self.cache_dir  = cache_dir
+        self.key        = hashlib.sha1(json.dumps(dict(self.params, layout="axis"), sort_keys=True).encode()).hexdigest()[:16]
+        self._tables    = {}
+
+    @classmethod
+    def from_config(cls, config, width, height):
+        return cls(
+            width, height,
+            config["lon_coef_a"], config["lon_coef_t"],
+            config["lat_coef_a"], config["lat_coef_t"],
+            config["cam_hdev"],
+            cache_dir = config.get("cam_model_cache", "./cache/cammodel")
+        )
+
+    # ---------------------------------------------------------------
+    def _build(self, name):
+        p       = self.params
+        px      = np.arange(self.width, dtype=np.float64) - self.width / 2
+        py      = -(np.arange(self.height, dtype=np.float64) - self.height / 2)
+
+        if name == "lat":
+            return p["lat_coef_a"] * np.arctan(p["lat_coef_t"] * py)
+
+        central = p["lon_coef_a"] * np.arctan(p["lon_coef_t"] * px)
+        if name == "lon_left":
+            return 90 - central - p["hdev"]
+        return 90 + central - p["hdev"]
+
+    def table(self, name):
+        """Memory-mapped per-axis table: lon_left, lon_right (width,) or lat (height,)"""
+        if name in self._tables:
+            return self._tables[name]
+
+        path = os.path.join(self.cache_dir, f"{self.key}-{name}.npy")
+        if not os.path.exists(path):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+            np.save(tmp_path, self._build(name))
+            os.replace(tmp_path, path)
+
+        self._tables[name] = np.load(path, mmap_mode="r")
+        return self._tables[name]
+
+    # ---------------------------------------------------------------
+    @staticmethod
+    def _linear(table, v):
+        """Linear lookup along one axis, extrapolated past the edges"""
+        v0 = np.clip(np.floor(v).astype(np.intp), 0, len(table) - 2)
+        fv = v - v0
+        return table[v0] * (1 - fv) + table[v0 + 1] * fv
+
+    def lonlat(self, xy, side):
+        """
+        Bilinear (lon, lat) in degrees for image coordinates xy (..., 2)
+        of the given camera side
+        """
+        if side not in self.SIDES:
+            raise ValueError(f"side must be one of {self.SIDES}, got {side}")
+
+        xy  = np.asarray(xy, dtype=np.float64)
+        x   = xy[..., 0]
+        y   = xy[..., 1]
+        lon = self._linear(self.table(f"lon_{side}"), x)
+        lat = self._linear(self.table("lat"), y)
+        return lon, lat
@@ -0,0 +1,119 @@
+"""
+perceptual-hash based near-duplicate detection for extracted frames
+"""
+
+import cv2
+import numpy as np
+
+
+# -------------------------------------------------------------------
+def phash(frame, hash_size=8, highfreq_factor=4):
+    """
+    64-bit DCT perceptual hash of a BGR or grayscale frame, as an int.
+
+    The frame is downscaled to 32x32 first, so hashing cost does not
+    depend on the source resolution.
+    """
+    size = hash_size * highfreq_factor
+    if frame.ndim == 3:
+        small = cv2.resize(frame, (size, size), interpolation=cv2.INTER_AREA)
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    else:
+        small = cv2.resize(frame, (size, size), interpolation=cv2.INTER_AREA)
+
+    dct     = cv2.dct(small.astype(np.float32))
+    low     = dct[:hash_size, :hash_size].flatten()
+    # the DC term only carries mean brightness, leave it out of the median
+    bits    = low > np.median(low[1:])
+
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+# -------------------------------------------------------------------
+class BKTree:
+    """
+    Burkhard-Keller tree over Hamming distance.
+
+    A radius query only descends into children whose edge distance lies
+    within [d - radius, d + radius], so lookups stay well below a linear
+    scan as the number of kept hashes grows.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, item):
+        node = self.root
+        self.size += 1
+        if node is None:
+            self.root = [value, item, {}]
+            return
+
+        while True:
+            d = hamming(value, node[0])
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, item, {}]
+                return
+            node = child
+
+    def nearest(self, value, radius):
+        """Return (distance, item) of the closest entry within radius, or None"""
+        if self.root is None:
+            return None
+
+        best    = None
+        stack   = [self.root]
+        while stack:
+            node    = stack.pop()
+            d       = hamming(value, node[0])
+            if d <= radius and (best is None or d < best[0]):
+                best    = (d, node[1])
+                radius  = d
+
+            for edge, child in node[2].items():
+                if d - radius <= edge <= d + radius:
+                    stack.append(child)
+
+        return best
+
+
+# -------------------------------------------------------------------
+class FrameDeduper:
+    """
+    Decide whether a frame is a near duplicate of an already kept frame.
+
+    One deduper can be shared across windows and source videos, so a shot
+    that repeats in another video is dropped as well.
+    """
+
+    def __init__(self, threshold=6):
+        self.threshold  = threshold
+        self.tree       = BKTree()
+        self.kept       = 0
+        self.dropped    = 0
+
+    def check(self, frame, key):
+        """
+        Hash `frame` and register it under `key` if it is kept.
+
+        Returns (keep, hash, duplicate_of, distance).
+        """
+        value = phash(frame)
+        match = self.tree.nearest(value, self.threshold)
+
+        if match is not None:
+            self.dropped += 1
+            return False, value, match[1], match[0]
+
+        self.tree.add(value, key)
+        self.kept += 1
+        return True, value, None, None
@@ -0,0 +1,303 @@
+"""
+embedded detection database
+
+scanf reports of every video go into one SQLite file (videos, sampled
+frames, detections), indexed on video, species, timestamp and confidence
+so cross-deployment questions are one query instead of a loop over JSON
+files
+
+    python script/detdb.py import [report_dir]
+    python script/detdb.py query
+
+videos carry recorded_at, when the footage was taken (a YYYYMMDD_HHMMSS
+stamp in the file name, else the container's creation_time), so queries
+can select deployments by date rather than by scan time
+"""
+
+import sqlite3
+import pandas as pd
+import yaml
+import json
+import time
+import sys
+import os
+from datetime import datetime, timezone
+from frames import date_stamp, creation_time
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    id              INTEGER PRIMARY KEY,
+    name            TEXT NOT NULL UNIQUE,
+    path            TEXT,
+    species         TEXT,
+    fps             REAL,
+    frame_width     INTEGER,
+    frame_height    INTEGER,
+    samples         INTEGER,
+    scanned_at      REAL,
+    recorded_at     REAL
+);
+
+CREATE TABLE IF NOT EXISTS frames (
+    id              INTEGER PRIMARY KEY,
+    video_id        INTEGER NOT NULL REFERENCES videos(id) ON DELETE CASCADE,
+    frame_index     INTEGER,
+    timestamp       REAL NOT NULL,
+    count           INTEGER NOT NULL,
+    conf_sum        REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS detections (
+    frame_id        INTEGER NOT NULL REFERENCES frames(id) ON DELETE CASCADE,
+    video_id        INTEGER NOT NULL,
+    timestamp       REAL NOT NULL,
+    species         TEXT,
+    cls             INTEGER,
+    conf            REAL NOT NULL,
+    x               REAL,
+    y               REAL,
+    w               REAL,
+    h               REAL
+);
+"""
+
+# timestamps are rounded to 2 decimals and repeat above 100 fps, frames are
+# unique by index (reports without frame_index store NULL, which never collides)
+INDEXES = """
+CREATE UNIQUE INDEX IF NOT EXISTS frames_video_frame ON frames(video_id, frame_index);
+CREATE INDEX IF NOT EXISTS frames_video_timestamp ON frames(video_id, timestamp);
+CREATE INDEX IF NOT EXISTS videos_recorded ON videos(recorded_at);
+CREATE INDEX IF NOT EXISTS detections_video_time ON detections(video_id, timestamp);
+CREATE INDEX IF NOT EXISTS detections_species_conf ON detections(species, conf);
+CREATE INDEX IF NOT EXISTS detections_frame ON detections(frame_id);
+"""
+
+
+# ---------------------------------------------------------------------------
+def connect(db_path):
+    """Open (and create) the database"""
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(SCHEMA)
+    _migrate(conn)
+    conn.executescript(INDEXES)
+    return conn
+
+
+def _migrate(conn):
+    """Bring a database created by an earlier version up to the schema"""
+    for table, column, kind in (("videos", "recorded_at", "REAL"), ("frames", "frame_index", "INTEGER")):
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+    conn.execute("DROP INDEX IF EXISTS frames_video_time")
+
+
+def recording_time(video_name, video_path=None):
+    """
+    When the footage was recorded, as epoch seconds: a YYYYMMDD_HHMMSS
+    stamp in the file or video name, else the container's creation_time
+    """
+    for name in (video_path, video_name):
+        stamp = date_stamp(name) if name else None
+        if stamp is not None:
+            return stamp
+    if video_path and os.path.exists(video_path):
+        return creation_time(video_path)
+    return None
+
+
+def store_report(conn, video_name, records, video_path=None, fps=None, recorded_at=None):
+    """
+    Replace everything stored for `video_name` with the scanf `records`,
+    in one transaction
+    """
+    records     = sorted(records, key=lambda item: item["timestamp"])
+    first       = records[0] if records else {}
+    recorded_at = recorded_at if recorded_at is not None else recording_time(video_name, video_path)
+
+    with conn:
+        conn.execute("DELETE FROM videos WHERE name = ?", (video_name,))
+        video_id = conn.execute(
+            "INSERT INTO videos (name, path, species, fps, frame_width, frame_height, samples, scanned_at, recorded_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                video_name, video_path, first.get("species"), fps,
+                first.get("frame_width"), first.get("frame_height"), len(records), time.time(), recorded_at
+            )
+        ).lastrowid
+
+        # frame ids are assigned here so detections can be inserted in one batch
+        start = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM frames").fetchone()[0]
+        conn.executemany(
+            "INSERT INTO frames (id, video_id, frame_index, timestamp, count, conf_sum) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (start + n, video_id, item.get("frame_index"), item["timestamp"], item["count"], float(sum(item["conf"])))
+                for n, item in enumerate(records)
+            )
+        )
+        conn.executemany(
+            "INSERT INTO detections (frame_id, video_id, timestamp, species, cls, conf, x, y, w, h) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (start + n, video_id, item["timestamp"], item.get("species"), int(c), float(p), *xywh)
+                for n, item in enumerate(records)
+                for c, p, xywh in zip(item["cls"], item["conf"], item["xywh"])
+            )
+        )
+
+    return video_id
+
+
+def import_reports(conn, report_dir="./report"):
+    """Load every report/<name>/<name>.json into the database"""
+    imported = []
+    for name in sorted(os.listdir(report_dir)):
+        json_path = os.path.join(report_dir, name, name + ".json")
+        if not os.path.isfile(json_path):
+            continue
+
+        with open(json_path, "r") as f:
+            records = json.load(f)
+
+        # the scan's meta knows the video file, for its recording date
+        meta_path   = os.path.join(report_dir, name, name + ".meta.json")
+        video_path  = None
+        if os.path.isfile(meta_path):
+            with open(meta_path, "r") as f:
+                video_path = json.load(f).get("video")
+
+        store_report(conn, name, records, video_path=video_path)
+        imported.append(name)
+        print(f"<< imported {name}: {len(records)} frame(s) >>")
+
+    return imported
+
+
+# ---------------------------------------------------------------------------
+def _epoch(value):
+    """Epoch seconds of a number, a date / datetime or an ISO date string (UTC when naive)"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _filters(species=None, videos=None, start=None, end=None, min_conf=0.0,
+             recorded_from=None, recorded_until=None):
+    """
+    WHERE clause and parameters over the detections table `d`. start / end
+    are seconds into each video, recorded_from (inclusive) and
+    recorded_until (exclusive) are recording dates
+    """
+    clauses = ["d.conf >= ?"]
+    params  = [min_conf]
+    if species:
+        clauses.append("d.species = ?")
+        params.append(species)
+    if videos:
+        clauses.append(f"v.name IN ({', '.join('?' * len(videos))})")
+        params.extend(videos)
+    if start is not None:
+        clauses.append("d.timestamp >= ?")
+        params.append(start)
+    if end is not None:
+        clauses.append("d.timestamp <= ?")
+        params.append(end)
+    if recorded_from is not None:
+        clauses.append("v.recorded_at >= ?")
+        params.append(_epoch(recorded_from))
+    if recorded_until is not None:
+        clauses.append("v.recorded_at < ?")
+        params.append(_epoch(recorded_until))
+    return " AND ".join(clauses), params
+
+
+def query_detections(conn, species=None, videos=None, start=None, end=None, min_conf=0.0,
+                     recorded_from=None, recorded_until=None):
+    """Every detection matching the filters, as a DataFrame"""
+    where, params = _filters(species, videos, start, end, min_conf, recorded_from, recorded_until)
+    sql = (
+        "SELECT v.name AS video, v.recorded_at, d.timestamp, d.species, d.cls, d.conf, d.x, d.y, d.w, d.h "
+        "FROM detections d JOIN videos v ON v.id = d.video_id "
+        f"WHERE {where} ORDER BY v.name, d.timestamp"
+    )
+    return pd.read_sql_query(sql, conn, params=params)
+
+
+def query_frames(conn, species=None, videos=None, start=None, end=None, min_conf=0.0, min_count=1,
+                 recorded_from=None, recorded_until=None):
+    """
+    Sampled frames with at least `min_count` detections above `min_conf`,
+    one row per frame with that count and the best confidence
+    """
+    where, params = _filters(species, videos, start, end, min_conf, recorded_from, recorded_until)
+    sql = (
+        "SELECT v.name AS video, v.recorded_at, f.frame_index, d.timestamp, COUNT(*) AS count, "
+        "MAX(d.conf) AS max_conf, SUM(d.conf) AS conf_sum "
+        "FROM detections d JOIN videos v ON v.id = d.video_id JOIN frames f ON f.id = d.frame_id "
+        f"WHERE {where} GROUP BY d.frame_id HAVING COUNT(*) >= ? ORDER BY v.name, d.timestamp"
+    )
+    return pd.read_sql_query(sql, conn, params=params + [min_count])
+
+
+def export(df, output_path):
+    """Write to .parquet or .csv, by extension"""
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    if output_path.endswith(".parquet"):
+        df.to_parquet(output_path, index=False)
+    else:
+        df.to_csv(output_path, index=False)
+
+
+
+if __name__ == "__main__":
+    # ---------------------------------------------------------------------------
+    config              = None
+    config_file_path    = "config.yaml"
+    with open(config_file_path, 'r') as f:
+        config = yaml.safe_load(f)  # Use safe_load for security
+
+    if not config:
+        print(f">> Error: Configuration file not found at {config_file_path} <<")
+        sys.exit()
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "query"
+    conn    = connect(config.get("detdb_path", "./report/detections.sqlite"))
+
+    if command == "import":
+        report_dir = sys.argv[2] if len(sys.argv) > 2 else config.get("report_dir", "./report")
+        imported   = import_reports(conn, report_dir)
+        print(f"<< {len(imported)} report(s) imported >>")
+
+    elif command == "query":
+        filters = {
+            "species"           : config.get("detdb_query_species"),
+            "videos"            : config.get("detdb_query_videos"),
+            "start"             : config.get("detdb_query_start"),
+            "end"               : config.get("detdb_query_end"),
+            "recorded_from"     : config.get("detdb_query_recorded_from"),
+            "recorded_until"    : config.get("detdb_query_recorded_until"),
+            "min_conf"          : float(config.get("detdb_query_min_conf", 0.0)),
+        }
+        if config.get("detdb_query_level", "frames") == "detections":
+            df = query_detections(conn, **filters)
+        else:
+            df = query_frames(conn, min_count=int(config.get("detdb_query_min_count", 1)), **filters)
+
+        output_path = config.get("detdb_query_output", "./report/query.csv")
+        export(df, output_path)
+        print(f"<< {len(df)} row(s) saved to {output_path} >>")
+
+    else:
+        print(f">> Error: unknown command {command}, use import or query <<")
+
+    conn.close()
@@ -0,0 +1,98 @@
+"""
+time-indexed lookup of scanf detections
+
+a scanf report is flattened once into sorted timestamp and box arrays, the
+detections sampled nearest to any playback time are then found with a
+binary search
+"""
+
+import json
+import numpy as np
+
+
+class DetectionIndex:
+    """
+    Detections of one video in CSR layout: record i owns the boxes
+    offsets[i]:offsets[i + 1] of xywh/conf/cls, records sorted by time.
+    """
+
+    def __init__(self, timestamps, offsets, xywh, conf, cls, frame_size):
+        self.timestamps = timestamps
+        self.offsets    = offsets
+        self.xywh       = xywh
+        self.conf       = conf
+        self.cls        = cls
+        self.frame_size = frame_size
+
+        # a sample stays on screen for at most one sampling step
+        steps           = np.diff(timestamps)
+        self.max_gap    = float(np.median(steps)) if len(steps) else 0.
+
+    @classmethod
+    def load(cls, json_path):
+        with open(json_path, "r") as f:
+            ds = json.load(f)
+
+        ds          = sorted(ds, key=lambda item: item["timestamp"])
+        counts      = np.array([len(item["conf"]) for item in ds], dtype=np.int64)
+        offsets     = np.zeros(len(ds) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        total       = int(offsets[-1])
+        xywh        = np.array([box for item in ds for box in item["xywh"]], dtype=np.float32).reshape(-1, 4)
+        conf        = np.fromiter((c for item in ds for c in item["conf"]), dtype=np.float32, count=total)
+        classes     = np.fromiter((c for item in ds for c in item["cls"]), dtype=np.float32, count=total)
+
+        frame_size  = (ds[0]["frame_width"], ds[0]["frame_height"]) if ds else (0, 0)
+        return cls(
+            np.array([item["timestamp"] for item in ds], dtype=np.float64),
+            offsets,
+            xywh,
+            conf,
+            classes,
+            frame_size
+        )
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def nearest(self, t, max_gap=None):
+        """
+        Index of the record sampled closest to `t`, or None when the
+        closest one is further than `max_gap` seconds away
+        """
+        if not len(self.timestamps):
+            return None
+
+        max_gap = self.max_gap if max_gap is None else max_gap
+        i       = int(np.searchsorted(self.timestamps, t))
+        best    = None
+        for j in (i - 1, i):
+            if 0 <= j < len(self.timestamps):
+                if best is None or abs(self.timestamps[j] - t) < abs(self.timestamps[best] - t):
+                    best = j
+
+        if abs(self.timestamps[best] - t) > max_gap:
+            return None
+        return best
+
+    def boxes_at(self, t, width, height, max_gap=None):
+        """
+        (xyxy int32 (n, 4), conf (n,)) of the nearest record, scaled to a
+        width x height display
+        """
+        i = self.nearest(t, max_gap)
+        if i is None:
+            return np.empty((0, 4), dtype=np.int32), np.empty(0, dtype=np.float32)
+
+        a, b    = self.offsets[i], self.offsets[i + 1]
+        xywh    = self.xywh[a:b]
+        sx      = width / self.frame_size[0]
+        sy      = height / self.frame_size[1]
+
+        xyxy = np.empty((b - a, 4), dtype=np.float32)
+        xyxy[:, 0] = (xywh[:, 0] - xywh[:, 2] / 2) * sx
+        xyxy[:, 1] = (xywh[:, 1] - xywh[:, 3] / 2) * sy
+        xyxy[:, 2] = (xywh[:, 0] + xywh[:, 2] / 2) * sx
+        xyxy[:, 3] = (xywh[:, 1] + xywh[:, 3] / 2) * sy
+        return xyxy.astype(np.int32), self.conf[a:b]
@@ -0,0 +1,125 @@
+"""
+encode raw frames by piping them into an ffmpeg subprocess
+"""
+
+import subprocess
+import threading
+import collections
+import numpy as np
+
+
+class FFmpegEncoder:
+    """
+    Frame sink that streams raw BGR frames into ffmpeg's stdin.
+
+    The encoder owns one reusable frame buffer (`self.frame`). Callers can
+    render into it in place (cv2.resize(..., dst=enc.frame)) and call
+    write() without arguments, so no per-frame allocation happens on the
+    python side. Encoding runs in ffmpeg's own threads.
+    """
+
+    def __init__(self, output_path, width, height, fps,
+                 codec="libx264", preset="veryfast", crf=20, threads=0,
+                 extra_args=None):
+        self.output_path    = output_path
+        self.width          = int(width)
+        self.height         = int(height)
+        self.fps            = fps
+        self.codec          = codec
+        self.preset         = preset
+        self.crf            = crf
+        self.threads        = threads
+        self.extra_args     = extra_args or []
+        self.frame          = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        self.frames_written = 0
+        self.process        = None
+        self.reader         = None
+        self.errors         = collections.deque(maxlen=50)
+
+    def command(self):
+        cmd = [
+            'ffmpeg',
+            '-loglevel', 'error',
+            '-f', 'rawvideo',
+            '-pix_fmt', 'bgr24',
+            '-s', f'{self.width}x{self.height}',
+            '-r', str(self.fps),
+            '-i', '-',
+            '-an',
+            # yuv420p needs even dimensions, crop transforms may give odd ones
+            '-vf', 'crop=trunc(iw/2)*2:trunc(ih/2)*2',
+            '-c:v', self.codec,
+            '-preset', str(self.preset),
+            '-crf', str(self.crf),
+            '-threads', str(self.threads),
+            '-pix_fmt', 'yuv420p',
+        ]
+
+        if self.codec == 'libx265':
+            cmd += ['-tag:v', 'hvc1']
+
+        cmd += self.extra_args
+        cmd += [self.output_path, '-y']
+        return cmd
+
+    def open(self):
+        self.process = subprocess.Popen(
+            self.command(),
+            stdin   = subprocess.PIPE,
+            stderr  = subprocess.PIPE
+        )
+
+        # warnings are drained while encoding, a full stderr pipe would
+        # block ffmpeg and with it write()
+        self.errors.clear()
+        self.reader = threading.Thread(target=self._drain, args=(self.process.stderr,), daemon=True)
+        self.reader.start()
+        return self
+
+    def _drain(self, stream):
+        for line in stream:
+            self.errors.append(line.decode(errors='replace').rstrip())
+
+    def write(self, frame=None):
+        """Write `frame`, or the internal buffer when no frame is given"""
+        if frame is None:
+            frame = self.frame
+
+        if frame.shape != self.frame.shape or frame.dtype != np.uint8:
+            raise ValueError(f"Expected a {self.frame.shape} uint8 frame, got {frame.shape} {frame.dtype}")
+
+        try:
+            self.process.stdin.write(memoryview(np.ascontiguousarray(frame)))
+        except BrokenPipeError:
+            raise RuntimeError(f"ffmpeg encoder exited early: {self._stderr()}")
+
+        self.frames_written += 1
+
+    def close(self):
+        if self.process is None:
+            return
+
+        self.process.stdin.close()
+        returncode      = self.process.wait()
+        error           = self._stderr()
+        self.process    = None
+
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg encoder failed ({returncode}): {error}")
+
+    def _stderr(self):
+        """Last lines ffmpeg printed, complete once it has exited"""
+        if self.reader is not None:
+            self.reader.join(timeout=5)
+        return "\n".join(self.errors).strip()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        elif self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process = None
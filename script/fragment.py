@@ -1,8 +1,23 @@
+"""
+extract frames from time windows of one or more videos
 
+every window is a single ffmpeg pass with input-side seeking, windows are
+spread over a worker pool
+"""
+
+import subprocess
+import tempfile
+import shutil
 import yaml
+import csv
 import sys
 import os
+import cv2
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
+from frames import iter_frames
+from dedup import FrameDeduper
 
 
 # -------------------------------------------------------------------
@@ -10,61 +25,247 @@ def get_base_filename(file_path):
     filename = os.path.basename(file_path)
     return os.path.splitext(filename)[0]
 
+
+def time_to_seconds(time_str):
+    """Convert "HH:MM:SS(.ms)", "MM:SS" or plain seconds to seconds"""
+    seconds = 0.
+    for part in str(time_str).split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def format_timestamp(seconds):
+    """Filename-safe, sortable timestamp: 00h02m00.333s"""
+    ms      = int(round(seconds * 1000))
+    h, ms   = divmod(ms, 3600 * 1000)
+    m, ms   = divmod(ms, 60 * 1000)
+    return f"{h:02d}h{m:02d}m{ms / 1000:06.3f}s"
+
+
+def frame_filename(video_path, seconds, ext="jpg"):
+    return f"{get_base_filename(video_path)}_{format_timestamp(seconds)}.{ext}"
+
+
+# OpenCV JPEG quality whose luminance quantisation table is closest to the one
+# ffmpeg's mjpeg encoder writes for -qscale:v 2..31 (1 encodes like 2)
+QSCALE_TO_JPEG_QUALITY = (
+    92, 89, 85, 80, 76, 75, 69, 67, 62, 60, 51, 51, 51, 43, 40,
+    40, 37, 34, 32, 31, 29, 29, 27, 26, 25, 24, 22, 22, 20, 19,
+)
+
+
+def jpeg_quality(qscale):
+    """cv2.IMWRITE_JPEG_QUALITY matching an ffmpeg -qscale:v value"""
+    qscale = min(max(int(qscale), 2), 31)
+    return QSCALE_TO_JPEG_QUALITY[qscale - 2]
+
+
 # -------------------------------------------------------------------
-config              = None
-config_file_path    = "config.yaml"
-with open(config_file_path, 'r') as f:
-    config = yaml.safe_load(f)  # Use safe_load for security
+def build_jobs(config):
+    """
+    Collect (video_path, start_seconds, end_seconds) windows from the config.
+
+    `frag_videos` entries are either a path, which uses the shared
+    `frag_windows`, or {path: ..., windows: [[start, end], ...]}. Without
+    `frag_videos`/`frag_windows` the single frag_filepath /
+    frag_start_time / frag_end_time window is used.
+    """
+    windows = config.get("frag_windows") or [
+        [config.get("frag_start_time"), config.get("frag_end_time")]
+    ]
+    videos  = config.get("frag_videos") or [config.get("frag_filepath")]
 
-if not config:
-    print(f">> Error: Configuration file not found at {config_file_path} <<")
-    sys.exit()
+    jobs    = []
+    for video in videos:
+        if isinstance(video, dict):
+            path            = video["path"]
+            video_windows   = video.get("windows") or windows
+        else:
+            path            = video
+            video_windows   = windows
+
+        path = os.path.abspath(path)
+        for start, end in video_windows:
+            jobs.append((path, time_to_seconds(start), time_to_seconds(end)))
+
+    # dedupe and keep a stable order so reruns produce identical outputs
+    return sorted(set(jobs))
+
+
+# -------------------------------------------------------------------
+def extract_window(video_path, start, end, fps, output_dir, quality=1, threads=1):
+    """
+    Dump JPEGs at `fps` for [start, end) of `video_path` in one ffmpeg pass.
+
+    Files are named <video>_<timestamp>.jpg, where the timestamp is the
+    position of the frame in the source video. Returns the written paths.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=output_dir, prefix=".frag_")
+
+    try:
+        command = [
+            'ffmpeg',
+            '-nostdin',
+            '-loglevel', 'error',
+            '-threads', str(threads),
+            '-ss', f'{start:.3f}',          # input-side seek, jumps to the nearest keyframe
+            '-i', video_path,
+            '-t', f'{end - start:.3f}',
+            '-vf', f'fps={fps}',
+            '-qscale:v', str(quality),
+            '-start_number', '0',
+            os.path.join(tmp_dir, '%07d.jpg'),
+            '-y'
+        ]
+        subprocess.run(command, check=True, capture_output=True)
+
+        # output frame k of the fps filter sits at start + k/fps in the source
+        written = []
+        for name in sorted(os.listdir(tmp_dir)):
+            k       = int(os.path.splitext(name)[0])
+            target  = os.path.join(output_dir, frame_filename(video_path, start + k / fps))
+            os.replace(os.path.join(tmp_dir, name), target)
+            written.append(target)
+
+        return written
+
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
 
 
 # -------------------------------------------------------------------
-filepath        = config.get("frag_filepath")
-filepath        = os.path.abspath(filepath)
-subject_dirpath = os.path.dirname(filepath)
-base_fname      = get_base_filename(filepath)
-sliced_path     = os.path.join(subject_dirpath, "sliced_" + base_fname + ".mp4")
-frag_fps        = config.get("frag_fps")
-start_time      = config.get("frag_start_time")
-end_time        = config.get("frag_end_time")
-
-
-
-# ------------------------------------------------------------------- SLICE
-print("<< start slicing >>")
-cmd_list = [
-    "ffmpeg -i",
-    filepath,
-    "-ss",
-    start_time,
-    "-to",
-    end_time,
-    "-c copy",
-    sliced_path,
-    "-y"
-]
-
-os.system(" ".join(cmd_list))
-print("<< slicing done >>")
-
-# ------------------------------------------------------------------- FRAG
-print("<< start fragmenting >>")
-cmd_list = [
-    'ffmpeg -i',
-    sliced_path,
-    '-vf',
-    f'"fps={frag_fps}"',
-    '-frame_pts 1',
-    ' -qscale:v 1',
-    f'"{subject_dirpath}/fps_{frag_fps}_frame_%d.jpg"'
-]
-
-print(" ".join(cmd_list))
-# sys.exit()
-os.system(" ".join(cmd_list))
-os.remove(sliced_path)
-print("<< fragmenting done >>")
+def extract_windows(jobs, fps, output_dir=None, workers=0, quality=1):
+    """
+    Run extract_window for every job on a thread pool. Each worker only
+    waits on its own ffmpeg process, so the pool scales with the cores.
+
+    Returns (written_paths, failures) where failures is a list of
+    (job, error message).
+    """
+    workers     = workers or os.cpu_count() or 1
+    threads     = 1 if workers > 1 else 0
+    written     = []
+    failures    = []
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for job in jobs:
+            video_path, start, end  = job
+            target_dir              = output_dir or os.path.dirname(video_path)
+            future                  = pool.submit(
+                extract_window, video_path, start, end, fps, target_dir, quality, threads
+            )
+            futures[future] = job
+
+        for future in tqdm(as_completed(futures), total=len(futures), desc="windows"):
+            job = futures[future]
+            try:
+                written.extend(future.result())
+            except subprocess.CalledProcessError as e:
+                message = e.stderr.decode(errors='replace').strip() if e.stderr else str(e)
+                failures.append((job, message))
+            except Exception as e:
+                failures.append((job, str(e)))
+
+    return sorted(written), failures
+
+
+# -------------------------------------------------------------------
+def extract_windows_dedup(jobs, fps, output_dir=None, workers=0, threshold=6, manifest_path=None, quality=1):
+    """
+    Extract frames like extract_windows, dropping near duplicates.
+
+    Frames stream out of frames.iter_frames and are hashed on a downscaled
+    copy; a frame within `threshold` bits of any frame kept so far, in any
+    window of any video, is dropped. Windows are processed in job order so
+    the kept set is deterministic, JPEG writes run on a thread pool.
+    `quality` is the ffmpeg -qscale:v of extract_window, mapped to the
+    equivalent OpenCV JPEG quality.
+
+    Every frame is recorded in a CSV manifest (kept or dropped, and which
+    kept frame it duplicates). Returns (written_paths, failures, deduper).
+    """
+    workers     = workers or os.cpu_count() or 1
+    deduper     = FrameDeduper(threshold)
+    written     = []
+    failures    = []
+    pending     = deque()
+    params      = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality(quality)]
+
+    if manifest_path is None:
+        manifest_path = os.path.join(output_dir or os.path.dirname(jobs[0][0]), "fragment-manifest.csv")
+    os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+
+    with open(manifest_path, 'w', newline='') as f, ThreadPoolExecutor(max_workers=workers) as pool:
+        manifest = csv.writer(f)
+        manifest.writerow(["video", "frame_index", "timestamp", "file", "phash", "status", "duplicate_of", "distance"])
+
+        for job in tqdm(jobs, desc="windows"):
+            video_path, start, end  = job
+            target_dir              = output_dir or os.path.dirname(video_path)
+            os.makedirs(target_dir, exist_ok=True)
+
+            try:
+                for index, timestamp, frame in iter_frames(video_path, start, end, fps=fps):
+                    name                        = frame_filename(video_path, timestamp)
+                    keep, value, dup, distance  = deduper.check(frame, name)
+
+                    if keep:
+                        path = os.path.join(target_dir, name)
+                        # the frame buffer is recycled by the decoder, hand the writer a copy
+                        pending.append(pool.submit(cv2.imwrite, path, frame.copy(), params))
+                        written.append(path)
+                        while len(pending) > 2 * workers:
+                            pending.popleft().result()
+
+                    manifest.writerow([
+                        video_path, index, f"{timestamp:.3f}", name, f"{value:016x}",
+                        "kept" if keep else "dropped", dup or "", "" if distance is None else distance
+                    ])
+
+            except Exception as e:
+                failures.append((job, str(e)))
+
+        for future in pending:
+            future.result()
+
+    return sorted(written), failures, deduper
+
+
+
+if __name__ == "__main__":
+    # -------------------------------------------------------------------
+    config              = None
+    config_file_path    = "config.yaml"
+    with open(config_file_path, 'r') as f:
+        config = yaml.safe_load(f)  # Use safe_load for security
+
+    if not config:
+        print(f">> Error: Configuration file not found at {config_file_path} <<")
+        sys.exit()
+
+    frag_fps        = config.get("frag_fps")
+    output_dir      = config.get("frag_output_dir")
+    output_dir      = os.path.abspath(output_dir) if output_dir else None
+    workers         = config.get("frag_workers", 0)
+    quality         = config.get("frag_quality", 1)
+
+    jobs            = build_jobs(config)
+
+    print(f"<< start fragmenting {len(jobs)} window(s) >>")
+    if config.get("frag_dedup", False):
+        written, failures, deduper = extract_windows_dedup(
+            jobs, frag_fps, output_dir, workers,
+            threshold       = config.get("frag_dedup_threshold", 6),
+            manifest_path   = config.get("frag_dedup_manifest"),
+            quality         = quality
+        )
+        print(f"<< dedup: kept {deduper.kept}, dropped {deduper.dropped} near duplicates >>")
+    else:
+        written, failures = extract_windows(jobs, frag_fps, output_dir, workers, quality)
+
+    for (video_path, start, end), message in failures:
+        print(f"<< failed: {video_path} {start:.2f}-{end:.2f}s: {message} >>")
 
+    print(f"<< fragmenting done: {len(written)} frames, {len(failures)} failed window(s) >>")
@@ -0,0 +1,426 @@
+"""
+in-memory frame extraction
+
+iter_frames() yields (frame_index, timestamp, ndarray) for a video, using
+the same parameters as fragment.py (start/end window, sampling fps) or an
+explicit list of frame indices. Decoding runs ahead on a background thread
+into a fixed pool of reused buffers.
+"""
+
+import subprocess
+import threading
+import collections
+import shutil
+import queue
+import json
+import math
+import os
+import re
+from datetime import datetime, timezone
+import cv2
+import numpy as np
+
+
+_END = object()
+
+DATE_STAMP = re.compile(r'(\d{8})[-_]?(\d{6})')
+
+
+# -------------------------------------------------------------------
+def time_to_seconds(time_str):
+    """Convert "HH:MM:SS(.ms)", "MM:SS" or plain seconds to seconds"""
+    seconds = 0.
+    for part in str(time_str).split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def date_stamp(path):
+    """
+    First YYYYMMDD_HHMMSS stamp of a file name as UTC epoch seconds, None
+    when there is no valid one. UTC, so a DST change does not shift files
+    """
+    match = DATE_STAMP.search(os.path.basename(str(path)))
+    if not match:
+        return None
+    try:
+        return datetime.strptime(''.join(match.groups()), "%Y%m%d%H%M%S").replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        return None
+
+
+def _parse_rate(rate):
+    num, _, den = str(rate).partition('/')
+    den = float(den) if den else 1.
+    return float(num) / den if den else 0.
+
+
+# -------------------------------------------------------------------
+def probe_video(video_path):
+    """
+    Return {width, height, fps, frame_count, duration} for the first video
+    stream. Uses ffprobe when available and falls back to OpenCV.
+    """
+    if shutil.which('ffprobe'):
+        command = [
+            'ffprobe',
+            '-v', 'error',
+            '-select_streams', 'v:0',
+            '-show_entries', 'stream=width,height,avg_frame_rate,r_frame_rate,nb_frames,duration',
+            '-show_entries', 'format=duration',
+            '-of', 'json',
+            video_path
+        ]
+        result = subprocess.run(command, capture_output=True)
+        if result.returncode == 0:
+            data    = json.loads(result.stdout)
+            stream  = (data.get('streams') or [{}])[0]
+            fps     = _parse_rate(stream.get('avg_frame_rate', '0')) or _parse_rate(stream.get('r_frame_rate', '0'))
+            dur     = float(stream.get('duration') or data.get('format', {}).get('duration') or 0)
+            count   = int(stream.get('nb_frames') or 0) or int(round(dur * fps))
+            if stream.get('width'):
+                return {
+                    "width"         : int(stream['width']),
+                    "height"        : int(stream['height']),
+                    "fps"           : fps,
+                    "frame_count"   : count,
+                    "duration"      : dur
+                }
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Unable to open video file: {video_path}")
+
+    fps     = cap.get(cv2.CAP_PROP_FPS)
+    count   = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    info    = {
+        "width"         : int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height"        : int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        "fps"           : fps,
+        "frame_count"   : count,
+        "duration"      : count / fps if fps else 0.
+    }
+    cap.release()
+    return info
+
+
+def creation_time(video_path):
+    """
+    The container's creation_time tag as epoch seconds, None without
+    ffprobe or the tag
+    """
+    if not shutil.which('ffprobe'):
+        return None
+
+    command = [
+        'ffprobe',
+        '-v', 'error',
+        '-show_entries', 'format_tags=creation_time',
+        '-of', 'json',
+        video_path
+    ]
+    result = subprocess.run(command, capture_output=True)
+    if result.returncode != 0:
+        return None
+
+    stamp = json.loads(result.stdout).get('format', {}).get('tags', {}).get('creation_time')
+    try:
+        return datetime.fromisoformat(stamp.replace('Z', '+00:00')).timestamp() if stamp else None
+    except ValueError:
+        return None
+
+
+def output_size(width, height, crop=None, scale=None):
+    """
+    Size of the yielded frames for a source of width x height.
+
+    crop is [x, y, w, h] in source pixels, scale is [w, h] or a factor.
+    """
+    if crop:
+        width, height = int(crop[2]), int(crop[3])
+
+    if scale is None:
+        return width, height
+
+    if isinstance(scale, (int, float)):
+        return max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+
+    return int(scale[0]), int(scale[1])
+
+
+# -------------------------------------------------------------------
+def _take(pool, stop):
+    while not stop.is_set():
+        try:
+            return pool.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return None
+
+
+def _give(ready, item, stop):
+    while not stop.is_set():
+        try:
+            ready.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _decode_ffmpeg(video_path, info, start, end, fps, crop, scale, color, pool, ready, stop):
+    """
+    Decode through an ffmpeg pipe. Seeking, sampling, crop and scale all
+    happen inside ffmpeg, the raw frames are read straight into pooled
+    buffers.
+    """
+    out_w, out_h    = output_size(info["width"], info["height"], crop, scale)
+    src_fps         = info["fps"]
+    fps             = fps or src_fps
+
+    filters = [f'fps={fps}']
+    if crop:
+        x, y, w, h = [int(v) for v in crop]
+        filters.append(f'crop={w}:{h}:{x}:{y}')
+    if (out_w, out_h) != output_size(info["width"], info["height"], crop):
+        filters.append(f'scale={out_w}:{out_h}:flags=area')
+
+    command = ['ffmpeg', '-nostdin', '-loglevel', 'error']
+    if start:
+        command += ['-ss', f'{start:.3f}']
+    command += ['-i', video_path]
+    if end is not None:
+        command += ['-t', f'{end - (start or 0.):.3f}']
+    command += [
+        '-vf', ','.join(filters),
+        '-an',
+        '-f', 'rawvideo',
+        '-pix_fmt', 'rgb24' if color == 'rgb' else 'bgr24',
+        '-'
+    ]
+
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    ended   = False
+
+    # drained while streaming: a damaged file can print errors until the
+    # stderr pipe is full, and ffmpeg would block instead of writing frames
+    errors  = collections.deque(maxlen=50)
+    def read_stderr():
+        for line in process.stderr:
+            errors.append(line.decode(errors='replace').rstrip())
+
+    reader  = threading.Thread(target=read_stderr, daemon=True)
+    reader.start()
+    try:
+        k = 0
+        while not stop.is_set():
+            buf = _take(pool, stop)
+            if buf is None:
+                break
+
+            view    = memoryview(buf).cast('B')
+            filled  = 0
+            while filled < len(view):
+                n = process.stdout.readinto(view[filled:])
+                if not n:
+                    break
+                filled += n
+
+            if filled < len(view):
+                pool.put(buf)
+                ended = True
+                break
+
+            timestamp   = (start or 0.) + k / fps
+            index       = int(round(timestamp * src_fps))
+            if not _give(ready, (index, timestamp, buf), stop):
+                break
+            k += 1
+
+    finally:
+        # at the end of the stream ffmpeg exits by itself, its exit code tells
+        # a complete decode from a truncated one
+        if not ended or stop.is_set():
+            process.kill()
+        process.wait()
+        process.stdout.close()
+        reader.join(timeout=5)
+        if ended and not stop.is_set() and process.returncode != 0:
+            message = "\n".join(errors).strip() or f"exit code {process.returncode}"
+            raise RuntimeError(f"ffmpeg decode failed: {message}")
+
+
+def _decode_opencv(video_path, info, indices, crop, scale, color, seek_gap, pool, ready, stop):
+    """
+    Decode through cv2.VideoCapture. Small gaps between wanted frames are
+    skipped with grab() (no colour conversion), large gaps with a seek.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Unable to open video file: {video_path}")
+
+    src_fps     = info["fps"] or cap.get(cv2.CAP_PROP_FPS)
+    out_w, out_h = output_size(info["width"], info["height"], crop, scale)
+    transform   = bool(crop) or (out_w, out_h) != (info["width"], info["height"])
+    scratch     = np.empty((info["height"], info["width"], 3), dtype=np.uint8)
+    position    = 0
+
+    try:
+        for index in indices:
+            if stop.is_set():
+                break
+
+            if index < position or index - position > seek_gap:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+                position = index
+
+            ok = True
+            while position < index and ok:
+                ok = cap.grab()
+                position += 1
+
+            if not ok or not cap.grab():
+                break
+            position += 1
+
+            buf = _take(pool, stop)
+            if buf is None:
+                break
+
+            if transform:
+                ret, frame = cap.retrieve(scratch)
+                ret = ret and frame is not None
+                if ret:
+                    if crop:
+                        x, y, w, h = [int(v) for v in crop]
+                        frame = frame[y:y + h, x:x + w]
+                    if frame.shape[:2] != (out_h, out_w):
+                        cv2.resize(frame, (out_w, out_h), dst=buf, interpolation=cv2.INTER_AREA)
+                    else:
+                        np.copyto(buf, frame)
+            else:
+                ret, frame = cap.retrieve(buf)
+                if ret and frame is not buf and frame.shape == buf.shape:
+                    np.copyto(buf, frame)
+
+            if not ret:
+                pool.put(buf)
+                break
+
+            if color == 'rgb':
+                cv2.cvtColor(buf, cv2.COLOR_BGR2RGB, dst=buf)
+
+            if not _give(ready, (index, index / src_fps, buf), stop):
+                break
+
+    finally:
+        cap.release()
+
+
+# -------------------------------------------------------------------
+def iter_frames(video_path, start=None, end=None, fps=None, frames=None,
+                crop=None, scale=None, color="bgr", prefetch=8,
+                backend="auto", seek_gap=None, info=None):
+    """
+    Yield (frame_index, timestamp, ndarray) for a video.
+
+    Parameters:
+    video_path (str): video file
+    start, end (str|float): window in "HH:MM:SS" or seconds, optional
+    fps (float): sampling rate inside the window, defaults to the source rate
+    frames (iterable): explicit frame indices, replaces start/end/fps
+    crop (list): [x, y, w, h] in source pixels
+    scale (list|float): [w, h] output size or a scale factor
+    color (str): "bgr" (OpenCV order) or "rgb"
+    prefetch (int): frames decoded ahead on the background thread
+    backend (str): "ffmpeg", "opencv" or "auto"
+
+    The yielded array is a pooled buffer that is handed back to the decoder
+    as soon as the next frame is requested, copy it to keep it.
+    """
+    info    = info or probe_video(video_path)
+    start   = time_to_seconds(start) if start is not None else None
+    end     = time_to_seconds(end) if end is not None else None
+    src_fps = info["fps"]
+
+    if backend == "auto":
+        backend = "ffmpeg" if frames is None and shutil.which('ffmpeg') else "opencv"
+
+    if backend == "opencv" and frames is None:
+        first   = int(math.ceil((start or 0.) * src_fps))
+        last    = int((end * src_fps) if end is not None else info["frame_count"])
+        step    = src_fps / fps if fps else 1.
+        frames  = sorted(set(int(round(first + k * step)) for k in range(int(math.ceil((last - first) / step)))))
+
+    out_w, out_h    = output_size(info["width"], info["height"], crop, scale)
+    pool            = queue.Queue()
+    ready           = queue.Queue(maxsize=prefetch)
+    stop            = threading.Event()
+
+    # prefetch in the ready queue, one held by the consumer, one being decoded
+    for _ in range(prefetch + 2):
+        pool.put(np.empty((out_h, out_w, 3), dtype=np.uint8))
+
+    if backend == "ffmpeg":
+        target  = _decode_ffmpeg
+        args    = (video_path, info, start, end, fps, crop, scale, color, pool, ready, stop)
+    else:
+        seek_gap    = seek_gap if seek_gap is not None else max(int(src_fps * 2), 1)
+        target      = _decode_opencv
+        args        = (video_path, info, sorted(set(frames)), crop, scale, color, seek_gap, pool, ready, stop)
+
+    def run():
+        try:
+            target(*args)
+        except BaseException as e:
+            _give(ready, e, stop)
+            return
+        _give(ready, _END, stop)
+
+    thread  = threading.Thread(target=run, daemon=True)
+    thread.start()
+
+    held    = None
+    try:
+        while True:
+            item = ready.get()
+            if item is _END:
+                break
+            if isinstance(item, BaseException):
+                raise item
+
+            if held is not None:
+                pool.put(held)
+            held = item[2]
+            yield item
+
+    finally:
+        stop.set()
+        thread.join()
+
+
+def batched(frames, batch_size):
+    """
+    Group (frame_index, timestamp, ndarray) items into
+    (indices, timestamps, stack) batches, stack of shape
+    (batch_size, h, w, 3).
+
+    The stack is one reused buffer, valid until the next batch is
+    requested. A short last batch only fills the first len(indices) rows.
+    """
+    stack       = None
+    indices     = []
+    timestamps  = []
+    for frame_index, timestamp, frame in frames:
+        if stack is None:
+            stack = np.empty((batch_size,) + frame.shape, dtype=frame.dtype)
+
+        np.copyto(stack[len(indices)], frame)
+        indices.append(frame_index)
+        timestamps.append(timestamp)
+        if len(indices) == batch_size:
+            yield tuple(indices), tuple(timestamps), stack
+            indices, timestamps = [], []
+
+    if indices:
+        yield tuple(indices), tuple(timestamps), stack
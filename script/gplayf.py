@@ -1,56 +1,182 @@
 """
-play video using opencv
+play video in a Tk window
+
+a background decoder fills a bounded ring of frames already scaled to the
+display size, the Tk main thread renders them paced by their timestamps
 """
 
 import tkinter as tk
-from tkinter import ttk, filedialog
-import cv2
+from tkinter import ttk, filedialog, messagebox
 import threading
 import PIL.Image, PIL.ImageTk
+import numpy as np
 import time
+import cv2
+import os
+from frames import iter_frames, probe_video
+from detindex import DetectionIndex
+from thumbs import keyframe_strip, thumbnail_at
+
+
+class FrameRing:
+    """
+    Bounded ring of preallocated display-size RGB frames with their pts.
+
+    The decoder thread fills slots with acquire()/commit(), the renderer
+    takes them with take_due()/release(). A full ring blocks the decoder,
+    so memory stays constant however far ahead decoding gets.
+    """
+
+    def __init__(self, capacity, width, height):
+        self.capacity   = capacity
+        self.frames     = np.empty((capacity, height, width, 3), dtype=np.uint8)
+        self.pts        = np.zeros(capacity)
+        self.read       = 0
+        self.count      = 0
+        self.finished   = False
+        self.closed     = False
+        self.cond       = threading.Condition()
+
+    def acquire(self):
+        """Index of the next free slot, or None once the ring is closed"""
+        with self.cond:
+            while self.count == self.capacity and not self.closed:
+                self.cond.wait(0.1)
+            if self.closed:
+                return None
+            return (self.read + self.count) % self.capacity
+
+    def commit(self, pts):
+        with self.cond:
+            self.pts[(self.read + self.count) % self.capacity] = pts
+            self.count += 1
+
+    def peek_pts(self):
+        with self.cond:
+            return self.pts[self.read] if self.count else None
+
+    def take_due(self, clock):
+        """
+        Slot of the newest frame due at `clock`, dropping the older due
+        ones. Returns (slot, dropped), slot is None when nothing is due.
+        """
+        with self.cond:
+            dropped = 0
+            while self.count > 1 and self.pts[(self.read + 1) % self.capacity] <= clock:
+                self.read   = (self.read + 1) % self.capacity
+                self.count -= 1
+                dropped    += 1
+
+            if dropped:
+                self.cond.notify()
+
+            if self.count and self.pts[self.read] <= clock:
+                return self.read, dropped
+            return None, dropped
+
+    def release(self):
+        with self.cond:
+            self.read   = (self.read + 1) % self.capacity
+            self.count -= 1
+            self.cond.notify()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
 
 class VideoPlayer:
+    RING_SIZE = 12
+
     def __init__(self, window):
         self.window = window
         self.window.title("Simple Video Player")
-        
+
         # Video state variables
         self.video_source = None
-        self.vid = None
+        self.info = None
         self.is_playing = False
         self.thread = None
-        
+        self.ring = None
+        self.position = 0.
+        self.clock_origin = None
+        self.display_size = (800, 600)
+        self.photo = None
+        self.image_item = None
+        self.render_job = None
+        self.detections = None
+        self.strip = None
+        self.scrubbing = False
+        self.resume_after_scrub = False
+
+        # playback statistics
+        self.decoded_frames = 0
+        self.displayed_frames = 0
+        self.dropped_frames = 0
+        self.decoded_fps = 0.
+        self.displayed_fps = 0.
+        self.stats_time = time.perf_counter()
+
         # Create GUI elements
         self.create_widgets()
-        
+        self.window.after(500, self.update_stats)
+
     def create_widgets(self):
         # Top frame for controls
         self.control_frame = ttk.Frame(self.window)
         self.control_frame.pack(side=tk.TOP, pady=5)
-        
+
         # Video address entry
         self.address_label = ttk.Label(self.control_frame, text="Video Address:")
         self.address_label.pack(side=tk.LEFT, padx=5)
-        
+
         self.address_entry = ttk.Entry(self.control_frame, width=50)
         self.address_entry.pack(side=tk.LEFT, padx=5)
-        
+
         # Browse button
         self.browse_btn = ttk.Button(self.control_frame, text="Browse", command=self.browse_file)
         self.browse_btn.pack(side=tk.LEFT, padx=5)
-        
+
         # Load button
         self.load_btn = ttk.Button(self.control_frame, text="Load", command=self.load_video)
         self.load_btn.pack(side=tk.LEFT, padx=5)
-        
+
         # Play/Pause button
         self.play_btn = ttk.Button(self.control_frame, text="Play", command=self.toggle_play)
         self.play_btn.pack(side=tk.LEFT, padx=5)
-        
+
+        # scanf detection overlay
+        self.overlay = tk.BooleanVar(value=True)
+        self.overlay_btn = ttk.Checkbutton(self.control_frame, text="Overlay", variable=self.overlay)
+        self.overlay_btn.pack(side=tk.LEFT, padx=5)
+
+        self.detections_btn = ttk.Button(self.control_frame, text="Detections", command=self.browse_detections)
+        self.detections_btn.pack(side=tk.LEFT, padx=5)
+
+        # decoded vs displayed frame rate
+        self.stats_label = ttk.Label(self.control_frame, text="", width=36)
+        self.stats_label.pack(side=tk.LEFT, padx=5)
+
         # Canvas for video display
         self.canvas = tk.Canvas(self.window, width=800, height=600)
         self.canvas.pack(pady=5)
-        
+
+        # Timeline: dragging previews cached keyframe thumbnails, release seeks exactly
+        self.timeline_frame = ttk.Frame(self.window)
+        self.timeline_frame.pack(side=tk.TOP, fill=tk.X, padx=5, pady=5)
+
+        self.timeline_var = tk.DoubleVar(value=0.)
+        self.timeline = ttk.Scale(self.timeline_frame, from_=0., to=1., orient=tk.HORIZONTAL,
+                                  variable=self.timeline_var)
+        self.timeline.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.timeline.bind("<ButtonPress-1>", self.start_scrub)
+        self.timeline.bind("<B1-Motion>", self.scrub)
+        self.timeline.bind("<ButtonRelease-1>", self.end_scrub)
+
+        self.time_label = ttk.Label(self.timeline_frame, text="00:00:00.00", width=12)
+        self.time_label.pack(side=tk.LEFT, padx=5)
+
     def browse_file(self):
         filename = filedialog.askopenfilename(
             filetypes=[
@@ -61,83 +187,278 @@ class VideoPlayer:
         if filename:
             self.address_entry.delete(0, tk.END)
             self.address_entry.insert(0, filename)
-    
+
+    def browse_detections(self):
+        filename = filedialog.askopenfilename(
+            filetypes=[
+                ("scanf report", "*.json"),
+                ("All files", "*.*")
+            ]
+        )
+        if filename:
+            self.load_detections(filename)
+
+    def load_detections(self, json_path):
+        """Index a scanf report once, lookups during playback are binary searches"""
+        try:
+            self.detections = DetectionIndex.load(json_path)
+        except Exception as e:
+            self.detections = None
+            messagebox.showerror("Error", f"Could not load detections: {e}")
+
+    def default_report(self, video_path):
+        """report/<video>/<video>.json as written by scanf"""
+        video_name = os.path.splitext(os.path.basename(video_path))[0]
+        return os.path.join("./report", video_name, video_name + ".json")
+
     def load_video(self):
-        if self.is_playing:
-            self.is_playing = False
-            if self.thread:
-                self.thread.join()
-        
+        self.pause()
+        self.stop_decoder()
+
         video_path = self.address_entry.get()
         if video_path:
             try:
-                self.vid = cv2.VideoCapture(video_path)
-                if not self.vid.isOpened():
-                    raise ValueError("Unable to open video source")
-                
+                self.info = probe_video(video_path)
+                self.video_source = video_path
+
                 # Get video properties
-                self.width = int(self.vid.get(cv2.CAP_PROP_FRAME_WIDTH))
-                self.height = int(self.vid.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                
+                self.width = self.info["width"]
+                self.height = self.info["height"]
+
                 # Resize canvas to match video dimensions (maintaining aspect ratio)
                 aspect_ratio = self.width / self.height
                 new_width = min(800, self.width)
                 new_height = int(new_width / aspect_ratio)
                 self.canvas.config(width=new_width, height=new_height)
-                
+                self.set_display_size(new_width, new_height)
+
+                # pick up the scanf report of this video when there is one
+                self.detections = None
+                if os.path.exists(self.default_report(video_path)):
+                    self.load_detections(self.default_report(video_path))
+
+                # thumbnails for scrubbing, cached on disk after the first session
+                self.strip = None
+                self.timeline.config(to=max(self.info["duration"], 0.01))
+                threading.Thread(target=self.load_strip, args=(video_path,), daemon=True).start()
+
                 # Update play button text
                 self.play_btn.config(text="Play")
-                self.is_playing = False
-                
+                self.seek(0.)
+
             except Exception as e:
-                tk.messagebox.showerror("Error", str(e))
-    
+                messagebox.showerror("Error", str(e))
+
+    def load_strip(self, video_path):
+        """Worker thread: keyframe thumbnail strip of the loaded video"""
+        try:
+            strip = keyframe_strip(video_path)
+        except Exception as e:
+            print(f"<< no thumbnail strip for {video_path}: {e} >>")
+            return
+        if video_path == self.video_source:
+            self.strip = strip
+
+    def set_display_size(self, width, height):
+        """One reused PhotoImage and canvas item per display size"""
+        self.display_size = (width, height)
+        self.preview = np.zeros((height, width, 3), dtype=np.uint8)
+        self.photo = PIL.ImageTk.PhotoImage("RGB", (width, height))
+        if self.image_item is None:
+            self.image_item = self.canvas.create_image(0, 0, image=self.photo, anchor=tk.NW)
+        else:
+            self.canvas.itemconfig(self.image_item, image=self.photo)
+
+    # ---------------------------------------------------------------
+    def start_decoder(self, position):
+        """(Re)start decoding at `position` seconds into a fresh ring"""
+        self.stop_decoder()
+        width, height = self.display_size
+        self.ring = FrameRing(self.RING_SIZE, width, height)
+        self.thread = threading.Thread(target=self.decode, args=(self.ring, position), daemon=True)
+        self.thread.start()
+
+    def stop_decoder(self):
+        if self.ring is not None:
+            self.ring.close()
+        if self.thread is not None:
+            self.thread.join()
+        self.ring = None
+        self.thread = None
+
+    def decode(self, ring, position):
+        """Decoder thread: scaled RGB frames from frames.iter_frames into the ring"""
+        width, height = ring.frames.shape[2], ring.frames.shape[1]
+        try:
+            for _, timestamp, frame in iter_frames(
+                self.video_source, start=position, scale=(width, height),
+                color="rgb", prefetch=4, info=self.info
+            ):
+                slot = ring.acquire()
+                if slot is None:
+                    return
+                np.copyto(ring.frames[slot], frame)
+                ring.commit(timestamp)
+                self.decoded_frames += 1
+        finally:
+            ring.finished = True
+
+    # ---------------------------------------------------------------
+    def timeline_position(self, event):
+        """Playback time under the mouse on the timeline"""
+        fraction = min(max(event.x / max(self.timeline.winfo_width(), 1), 0.), 1.)
+        return fraction * float(self.timeline.cget("to"))
+
+    def start_scrub(self, event):
+        if self.video_source is None:
+            return "break"
+        self.scrubbing = True
+        self.resume_after_scrub = self.is_playing
+        self.pause()
+        self.scrub(event)
+        return "break"
+
+    def scrub(self, event):
+        """While dragging only the nearest keyframe thumbnail is shown, nothing is decoded"""
+        if not self.scrubbing:
+            return "break"
+        t = self.timeline_position(event)
+        self.set_time(t)
+        if self.strip is not None:
+            thumb = thumbnail_at(*self.strip, t)
+            if thumb is not None:
+                cv2.resize(np.asarray(thumb), self.display_size, dst=self.preview, interpolation=cv2.INTER_LINEAR)
+                self.show(self.preview)
+        return "break"
+
+    def end_scrub(self, event):
+        if not self.scrubbing:
+            return "break"
+        self.scrubbing = False
+        self.seek(self.timeline_position(event))
+        if self.resume_after_scrub:
+            self.toggle_play()
+        return "break"
+
+    def seek(self, position):
+        """
+        Exact seek: the decoder restarts with an input-side seek, which
+        jumps to the preceding keyframe and decodes forward to `position`
+        """
+        self.position = position
+        self.set_time(position)
+        self.start_decoder(position)
+        if not self.is_playing:
+            self.show_still()
+
+    def show_still(self):
+        """Show the first decoded frame after a seek while paused"""
+        if self.is_playing or self.ring is None or self.scrubbing:
+            return
+        if self.ring.count:
+            slot = self.ring.read
+            frame = self.ring.frames[slot]
+            if self.overlay.get() and self.detections is not None:
+                self.draw_detections(frame, self.ring.pts[slot])
+            self.show(frame)
+        elif not self.ring.finished:
+            self.window.after(10, self.show_still)
+
+    def set_time(self, t):
+        self.timeline_var.set(t)
+        h, rest = divmod(t, 3600)
+        m, sec = divmod(rest, 60)
+        self.time_label.config(text=f"{int(h):02d}:{int(m):02d}:{sec:05.2f}")
+
+    def clock(self):
+        """Current playback time in seconds"""
+        if self.clock_origin is None:
+            return self.position
+        wall, pts = self.clock_origin
+        return pts + (time.perf_counter() - wall)
+
     def toggle_play(self):
-        if self.vid is None:
+        if self.video_source is None:
             return
-        
+
         if self.is_playing:
-            self.is_playing = False
-            self.play_btn.config(text="Play")
-            if self.thread:
-                self.thread.join()
+            self.pause()
         else:
             self.is_playing = True
             self.play_btn.config(text="Pause")
-            self.thread = threading.Thread(target=self.update_frame)
-            self.thread.daemon = True
-            self.thread.start()
-    
-    def update_frame(self):
-        while self.is_playing:
-            ret, frame = self.vid.read()
-            if ret:
-                # Resize frame to fit canvas
-                frame = cv2.resize(frame, (self.canvas.winfo_width(), self.canvas.winfo_height()))
-                # Convert frame to RGB
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                # Convert to PhotoImage
-                photo = PIL.ImageTk.PhotoImage(image=PIL.Image.fromarray(frame))
-                
-                # Update canvas
-                self.canvas.create_image(0, 0, image=photo, anchor=tk.NW)
-                self.canvas.photo = photo
-                
-                # Control frame rate
-                time.sleep(1/30)  # Limit to approximately 30 FPS
-            else:
-                # Video ended
-                self.is_playing = False
-                self.play_btn.config(text="Play")
-                self.vid.set(cv2.CAP_PROP_POS_FRAMES, 0)  # Reset to beginning
-                break
-    
+            self.clock_origin = (time.perf_counter(), self.position)
+            self.render()
+
+    def pause(self):
+        if self.is_playing:
+            self.position = self.clock()
+        self.is_playing = False
+        self.clock_origin = None
+        self.play_btn.config(text="Play")
+        if self.render_job is not None:
+            self.window.after_cancel(self.render_job)
+            self.render_job = None
+
+    def render(self):
+        """Main-thread renderer, shows the frame due now and schedules the next"""
+        self.render_job = None
+        if not self.is_playing or self.ring is None:
+            return
+
+        clock = self.clock()
+        slot, dropped = self.ring.take_due(clock)
+        self.dropped_frames += dropped
+
+        if slot is not None:
+            frame = self.ring.frames[slot]
+            if self.overlay.get() and self.detections is not None:
+                self.draw_detections(frame, self.ring.pts[slot])
+            self.show(frame)
+            self.set_time(float(self.ring.pts[slot]))
+            self.ring.release()
+            self.displayed_frames += 1
+
+        next_pts = self.ring.peek_pts()
+        if next_pts is None and self.ring.finished:
+            # Video ended, reset to beginning
+            self.pause()
+            self.seek(0.)
+            return
+
+        delay = 5 if next_pts is None else int((next_pts - self.clock()) * 1000)
+        self.render_job = self.window.after(min(max(delay, 1), 50), self.render)
+
+    def draw_detections(self, frame, timestamp):
+        """Boxes of the nearest sampled scanf record, drawn on the display-size frame"""
+        height, width = frame.shape[:2]
+        boxes, conf = self.detections.boxes_at(timestamp, width, height)
+        for (x1, y1, x2, y2), c in zip(boxes.tolist(), conf.tolist()):
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 173, 38), 1)
+            cv2.putText(frame, f"{c:.2f}", (x1, max(y1 - 3, 10)), cv2.FONT_HERSHEY_SIMPLEX,
+                        0.4, (255, 255, 255), 1, cv2.LINE_AA)
+
+    def show(self, frame):
+        self.photo.paste(PIL.Image.fromarray(frame))
+
+    def update_stats(self):
+        now = time.perf_counter()
+        elapsed = now - self.stats_time
+        self.decoded_fps = self.decoded_frames / elapsed
+        self.displayed_fps = self.displayed_frames / elapsed
+        self.stats_label.config(
+            text=f"decoded {self.decoded_fps:5.1f} fps  shown {self.displayed_fps:5.1f} fps  dropped {self.dropped_frames}"
+        )
+        self.decoded_frames = 0
+        self.displayed_frames = 0
+        self.stats_time = now
+        self.window.after(500, self.update_stats)
+
     def __del__(self):
-        if self.vid:
-            self.vid.release()
+        if self.ring is not None:
+            self.ring.close()
 
 # Create and run the application
 if __name__ == "__main__":
     root = tk.Tk()
     player = VideoPlayer(root)
-    root.mainloop()
\ No newline at end of file
+    root.mainloop()
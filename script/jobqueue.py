@@ -0,0 +1,313 @@
+"""
+persistent job queue for bulk scans
+
+one SQLite row per (video, config hash), so finished videos are not
+rescanned after a restart and a changed config queues everything again.
+Jobs are claimed longest-first by probed duration, failures are retried
+a bounded number of times, and any number of runner processes on the
+same machine can pull from the queue: a claim is one BEGIN IMMEDIATE
+transaction, and jobs of runners that died are handed out again.
+
+    python script/jobqueue.py status
+    python script/jobqueue.py retry
+    python script/jobqueue.py log <job id>
+"""
+
+import sqlite3
+import hashlib
+import socket
+import yaml
+import json
+import time
+import sys
+import os
+from frames import probe_video
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id              INTEGER PRIMARY KEY,
+    video           TEXT NOT NULL,
+    config_hash     TEXT NOT NULL,
+    duration        REAL,
+    status          TEXT NOT NULL DEFAULT 'pending',
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    max_attempts    INTEGER NOT NULL DEFAULT 3,
+    worker          TEXT,
+    started_at      REAL,
+    finished_at     REAL,
+    error           TEXT,
+    UNIQUE (video, config_hash)
+);
+
+CREATE TABLE IF NOT EXISTS job_log (
+    job_id          INTEGER NOT NULL REFERENCES jobs(id),
+    at              REAL NOT NULL,
+    worker          TEXT,
+    message         TEXT
+);
+
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs(config_hash, status, duration);
+CREATE INDEX IF NOT EXISTS job_log_job ON job_log(job_id);
+"""
+
+# config keys that change scan results, other keys do not invalidate finished jobs
+RESULT_KEYS = [
+    "species", "bulk_model_path", "bulk_conf_thres", "bulk_iou_thres",
+    "bulk_rescale_size", "bulk_interval", "roi_masks",
+]
+
+
+# ---------------------------------------------------------------------------
+def config_hash(config, keys=RESULT_KEYS):
+    """Short hash of the result-relevant config, plus the model file's mtime"""
+    relevant    = {k: config.get(k) for k in keys}
+    model_path  = config.get("bulk_model_path")
+    if model_path and os.path.exists(model_path):
+        relevant["model_mtime"] = os.stat(model_path).st_mtime_ns
+    return hashlib.sha1(json.dumps(relevant, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _alive(worker):
+    """
+    False only for a runner of this host whose process is gone. On
+    Windows os.kill terminates the process, so pids are checked through
+    psutil there and assumed alive without it.
+    """
+    host, _, pid = worker.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+
+    if sys.platform == "win32":
+        try:
+            import psutil
+        except ImportError:
+            return True
+        return psutil.pid_exists(int(pid))
+
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        pass
+    return True
+
+
+# ---------------------------------------------------------------------------
+class JobQueue:
+
+    def __init__(self, db_path, config_hash):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.config_hash    = config_hash
+        self.worker         = worker_name()
+        # transactions are opened explicitly
+        self.conn           = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def _log(self, job_id, message):
+        self.conn.execute(
+            "INSERT INTO job_log (job_id, at, worker, message) VALUES (?, ?, ?, ?)",
+            (job_id, time.time(), self.worker, message)
+        )
+
+    def enqueue(self, videos, max_attempts=3):
+        """
+        Add videos not queued yet under this config. Durations are probed
+        once here, videos that cannot be probed are queued as failed.
+        """
+        known   = {row[0] for row in self.conn.execute(
+            "SELECT video FROM jobs WHERE config_hash = ?", (self.config_hash,)
+        )}
+        added   = 0
+        for video in videos:
+            video = os.path.abspath(video)
+            if video in known:
+                continue
+
+            try:
+                duration, status, error = probe_video(video)["duration"], "pending", None
+            except ValueError as e:
+                duration, status, error = None, "failed", str(e)
+
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO jobs (video, config_hash, duration, status, max_attempts, error) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (video, self.config_hash, duration, status, max_attempts, error)
+            )
+            if cursor.rowcount:
+                added += 1
+                self._log(cursor.lastrowid, f"queued, {status}" + (f": {error}" if error else ""))
+
+        return added
+
+    def requeue_dead(self):
+        """Hand out again the running jobs of runners that no longer exist"""
+        for job_id, worker in self.conn.execute(
+            "SELECT id, worker FROM jobs WHERE config_hash = ? AND status = 'running'", (self.config_hash,)
+        ).fetchall():
+            if not _alive(worker):
+                self._release(job_id, f"runner {worker} died")
+
+    def claim(self):
+        """
+        Take the longest pending job, or None when nothing is left.
+        Returns a dict with id, video, duration and attempts.
+        """
+        self.requeue_dead()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute(
+                "SELECT id, video, duration, attempts FROM jobs "
+                "WHERE config_hash = ? AND status = 'pending' "
+                "ORDER BY duration DESC, id LIMIT 1",
+                (self.config_hash,)
+            ).fetchone()
+            if row is None:
+                self.conn.execute("COMMIT")
+                return None
+
+            job_id, video, duration, attempts = row
+            self.conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, "
+                "started_at = ?, finished_at = NULL WHERE id = ?",
+                (self.worker, time.time(), job_id)
+            )
+            self._log(job_id, f"claimed, attempt {attempts + 1}")
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+        return {"id": job_id, "video": video, "duration": duration, "attempts": attempts + 1}
+
+    def finish(self, job_id):
+        now = time.time()
+        self.conn.execute(
+            "UPDATE jobs SET status = 'done', finished_at = ?, error = NULL WHERE id = ?", (now, job_id)
+        )
+        self._log(job_id, "done")
+
+    def _release(self, job_id, error):
+        """Back to pending, or failed once out of attempts"""
+        self.conn.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END, "
+            "finished_at = ?, error = ? WHERE id = ?",
+            (time.time(), error, job_id)
+        )
+        self._log(job_id, error)
+
+    def fail(self, job_id, error):
+        self._release(job_id, error)
+
+    def interrupt(self, job_id):
+        """Give a job back without spending an attempt"""
+        self.conn.execute("UPDATE jobs SET attempts = MAX(attempts - 1, 0) WHERE id = ?", (job_id,))
+        self._release(job_id, "interrupted")
+
+    def retry_failed(self):
+        """Reset failed jobs of this config to pending with fresh attempts"""
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = 'pending', attempts = 0, error = NULL "
+            "WHERE config_hash = ? AND status = 'failed' AND duration IS NOT NULL",
+            (self.config_hash,)
+        )
+        return cursor.rowcount
+
+    def status(self):
+        """
+        Job counts per status and the ETA. Throughput is video seconds
+        scanned per wall-clock second per runner, from the finished jobs;
+        the ETA divides the remaining video time by it and by the number
+        of runners currently active.
+        """
+        counts = dict(self.conn.execute(
+            "SELECT status, COUNT(*) FROM jobs WHERE config_hash = ? GROUP BY status", (self.config_hash,)
+        ).fetchall())
+
+        scanned, elapsed = self.conn.execute(
+            "SELECT SUM(duration), SUM(finished_at - started_at) FROM jobs "
+            "WHERE config_hash = ? AND status = 'done'", (self.config_hash,)
+        ).fetchone()
+        remaining, = self.conn.execute(
+            "SELECT SUM(duration) FROM jobs WHERE config_hash = ? AND status IN ('pending', 'running')",
+            (self.config_hash,)
+        ).fetchone()
+        runners, = self.conn.execute(
+            "SELECT COUNT(DISTINCT worker) FROM jobs WHERE config_hash = ? AND status = 'running'",
+            (self.config_hash,)
+        ).fetchone()
+
+        throughput  = scanned / elapsed if scanned and elapsed else None
+        eta         = remaining / (throughput * max(runners, 1)) if throughput and remaining else None
+        return {
+            "counts"        : counts,
+            "throughput"    : throughput,
+            "remaining"     : remaining or 0.,
+            "runners"       : runners,
+            "eta"           : eta,
+        }
+
+    def jobs(self):
+        return self.conn.execute(
+            "SELECT id, status, attempts, max_attempts, duration, worker, video, error FROM jobs "
+            "WHERE config_hash = ? ORDER BY duration DESC", (self.config_hash,)
+        ).fetchall()
+
+    def log(self, job_id):
+        return self.conn.execute(
+            "SELECT at, worker, message FROM job_log WHERE job_id = ? ORDER BY at", (job_id,)
+        ).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "unknown"
+    m, s = divmod(int(seconds), 60)
+    h, m = divmod(m, 60)
+    return f"{h}h{m:02d}m{s:02d}s"
+
+
+
+if __name__ == "__main__":
+    # ---------------------------------------------------------------------------
+    config              = None
+    config_file_path    = "config.yaml"
+    with open(config_file_path, 'r') as f:
+        config = yaml.safe_load(f)  # Use safe_load for security
+
+    if not config:
+        print(f">> Error: Configuration file not found at {config_file_path} <<")
+        sys.exit()
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    queue   = JobQueue(config.get("bulk_queue_path", "./cache/jobs.sqlite"), config_hash(config))
+
+    if command == "status":
+        for job_id, status, attempts, max_attempts, duration, worker, video, error in queue.jobs():
+            line = f"{job_id:5d}  {status:8s} {attempts}/{max_attempts}  {duration or 0:9.1f}s  {os.path.basename(video)}"
+            print(line + (f"  ({error.strip().splitlines()[-1]})" if error else ""))
+
+        state = queue.status()
+        print(f"<< {state['counts']}, {state['remaining']:.0f}s of video left, "
+              f"{state['runners']} runner(s), ETA {format_eta(state['eta'])} >>")
+
+    elif command == "retry":
+        print(f"<< {queue.retry_failed()} failed job(s) queued again >>")
+
+    elif command == "log" and len(sys.argv) > 2:
+        for at, worker, message in queue.log(int(sys.argv[2])):
+            print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(at))}  {worker}  {message}")
+
+    else:
+        print(">> Error: use status, retry or log <job id> <<")
+
+    queue.close()
@@ -0,0 +1,310 @@
+"""
+live scanning of camera streams
+
+an ffmpeg capture thread decodes an RTSP / UDP / HTTP stream or a named
+pipe and only ever keeps the newest frame (triple buffer, older frames
+are overwritten). Inference samples at live_fps, frames that are already
+older than the latency budget when picked up are dropped. Every record
+carries its capture-to-result latency and the rolling MaxN, and goes out
+as one JSON line to an append-only file and / or TCP clients.
+
+    python script/live.py [url]
+
+local test: ffmpeg -re -i clip.mp4 -f mpegts udp://127.0.0.1:5000
+            python script/live.py udp://127.0.0.1:5000
+            nc 127.0.0.1 8765
+
+or through a named pipe:
+            mkfifo /tmp/cam && ffmpeg -re -i clip.mp4 -an -f nut -y /tmp/cam
+            python script/live.py /tmp/cam
+"""
+
+import subprocess
+import threading
+import socket
+import yaml
+import json
+import time
+import sys
+import os
+import numpy as np
+from frames import probe_video
+from stats import RollingMaxN
+from roi import roi_for
+
+
+# ---------------------------------------------------------------------------
+class LatestFrame:
+    """
+    Capture thread over an ffmpeg pipe keeping only the newest frame.
+
+    Three buffers rotate: one being filled, the newest complete one and
+    the one held by the consumer. A complete frame replaces an unread
+    one, which is counted as overwritten.
+    """
+
+    def __init__(self, source, width, height, scale=None, input_args=None):
+        self.width      = width
+        self.height     = height
+        self.buffers    = [np.empty((height, width, 3), dtype=np.uint8) for _ in range(3)]
+        self.filling    = 0
+        self.newest     = None
+        self.held       = None
+        self.seq        = 0
+        self.captured   = 0.
+        self.overwritten = 0
+        self.ended      = False
+        self.cond       = threading.Condition()
+
+        command = ['ffmpeg', '-nostdin', '-loglevel', 'error', '-fflags', 'nobuffer', '-flags', 'low_delay']
+        if source.startswith('rtsp://'):
+            command += ['-rtsp_transport', 'tcp']
+        command += list(input_args or [])
+        command += ['-i', source, '-an']
+        if scale:
+            command += ['-vf', f'scale={width}:{height}:flags=area']
+        command += ['-f', 'rawvideo', '-pix_fmt', 'bgr24', '-']
+
+        self.process    = subprocess.Popen(command, stdout=subprocess.PIPE)
+        self.thread     = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                view    = memoryview(self.buffers[self.filling]).cast('B')
+                filled  = 0
+                while filled < len(view):
+                    n = self.process.stdout.readinto(view[filled:])
+                    if not n:
+                        return
+                    filled += n
+
+                with self.cond:
+                    if self.newest is not None:
+                        self.overwritten += 1
+                    # the filled buffer becomes the newest, the free one is filled next
+                    free            = ({0, 1, 2} - {self.filling, self.held}).pop() if self.newest is None else self.newest
+                    self.newest     = self.filling
+                    self.filling    = free
+                    self.seq        += 1
+                    self.captured   = time.time()
+                    self.cond.notify_all()
+        finally:
+            with self.cond:
+                self.ended = True
+                self.cond.notify_all()
+
+    def get(self, timeout=None):
+        """
+        (seq, capture time, frame) of the newest frame not returned yet,
+        waiting for one. The frame stays valid until the next get().
+        None once the stream has ended.
+        """
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.newest is not None or self.ended, timeout):
+                raise TimeoutError("no frame from the stream")
+            if self.newest is None:
+                return None
+
+            self.held, self.newest = self.newest, None
+            return self.seq, self.captured, self.buffers[self.held]
+
+    def close(self):
+        self.process.kill()
+        self.process.wait()
+        self.thread.join(timeout=1)
+
+
+# ---------------------------------------------------------------------------
+class LineSink:
+    """
+    JSON lines to an append-only file and / or every TCP client connected
+    to `address` ("host:port"). Slow or gone clients are dropped, they
+    never hold up the scan.
+    """
+
+    def __init__(self, path=None, address=None):
+        self.file       = None
+        self.server     = None
+        self.clients    = []
+        self.lock       = threading.Lock()
+
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.file = open(path, "a", buffering=1)
+
+        if address:
+            host, port  = address.rsplit(":", 1)
+            self.server = socket.create_server((host, int(port)), reuse_port=False)
+            threading.Thread(target=self._accept, daemon=True).start()
+            print(f"<< streaming JSON lines on {address} >>")
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            client.settimeout(0.05)
+            with self.lock:
+                self.clients.append(client)
+
+    def write(self, record):
+        line = json.dumps(record) + "\n"
+        if self.file:
+            self.file.write(line)
+
+        with self.lock:
+            for client in list(self.clients):
+                try:
+                    client.sendall(line.encode())
+                except OSError:
+                    client.close()
+                    self.clients.remove(client)
+
+    def close(self):
+        if self.file:
+            self.file.close()
+        if self.server:
+            self.server.close()
+        with self.lock:
+            for client in self.clients:
+                client.close()
+
+
+# ---------------------------------------------------------------------------
+def run_live(capture, detect, sink, sample_fps=2.0, max_latency=1.0, maxn_window=60.0, species="", roi=None,
+             stall_timeout=30.0):
+    """
+    Sample the stream at `sample_fps`, infer with detect(frame) ->
+    (cls, conf, xywh) arrays and write one record per inferred frame.
+    Returns the number of records and of dropped frames. Raises
+    TimeoutError when no frame arrives for `stall_timeout` seconds.
+    """
+    rolling     = RollingMaxN(maxn_window)
+    period      = 1. / sample_fps
+    crop        = roi.crop if roi else None
+    started     = None
+    next_due    = 0.
+    records     = 0
+    stale       = 0
+    last_seq    = 0
+
+    while True:
+        item = capture.get(timeout=stall_timeout)
+        if item is None:
+            break
+        seq, captured, frame = item
+
+        if started is None:
+            started = captured
+        if captured - started < next_due:
+            continue
+        if time.time() - captured > max_latency:
+            stale += 1
+            continue
+        next_due = max(next_due + period, captured - started)
+
+        # frames since the last inferred one never reached inference:
+        # overwritten before pickup, not due yet or stale
+        skipped     = seq - last_seq - 1
+        last_seq    = seq
+
+        if crop:
+            x, y, w, h  = crop
+            frame       = frame[y:y + h, x:x + w]
+
+        cls, conf, xywh = detect(frame)
+        if roi:
+            xywh, inside    = roi.to_frame(xywh)
+            cls, conf, xywh = cls[inside], conf[inside], xywh[inside]
+
+        done        = time.time()
+        timestamp   = round(captured - started, 3)
+        count       = len(conf)
+        sink.write({
+            "timestamp"     : timestamp,
+            "wall_time"     : round(captured, 3),
+            "species"       : species,
+            "count"         : count,
+            "rolling_maxn"  : rolling.update(timestamp, count),
+            "latency_ms"    : round((done - captured) * 1000, 1),
+            "seq"           : seq,
+            "skipped"       : skipped,
+            "stale_total"   : stale,
+            "frame_height"  : capture.height,
+            "frame_width"   : capture.width,
+            "cls"           : np.asarray(cls).tolist(),
+            "conf"          : np.asarray(conf).tolist(),
+            "xywh"          : np.asarray(xywh).tolist()
+        })
+        records += 1
+
+    return records, stale
+
+
+
+if __name__ == "__main__":
+    # ---------------------------------------------------------------------------
+    config              = None
+    config_file_path    = "config.yaml"
+    with open(config_file_path, 'r') as f:
+        config = yaml.safe_load(f)  # Use safe_load for security
+
+    if not config:
+        print(f">> Error: Configuration file not found at {config_file_path} <<")
+        sys.exit()
+
+    from ultralytics import YOLO
+
+    source      = sys.argv[1] if len(sys.argv) > 1 else config.get("live_source")
+    live_name   = config.get("live_name", "live")
+    size        = config.get("live_size")
+
+    # a fixed size avoids probing, which would consume the head of a pipe
+    if size:
+        width, height = int(size[0]), int(size[1])
+    else:
+        info            = probe_video(source)
+        width, height   = info["width"], info["height"]
+
+    model = YOLO(os.path.abspath(config.get("scanf_model_path")))
+    print("<< model loaded >>")
+
+    def detect(frame):
+        r = model.predict(
+            source  = frame,
+            conf    = config.get("scanf_conf_thres"),
+            iou     = config.get("scanf_iou_thres"),
+            imgsz   = config.get("scanf_rescale_size"),
+            save    = False,
+            verbose = False
+        )[0]
+        return r.boxes.cls.cpu().numpy(), r.boxes.conf.cpu().numpy(), r.boxes.xywh.cpu().numpy()
+
+    capture = LatestFrame(source, width, height, scale=bool(size))
+    sink    = LineSink(
+        config.get("live_output", f"./report/{live_name}/{live_name}.jsonl"),
+        config.get("live_socket")
+    )
+
+    try:
+        records, stale = run_live(
+            capture, detect, sink,
+            sample_fps    = float(config.get("live_fps", 2.0)),
+            max_latency   = float(config.get("live_max_latency", 1.0)),
+            maxn_window   = float(config.get("live_maxn_window", 60.0)),
+            species       = config.get("species", ""),
+            roi           = roi_for(live_name, config.get("roi_masks") or {}, width, height),
+            stall_timeout = float(config.get("live_stall_timeout", 30.0))
+        )
+        print(f"<< stream ended: {records} record(s), {stale} stale frame(s) dropped, "
+              f"{capture.overwritten} overwritten before pickup >>")
+    except TimeoutError:
+        print(f">> Error: stream stalled, no frame from {source} for {config.get('live_stall_timeout', 30.0)} s <<")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        capture.close()
+        sink.close()
@@ -6,7 +6,11 @@ import sys
 import os
 import re
 import json
+import csv
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from cammodel import CameraModel
+from frames import date_stamp
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
@@ -34,14 +38,14 @@ right_json_path  = config["right_cam_json"]
 def central_longitude_from_px(px):
     coef_a          = config["lon_coef_a"]
     coef_t          = config["lon_coef_t"]
-    res   = coef_a * np.atan(coef_t * px)
+    res   = coef_a * np.arctan(coef_t * np.asarray(px, dtype=np.float64))
     return res    
 
 
 def central_latitude_from_py(px):
     coef_a          = config["lat_coef_a"]
     coef_t          = config["lat_coef_t"]
-    res   = coef_a * np.atan(coef_t * px)
+    res   = coef_a * np.arctan(coef_t * np.asarray(px, dtype=np.float64))
     return res    
 
 
@@ -79,28 +83,22 @@ def segment_distance(cam_dist, alpha, beta):
 
 
 def get_distance_3d(a, b):
-    x1 = a[0]
-    y1 = a[1]
-    z1 = a[2]
-
-    x2 = b[0]
-    y2 = b[1]
-    z2 = b[2]
-
-    distance = math.sqrt((x2 - x1)**2 + (y2 - y1)**2 + (z2 - z1)**2)
-    return distance
+    """Euclidean distance between points stacked along the last axis"""
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    return np.sqrt(np.sum((b - a)**2, axis=-1))
 
 
 def angular_distance_law_of_cosines(lat1_rad, lon1_rad, lat2_rad, lon2_rad):
-  # Apply the Spherical Law of Cosines
-  cos_delta = (math.sin(lat1_rad) * math.sin(lat2_rad) +
-               math.cos(lat1_rad) * math.cos(lat2_rad) * math.cos(lon2_rad - lon1_rad))
+  # Apply the Spherical Law of Cosines, elementwise over arrays
+  cos_delta = (np.sin(lat1_rad) * np.sin(lat2_rad) +
+               np.cos(lat1_rad) * np.cos(lat2_rad) * np.cos(lon2_rad - lon1_rad))
 
   #Handle potential floating-point errors where cos_delta > 1 or < -1
   #If the points are near antipodal they can cause an error
-  cos_delta = max(min(cos_delta, 1.0), -1.0) #clip to -1 to 1
+  cos_delta = np.clip(cos_delta, -1.0, 1.0)
 
-  delta = math.acos(cos_delta)
+  delta = np.arccos(cos_delta)
 
   return delta
 
@@ -141,7 +139,7 @@ def get_principal_coordinates(cam_sep, left_lat, left_lon, right_lat, right_lon)
 
     # error analysis on c_y
    # c_y = hc / np.sin(cab) * np.cos(caq) * np.sin(qab)
-    return [c_x, c_y, c_z]
+    return np.stack([c_x, c_y, c_z], axis=-1)
 
 
 def print_coordinates(coord):
@@ -160,98 +158,441 @@ def print_coordinates_unity(coord):
 
 
 # ---------------------------------------------------------------------
-with open(left_json_path, "r") as f:
-    left_cam = json.load(f)
+def load_labelme(json_path):
+    with open(json_path, "r") as f:
+        return json.load(f)
 
-with open(right_json_path, "r") as f:
-    right_cam = json.load(f)
 
-img_width       = left_cam['imageWidth']
-img_height      = left_cam['imageHeight']
-center_width    = img_width/2
-center_height   = img_height/2
-look_shift      = cam_hdev
+def label_points(cam):
+    """Map label -> points of a labelme document, last shape wins like before"""
+    points = {}
+    for mark in cam['shapes']:
+        points[mark['label']] = mark['points']
+    return points
 
 
+def pair_points(left_cam, right_cam):
+    """
+    Stack the two endpoints of every label found in both views.
 
-leftpoints = {}
-for mark in left_cam['shapes']:
-    label = mark['label']
-    leftpoints[label] = mark['points']
+    Returns (labels, left_xy, right_xy, mismatched) where left_xy/right_xy
+    are (N, 2, 2) arrays of image coordinates and mismatched lists labels
+    present in only one view or with fewer than two points.
+    """
+    leftpoints  = label_points(left_cam)
+    rightpoints = label_points(right_cam)
 
-rightpoints = {}
-for mark in right_cam['shapes']:
-    label = mark['label']
-    rightpoints[label] = mark['points']
+    labels      = []
+    mismatched  = sorted(set(leftpoints) ^ set(rightpoints))
+    for label in leftpoints:
+        if label not in rightpoints:
+            continue
+        if len(leftpoints[label]) < 2 or len(rightpoints[label]) < 2:
+            mismatched.append(label)
+            continue
+        labels.append(label)
 
+    left_xy     = np.array([leftpoints[k][:2] for k in labels], dtype=np.float64).reshape(-1, 2, 2)
+    right_xy    = np.array([rightpoints[k][:2] for k in labels], dtype=np.float64).reshape(-1, 2, 2)
+    return labels, left_xy, right_xy, mismatched
 
 
-leftpixels  = {}
-rightpixels = {}
+camera_models = {}
 
-for key, points in leftpoints.items():
-    leftpixels[key] = []
-    for point in points:
-        px = point[0] - center_width
-        py = -(point[1] - center_height)
-        leftpixels[key].append([px, py])
+def get_camera_model(img_width, img_height):
+    """Shared CameraModel per image size, its tables are cached on disk"""
+    key = (int(img_width), int(img_height))
+    if key not in camera_models:
+        camera_models[key] = CameraModel.from_config(config, *key)
+    return camera_models[key]
 
-for key, points in rightpoints.items():
-    rightpixels[key] = []
-    for point in points:
-        px = point[0] - center_width
-        py = -(point[1] - center_height)
-        rightpixels[key].append([px, py])
 
+def triangulate(left_xy, right_xy, img_width, img_height):
+    """
+    3D coordinates (..., 3) of matching left/right image points (..., 2),
+    angles come from the camera model lookup tables
+    """
+    to_rad              = np.pi/180.
+    model               = get_camera_model(img_width, img_height)
+    left_lon, left_lat  = model.lonlat(left_xy, "left")
+    right_lon, right_lat = model.lonlat(right_xy, "right")
 
-leftlonlats  = {}
-rightlonlats = {}
+    return get_principal_coordinates(
+        cam_sep,
+        left_lat * to_rad, left_lon * to_rad,
+        right_lat * to_rad, right_lon * to_rad
+    )
+
+
+def measure_pair(left_cam, right_cam):
+    """
+    Measure every label of a labelme pair in one vectorised pass.
+
+    Returns (labels, sizes_cm, coords, mismatched) where coords is an
+    (N, 2, 3) array of endpoint coordinates in meters.
+    """
+    labels, left_xy, right_xy, mismatched = pair_points(left_cam, right_cam)
+
+    coords  = triangulate(left_xy, right_xy, left_cam['imageWidth'], left_cam['imageHeight'])
+    sizes   = np.round(get_distance_3d(coords[:, 0], coords[:, 1]) * 100, 3)
+    return labels, sizes, coords, mismatched
+
+
+# ---------------------------------------------------------------------
+# uncertainty
+UNCERTAINTY_COLUMNS = ["length_mean", "length_std", "length_lo", "length_hi"]
+
+
+def lonlat_from_coefs(xy, img_width, img_height, side, lon_a, lon_t, lat_a, lat_t, hdev):
+    """
+    Image coordinates (..., 2) -> (lon, lat) in degrees for the left or
+    right camera, with explicit coefficients that broadcast against the
+    point arrays (e.g. one coefficient set per sample)
+    """
+    px  = xy[..., 0] - img_width / 2
+    py  = -(xy[..., 1] - img_height / 2)
+
+    central = lon_a * np.arctan(lon_t * px)
+    lon     = 90 - central - hdev if side == "left" else 90 + central - hdev
+    lat     = lat_a * np.arctan(lat_t * py)
+    return lon, lat
+
+
+def measure_uncertainty(left_xy, right_xy, img_width, img_height, samples=2000,
+                        pixel_sigma=1.0, coef_sigma=0.01, hdev_sigma=0.0,
+                        interval=95.0, seed=None):
+    """
+    Monte Carlo length statistics for (N, 2, 2) endpoint arrays.
+
+    Every sample jitters all endpoints by `pixel_sigma` pixels and draws
+    one set of lon/lat coefficients (relative sigma `coef_sigma`) and hdev
+    (`hdev_sigma` degrees), shared by all points of that sample as the
+    calibration error is systematic. All samples are propagated as one
+    (samples, N, 2) array pass.
+
+    Returns an (N, 4) array of mean, std and the lower/upper bounds of the
+    central `interval` percent, in cm.
+    """
+    rng     = np.random.default_rng(seed)
+    n       = len(left_xy)
+    if n == 0:
+        return np.empty((0, 4))
+
+    jitter  = lambda xy: xy[None] + rng.normal(0., pixel_sigma, (samples,) + xy.shape)
+    coef    = lambda key: (config[key] * (1 + rng.normal(0., coef_sigma, samples)))[:, None, None]
+
+    lon_a, lon_t    = coef("lon_coef_a"), coef("lon_coef_t")
+    lat_a, lat_t    = coef("lat_coef_a"), coef("lat_coef_t")
+    hdev            = (cam_hdev + rng.normal(0., hdev_sigma, samples))[:, None, None]
+    to_rad          = np.pi/180.
+
+    left_lon, left_lat      = lonlat_from_coefs(jitter(left_xy), img_width, img_height, "left",
+                                                lon_a, lon_t, lat_a, lat_t, hdev)
+    right_lon, right_lat    = lonlat_from_coefs(jitter(right_xy), img_width, img_height, "right",
+                                                lon_a, lon_t, lat_a, lat_t, hdev)
+
+    coords  = get_principal_coordinates(
+        cam_sep,
+        left_lat * to_rad, left_lon * to_rad,
+        right_lat * to_rad, right_lon * to_rad
+    )                                                       # (samples, N, 2, 3)
+    lengths = get_distance_3d(coords[..., 0, :], coords[..., 1, :]) * 100
+
+    # samples where the rays stop converging are dropped, not averaged
+    lengths = np.where(np.isfinite(lengths), lengths, np.nan)
+    tail    = (100. - interval) / 2
+    with np.errstate(all="ignore"):
+        lo, hi  = np.nanpercentile(lengths, [tail, 100. - tail], axis=0)
+        stats   = np.stack([np.nanmean(lengths, 0), np.nanstd(lengths, 0), lo, hi], axis=-1)
+    return np.round(stats, 3)
+
+
+def uncertainty_settings():
+    """measure_mc_* settings from the config, samples=0 disables the mode"""
+    return {
+        "samples"       : int(config.get("measure_mc_samples", 2000)),
+        "pixel_sigma"   : float(config.get("measure_mc_pixel_sigma", 1.0)),
+        "coef_sigma"    : float(config.get("measure_mc_coef_sigma", 0.01)),
+        "hdev_sigma"    : float(config.get("measure_mc_hdev_sigma", 0.0)),
+        "interval"      : float(config.get("measure_mc_interval", 95.0)),
+    }
+
+
+def measure_pair_uncertainty(left_cam, right_cam, settings=None):
+    """(labels, (N, 4) stats) for a labelme pair, see measure_uncertainty"""
+    settings                    = settings or uncertainty_settings()
+    labels, left_xy, right_xy, _ = pair_points(left_cam, right_cam)
+    stats = measure_uncertainty(
+        left_xy, right_xy, left_cam['imageWidth'], left_cam['imageHeight'], **settings
+    )
+    return labels, stats
+
+
+# ---------------------------------------------------------------------
+def measure_pair_scalar(left_cam, right_cam):
+    """
+    Reference implementation, one point at a time with scalar math, as the
+    measurement was originally written. tests/test_measure.py checks
+    measure_pair against it.
+    """
+    def longitude(px):
+        return config["lon_coef_a"] * math.atan(config["lon_coef_t"] * px)
+
+    def latitude(py):
+        return config["lat_coef_a"] * math.atan(config["lat_coef_t"] * py)
+
+    def angular(lat1, lon1, lat2, lon2):
+        cos_delta = (math.sin(lat1) * math.sin(lat2) +
+                     math.cos(lat1) * math.cos(lat2) * math.cos(lon2 - lon1))
+        return math.acos(max(min(cos_delta, 1.0), -1.0))
+
+    def principal(left_lat, left_lon, right_lat, right_lon):
+        cab = angular(left_lat, left_lon, 0, 0)
+        cba = angular(right_lat, right_lon, 0, 0)
+        hc  = cam_sep * math.sin(cab) * math.sin(cba) / math.sin(cab + cba)
+        ac  = hc / math.sin(cab)
+        aq  = ac * math.cos(left_lat)
+        return [hc / math.tan(cab), aq * math.sin(left_lon), ac * math.sin(left_lat)]
+
+    center_width    = left_cam['imageWidth']/2
+    center_height   = left_cam['imageHeight']/2
+    to_rad          = math.pi/180.
+    leftpoints      = label_points(left_cam)
+    rightpoints     = label_points(right_cam)
+
+    distances = {}
+    for key in leftpoints:
+        if key not in rightpoints:
+            continue
+        coords = []
+        for i in [0, 1]:
+            lx, ly      = leftpoints[key][i]
+            rx, ry      = rightpoints[key][i]
+            left_lon    = 90 - longitude(lx - center_width) - cam_hdev
+            left_lat    = latitude(-(ly - center_height))
+            right_lon   = 90 + longitude(rx - center_width) - cam_hdev
+            right_lat   = latitude(-(ry - center_height))
+            coords.append(principal(left_lat * to_rad, left_lon * to_rad,
+                                    right_lat * to_rad, right_lon * to_rad))
+
+        a, b            = coords
+        distances[key]  = round(math.sqrt(sum((q - p)**2 for p, q in zip(a, b))) * 100, 3)
+
+    return distances
 
-for key, points in leftpixels.items():
-    leftlonlats[key] = []
-    
-    for point in points:
-        px = point[0]
-        py = point[1]
-        lon  = 90 - central_longitude_from_px(px) - 7
-        lat  = central_latitude_from_py(py)
-        leftlonlats[key].append([lon, lat])
-
-
-for key, points in rightpixels.items():
-    rightlonlats[key] = []
-    for point in  points:
-        px = point[0]
-        py = point[1]
-        lon  = 90 + central_longitude_from_px(px) - 7
-        lat  = central_latitude_from_py(py)
-        rightlonlats[key].append([lon, lat])
-        
-
-
-# Radian coef
-to_rad      = np.pi/180.
-distances   = {}
-
-for key in leftlonlats:
-    lefts       = leftlonlats[key]
-    rights      = rightlonlats[key]
-    coords      = []
-    for i in [0, 1]:
-        leftlonlat  = lefts[i]
-        rightlonlat = rights[i]
-        left_lon    = leftlonlat[0] * to_rad
-        left_lat    = leftlonlat[1] * to_rad
-        right_lon   = rightlonlat[0] * to_rad
-        right_lat   = rightlonlat[1] * to_rad
-        coord       = get_principal_coordinates(cam_sep, left_lat, left_lon, right_lat, right_lon)
-        coords.append(coord)
-    
-    distance = np.round(get_distance_3d(coords[0], coords[1]) * 100, 3)
-    distances[key] = distance
-    
 
-# ---------------------------------------------------------------
-df = pd.DataFrame([distances]).transpose()
-df.columns = ['size']
-df.to_csv(config['output_file'])
\ No newline at end of file
+# ---------------------------------------------------------------------
+# batch mode
+SIDE_TOKENS = re.compile(r'(^|[-_. ])(left|right|lcam|rcam|l|r)(?=$|[-_. ])', re.IGNORECASE)
+CLOCK_STAMP = re.compile(r'(\d+)h(\d+)m(\d+(?:\.\d+)?)s')
+NUMBER      = re.compile(r'\d+(?:\.\d+)?')
+
+BATCH_COLUMNS = [
+    "pair_id", "left_file", "right_file", "label", "length_cm",
+    "x1", "y1", "z1", "x2", "y2", "z2"
+] + UNCERTAINTY_COLUMNS
+
+
+def pair_key(path):
+    """File stem with left/right markers removed: left-cap.json -> cap"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    stem = SIDE_TOKENS.sub(r'\1', stem)
+    return re.sub(r'[-_. ]{2,}', '_', stem).strip('-_. ').lower()
+
+
+def name_timestamp(path):
+    """
+    Timestamp in seconds from a filename, trying the fragment.py format
+    (00h02m00.333s), then YYYYMMDD_HHMMSS, then the last number
+    """
+    name    = os.path.basename(path)
+    match   = CLOCK_STAMP.search(name)
+    if match:
+        h, m, sec = match.groups()
+        return int(h) * 3600 + int(m) * 60 + float(sec)
+
+    stamp   = date_stamp(name)
+    if stamp is not None:
+        return stamp
+
+    numbers = NUMBER.findall(name)
+    return float(numbers[-1]) if numbers else None
+
+
+def discover_pairs(left_dir, right_dir, match="name", tolerance=1.0):
+    """
+    Match labelme JSON files of two directories.
+
+    match="name" pairs files whose names agree once left/right markers are
+    removed; match="timestamp" pairs each left file with the nearest right
+    timestamp within `tolerance` seconds. Returns (pairs, unmatched) where
+    pairs is a list of (pair_id, left_path, right_path).
+    """
+    list_json   = lambda d: sorted(os.path.join(d, f) for f in os.listdir(d) if f.lower().endswith(".json"))
+    lefts       = list_json(left_dir)
+    rights      = list_json(right_dir)
+    pairs       = []
+
+    if match == "timestamp":
+        stamped     = sorted((name_timestamp(p), p) for p in rights if name_timestamp(p) is not None)
+        stamps      = np.array([t for t, _ in stamped])
+        used        = set()
+        for left in lefts:
+            t = name_timestamp(left)
+            if t is None or len(stamps) == 0:
+                continue
+            i = int(np.argmin(np.abs(stamps - t)))
+            if abs(stamps[i] - t) <= tolerance and i not in used:
+                used.add(i)
+                pairs.append((f"{t:.3f}", left, stamped[i][1]))
+    else:
+        right_keys  = {pair_key(p): p for p in rights}
+        for left in lefts:
+            key = pair_key(left)
+            if key in right_keys:
+                pairs.append((key, left, right_keys[key]))
+
+    paired      = {p for _, l, r in pairs for p in (l, r)}
+    unmatched   = [p for p in lefts + rights if p not in paired]
+    return pairs, unmatched
+
+
+def measure_files(pair_id, left_path, right_path):
+    """Worker: measure one pair of labelme files, return (rows, mismatched labels)"""
+    left_cam    = load_labelme(left_path)
+    right_cam   = load_labelme(right_path)
+
+    if (left_cam['imageWidth'], left_cam['imageHeight']) != (right_cam['imageWidth'], right_cam['imageHeight']):
+        raise ValueError("left and right images differ in size")
+
+    labels, sizes, coords, mismatched = measure_pair(left_cam, right_cam)
+
+    settings    = uncertainty_settings()
+    if settings["samples"] > 0:
+        _, stats = measure_pair_uncertainty(left_cam, right_cam, settings)
+    else:
+        stats    = np.full((len(labels), len(UNCERTAINTY_COLUMNS)), np.nan)
+
+    rows = []
+    for label, size, (a, b), stat in zip(labels, sizes, coords, stats):
+        rows.append([pair_id, left_path, right_path, label, float(size), *a.tolist(), *b.tolist(), *stat.tolist()])
+    return rows, mismatched
+
+
+class RowSink:
+    """Append rows to a CSV or Parquet file as they arrive"""
+
+    def __init__(self, path, columns):
+        self.path       = path
+        self.columns    = columns
+        self.parquet    = path.lower().endswith(".parquet")
+        self.writer     = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            self.pa     = pa
+            self.schema = pa.schema(
+                [(c, pa.string()) for c in columns[:4]] + [(c, pa.float64()) for c in columns[4:]]
+            )
+            self.writer = pq.ParquetWriter(path, self.schema)
+        else:
+            self.file   = open(path, "w", newline="")
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(columns)
+
+    def write(self, rows):
+        if not rows:
+            return
+        if self.parquet:
+            columns = list(zip(*rows))
+            self.writer.write_table(self.pa.table(
+                {c: list(v) for c, v in zip(self.columns, columns)}, schema=self.schema
+            ))
+        else:
+            self.writer.writerows(rows)
+            self.file.flush()
+
+    def close(self):
+        if self.parquet:
+            self.writer.close()
+        else:
+            self.file.close()
+
+
+def measure_batch(left_dir, right_dir, output_path, match="name", tolerance=1.0, workers=0):
+    """
+    Measure every matched pair of two annotation directories on a process
+    pool and stream the rows into one CSV/Parquet file.
+
+    Files that fail to load or measure, and labels not marked in both
+    views, are collected into <output>.errors.csv instead of stopping the
+    batch. Returns (row_count, problems).
+    """
+    pairs, unmatched    = discover_pairs(left_dir, right_dir, match, tolerance)
+    problems            = [("", path, "", "unmatched file") for path in unmatched]
+    sink                = RowSink(output_path, BATCH_COLUMNS)
+    count               = 0
+
+    print(f"<< measuring {len(pairs)} pair(s), {len(unmatched)} unmatched file(s) >>")
+    try:
+        with ProcessPoolExecutor(max_workers=workers or None) as pool:
+            futures = {pool.submit(measure_files, *pair): pair for pair in pairs}
+            for future in as_completed(futures):
+                pair_id, left_path, right_path = futures[future]
+                try:
+                    rows, mismatched = future.result()
+                except Exception as e:
+                    problems.append((pair_id, left_path, right_path, f"failed: {e}"))
+                    continue
+
+                for label in mismatched:
+                    problems.append((pair_id, left_path, right_path, f"mismatched label: {label}"))
+                sink.write(rows)
+                count += len(rows)
+    finally:
+        sink.close()
+
+    if problems:
+        error_path = os.path.splitext(output_path)[0] + ".errors.csv"
+        with open(error_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["pair_id", "left_file", "right_file", "problem"])
+            writer.writerows(problems)
+        print(f"<< {len(problems)} problem(s) reported in {error_path} >>")
+
+    return count, problems
+
+
+if __name__ == "__main__":
+    # ---------------------------------------------------------------------
+    if config.get("measure_batch_left_dir"):
+        count, problems = measure_batch(
+            config["measure_batch_left_dir"],
+            config["measure_batch_right_dir"],
+            config.get("measure_batch_output", "./report/measure-batch.csv"),
+            match       = config.get("measure_batch_match", "name"),
+            tolerance   = config.get("measure_batch_tolerance", 1.0),
+            workers     = config.get("measure_workers", 0)
+        )
+        print(f"<< batch done: {count} measurement(s), {len(problems)} problem(s) >>")
+        sys.exit()
+
+    left_cam    = load_labelme(left_json_path)
+    right_cam   = load_labelme(right_json_path)
+
+    labels, sizes, coords, mismatched = measure_pair(left_cam, right_cam)
+    for label in mismatched:
+        print(f"<< skipped label {label}: not marked with two points in both views >>")
+
+    # ---------------------------------------------------------------
+    df = pd.DataFrame({'size': sizes}, index=labels)
+
+    settings = uncertainty_settings()
+    if settings["samples"] > 0:
+        _, stats = measure_pair_uncertainty(left_cam, right_cam, settings)
+        for column, values in zip(UNCERTAINTY_COLUMNS, stats.T):
+            df[column] = values
+
+    df.to_csv(config['output_file'])
@@ -5,12 +5,14 @@ play video using ffmpeg ffplay
 
 import subprocess
 import os
+import re
 import time
 import threading
 import sys
-import cv2
-import numpy as np
-from datetime import datetime
+from fragment import frame_filename
+
+# ffplay status line: "  12.34 A-V: -0.001 fd=   0 aq= ..." the first value is the playback clock
+STATUS_LINE = re.compile(rb'^\s*(-?\d+\.\d+)\s+(?:A-V|M-V|M-A)')
 
 class VideoPlayer:
     def __init__(self):
@@ -19,16 +21,15 @@ class VideoPlayer:
         self.start_time = 0
         self.duration = 0
         self.video_path = None
-        self.capture = None
-        self.current_frame = None
-        self.frame_lock = threading.Lock()
+        self.position = None
+        self.position_lock = threading.Lock()
 
     def print_controls(self):
         """Print playback control instructions"""
         print("\nPlayback Controls:")
         print("------------------")
         print("Space or p: Toggle pause")
-        print("c: Capture current frame")
+        print("g: Capture current frame")
         print("q or ESC: Quit")
         print("f: Toggle fullscreen")
         print("m: Toggle mute")
@@ -43,41 +44,58 @@ class VideoPlayer:
         return h * 3600 + m * 60 + s
 
     def capture_frame(self):
-        """Capture the current frame and save it"""
-        with self.frame_lock:
-            if self.current_frame is not None:
-                # Create screenshots directory if it doesn't exist
-                if not os.path.exists('screenshots'):
-                    os.makedirs('screenshots')
-                
-                # Generate filename with timestamp
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"screenshots/frame_{timestamp}.png"
-                
-                # Save the frame
-                cv2.imwrite(filename, self.current_frame)
-                print(f"\nFrame captured: {filename}")
+        """Decode the frame ffplay is showing and save it with its timestamp"""
+        with self.position_lock:
+            position = self.position
 
+        if position is None:
+            print("\nPlayback position not known yet, try again")
+            return
 
-    def frame_grabber(self):
-        """Continuously grab frames from the video"""
-        self.capture = cv2.VideoCapture(self.video_path)
-        
-        # Seek to start time
-        self.capture.set(cv2.CAP_PROP_POS_MSEC, self.start_time * 1000)
-        
-        while self.is_playing:
-            ret, frame = self.capture.read()
-            if ret:
-                with self.frame_lock:
-                    self.current_frame = frame
-            else:
+        # Create screenshots directory if it doesn't exist
+        if not os.path.exists('screenshots'):
+            os.makedirs('screenshots')
+
+        filename = os.path.join('screenshots', frame_filename(self.video_path, position, "png"))
+
+        # input-side seek: jump to the keyframe before, then decode forward to the exact frame
+        command = [
+            'ffmpeg',
+            '-nostdin',
+            '-loglevel', 'error',
+            '-ss', f'{position:.3f}',
+            '-i', self.video_path,
+            '-frames:v', '1',
+            filename,
+            '-y'
+        ]
+
+        try:
+            subprocess.run(command, check=True, capture_output=True)
+            print(f"\nFrame captured: {filename}")
+        except subprocess.CalledProcessError as e:
+            print(f"\nCapture failed: {e.stderr.decode(errors='replace').strip()}")
+
+
+    def status_reader(self):
+        """Follow ffplay's status line on stderr to track the playback clock"""
+        pending = b""
+        stream  = self.process.stderr
+
+        while True:
+            chunk = stream.read1(4096)
+            if not chunk:
                 break
-            
-            # Control frame rate
-            time.sleep(1/30)  # Limit to approximately 30 FPS
-        
-        self.capture.release()
+
+            pending += chunk
+            *lines, pending = re.split(rb'[\r\n]', pending)
+            for line in lines:
+                match = STATUS_LINE.match(line)
+                if match:
+                    with self.position_lock:
+                        self.position = float(match.group(1))
+                elif line.strip():
+                    sys.stderr.write(line.decode(errors='replace') + "\n")
 
 
     def progress_indicator(self):
@@ -109,6 +127,8 @@ class VideoPlayer:
 
             command = [
                 'ffplay',
+                '-hide_banner',
+                '-stats',
                 '-i', video_path,
                 '-ss', start_time,
                 '-t', str(self.duration),
@@ -120,11 +140,7 @@ class VideoPlayer:
             
             print(f"Playing video from {start_time} to {end_time}")
             
-            # Start the frame grabber in a separate thread
             self.is_playing = True
-            frame_thread = threading.Thread(target=self.frame_grabber)
-            frame_thread.daemon = True
-            frame_thread.start()
 
             # # Start the progress indicator in a separate thread
             # progress_thread = threading.Thread(target=self.progress_indicator)
@@ -136,13 +152,16 @@ class VideoPlayer:
             keyboard_thread.daemon = True
             keyboard_thread.start()
 
-            # Start the video playback
-            self.process = subprocess.Popen(command)
+            # Start the video playback, its status output tells us the current position
+            self.process = subprocess.Popen(command, stderr=subprocess.PIPE)
+            status_thread = threading.Thread(target=self.status_reader)
+            status_thread.daemon = True
+            status_thread.start()
             self.process.wait()
 
             # Clean up
             self.is_playing = False
-            frame_thread.join()
+            status_thread.join()
             # progress_thread.join()
             keyboard_thread.join()
             
@@ -153,8 +172,6 @@ class VideoPlayer:
         finally:
             if self.process:
                 self.process.terminate()
-            if self.capture:
-                self.capture.release()
 
     def keyboard_listener(self):
         """Listen for keyboard input to capture frames"""
@@ -0,0 +1,190 @@
+"""
+provenance of trimmed clips
+
+trim.py leaves <clip>.provenance.json next to every output: the source
+path and fingerprint, and the source frame the clip actually starts at.
+That frame is found by matching the clip's first frames against the
+source, so the keyframe snap of a stream copy is measured, not guessed.
+
+scanf uses it to take detections of the overlapping frames from the
+source's report instead of inferring them again, provided both scans
+used the same model and settings (<video>.meta.json in the report).
+"""
+
+import hashlib
+import json
+import time
+import os
+import numpy as np
+from frames import iter_frames, probe_video
+
+
+CHUNK = 1 << 20
+
+# frames are shrunk to this size inside the decoder when matching a clip to its source
+MATCH_SIZE = [160, 90]
+
+# scan settings that must match for detections to be reused
+META_KEYS = ["model", "model_mtime", "conf", "iou", "imgsz", "roi"]
+
+
+# ---------------------------------------------------------------------------
+def file_fingerprint(path):
+    """sha1 of the size and the first and last MiB, cheap even for huge files"""
+    size    = os.path.getsize(path)
+    digest  = hashlib.sha1(str(size).encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(CHUNK))
+        if size > CHUNK:
+            f.seek(max(size - CHUNK, CHUNK))
+            digest.update(f.read(CHUNK))
+    return digest.hexdigest()
+
+
+def sidecar_path(video_path):
+    return video_path + ".provenance.json"
+
+
+def _small_gray(frames, count=None):
+    """Stack of gray frames as float32, the frames already come at MATCH_SIZE"""
+    out = []
+    for _, _, frame in frames:
+        out.append(frame.mean(axis=-1, dtype=np.float32))
+        if count and len(out) == count:
+            break
+    return np.stack(out) if out else np.empty((0, 0, 0), dtype=np.float32)
+
+
+def locate_offset(source_path, clip_path, expected_start, search=4.0, probe_frames=8):
+    """
+    Source frame index the clip's first frame was taken from.
+
+    The first `probe_frames` clip frames are compared with every run of
+    source frames starting within `search` seconds of `expected_start`.
+    Returns (frame_offset, mean absolute error in gray levels).
+    """
+    info    = probe_video(source_path)
+    fps     = info["fps"]
+    clip    = _small_gray(iter_frames(clip_path, frames=range(probe_frames), scale=MATCH_SIZE), probe_frames)
+
+    first   = max(int((expected_start - search) * fps), 0)
+    last    = min(int((expected_start + search) * fps) + len(clip), info["frame_count"])
+    source  = _small_gray(iter_frames(source_path, frames=range(first, last), scale=MATCH_SIZE, info=info))
+
+    n       = len(source) - len(clip) + 1
+    if n <= 0:
+        raise ValueError(f"clip {clip_path} not found near {expected_start}s of {source_path}")
+
+    errors  = np.array([np.abs(source[c:c + len(clip)] - clip).mean() for c in range(n)])
+    best    = int(np.argmin(errors))
+    return first + best, float(errors[best])
+
+
+def write_provenance(source_path, clip_path, start, end, mode, crop=None, scale=None, denoise=0, max_error=8.0):
+    """
+    Measure where the clip starts in the source and write the sidecar.
+    Returns the provenance dict.
+    """
+    info                = probe_video(source_path)
+    frame_offset, error = locate_offset(source_path, clip_path, start)
+    offset              = frame_offset / info["fps"]
+
+    provenance = {
+        "source"                : os.path.abspath(source_path),
+        "source_fingerprint"    : file_fingerprint(source_path),
+        "clip_fingerprint"      : file_fingerprint(clip_path),
+        "mode"                  : mode,
+        "requested_start"       : start,
+        "requested_end"         : end,
+        "source_fps"            : info["fps"],
+        "frame_offset"          : frame_offset,
+        "offset_seconds"        : round(offset, 6),
+        "keyframe_snap"         : round(offset - start, 6),
+        "match_error"           : round(error, 4),
+        "verified"              : error <= max_error,
+        # detections only carry over when the clip shows the same pixels geometry
+        "same_geometry"         : not crop and not scale,
+        "crop"                  : crop,
+        "scale"                 : scale,
+        "denoise"               : denoise,
+        "created_at"            : time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+    with open(sidecar_path(clip_path), "w") as f:
+        json.dump(provenance, f, indent=4)
+    return provenance
+
+
+def load_provenance(video_path):
+    """The clip's sidecar, or None when it has none or the clip changed since"""
+    path = sidecar_path(video_path)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "r") as f:
+        provenance = json.load(f)
+
+    if provenance.get("clip_fingerprint") != file_fingerprint(video_path):
+        print(f"<< {path} does not describe the current clip, ignored >>")
+        return None
+    return provenance
+
+
+# ---------------------------------------------------------------------------
+def scan_meta(video_path, model_path, conf, iou, imgsz, interval, roi=None):
+    """Settings of one scan, written next to its report"""
+    return {
+        "video"         : os.path.abspath(video_path),
+        "fingerprint"   : file_fingerprint(video_path),
+        "model"         : os.path.abspath(model_path),
+        "model_mtime"   : os.stat(model_path).st_mtime_ns if os.path.exists(model_path) else None,
+        "conf"          : conf,
+        "iou"           : iou,
+        "imgsz"         : imgsz,
+        "interval"      : interval,
+        "roi"           : None if roi is None else roi.polygon.tolist(),
+    }
+
+
+def write_scan_meta(json_path, meta):
+    with open(os.path.splitext(json_path)[0] + ".meta.json", "w") as f:
+        json.dump(meta, f, indent=4)
+
+
+def source_records(provenance, meta, report_dir="./report"):
+    """
+    Detections of the clip's source that can stand in for the clip's own,
+    as (frame_offset, source_interval, {source frame index: record}), or
+    None with the reason printed
+    """
+    if not provenance.get("verified") or not provenance.get("same_geometry") or provenance.get("denoise"):
+        print("<< clip differs from its source (unverified offset, crop, scale or denoise), no reuse >>")
+        return None
+
+    name        = os.path.splitext(os.path.basename(provenance["source"]))[0]
+    json_path   = os.path.join(report_dir, name, name + ".json")
+    meta_path   = os.path.join(report_dir, name, name + ".meta.json")
+    if not (os.path.exists(json_path) and os.path.exists(meta_path)):
+        print(f"<< no scan of source {name} to reuse >>")
+        return None
+
+    with open(meta_path, "r") as f:
+        source_meta = json.load(f)
+
+    if source_meta.get("fingerprint") != provenance["source_fingerprint"]:
+        print(f"<< scan of {name} was made on a different file, no reuse >>")
+        return None
+
+    changed = [k for k in META_KEYS if source_meta.get(k) != meta.get(k)]
+    if changed:
+        print(f"<< scan of {name} used other settings ({', '.join(changed)}), no reuse >>")
+        return None
+
+    with open(json_path, "r") as f:
+        ds = json.load(f)
+
+    # reports from before frame_index was recorded fall back to the rounded timestamps
+    fps     = provenance["source_fps"]
+    records = {int(item["frame_index"]) if "frame_index" in item else int(round(item["timestamp"] * fps)): item
+               for item in ds}
+    return provenance["frame_offset"], int(source_meta["interval"]), records
@@ -0,0 +1,228 @@
+"""
+raw candidate detections and offline re-thresholding
+
+with a raw floor set, scanf infers once at a low confidence and keeps
+every candidate box in <video>.raw.npz next to the report. Any other
+conf / iou can then be applied afterwards with a vectorised per-class
+NMS, and the JSON, CSV, plots, statistics and database rows regenerated
+without touching the video
+
+    python script/rawdet.py <video name> [conf] [iou]
+"""
+
+import yaml
+import json
+import sys
+import os
+import numpy as np
+
+try:
+    import torch
+    from torchvision.ops import nms as torch_nms
+except ImportError:
+    torch_nms = None
+
+
+# ---------------------------------------------------------------------------
+def xywh_to_xyxy(xywh):
+    xyxy        = np.empty_like(xywh, dtype=np.float64)
+    xyxy[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+    xyxy[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+    return xyxy
+
+
+def nms(xyxy, scores, iou, classes=None):
+    """
+    Greedy non-maximum suppression, indices of the kept boxes by
+    decreasing score. Boxes of different classes never suppress each
+    other (they are shifted apart). torchvision's NMS is used when it is
+    installed (ultralytics depends on it). Otherwise the numpy pass only
+    loops over kept boxes, each one suppressing all its overlaps at once.
+    """
+    n = len(scores)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+
+    boxes   = np.asarray(xyxy, dtype=np.float64)
+    scores  = np.asarray(scores, dtype=np.float64)
+    if classes is not None:
+        boxes = boxes + (np.asarray(classes, dtype=np.float64) * (boxes.max() + 1))[:, None]
+
+    if torch_nms is not None:
+        return torch_nms(torch.from_numpy(boxes), torch.from_numpy(scores), float(iou)).numpy()
+
+    order   = np.argsort(-scores, kind="stable")
+    boxes   = boxes[order]
+    area    = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+    keep    = []
+    rest    = np.arange(n)
+    while len(rest):
+        i, rest = rest[0], rest[1:]
+        keep.append(i)
+
+        lt      = np.maximum(boxes[i, :2], boxes[rest, :2])
+        rb      = np.minimum(boxes[i, 2:], boxes[rest, 2:])
+        inter   = np.prod(np.clip(rb - lt, 0, None), axis=-1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            overlap = inter / (area[i] + area[rest] - inter)
+        rest    = rest[~(overlap > iou)]
+
+    return order[keep]
+
+
+def select(xywh, conf, cls, conf_thres, iou_thres):
+    """Indices of the boxes a scan at conf_thres / iou_thres would report"""
+    above = np.flatnonzero(np.asarray(conf) >= conf_thres)
+    if len(above) < 2:
+        return above
+    xywh = np.asarray(xywh).reshape(-1, 4)
+    return np.sort(above[nms(xywh_to_xyxy(xywh[above]), np.asarray(conf)[above], iou_thres, np.asarray(cls)[above])])
+
+
+# ---------------------------------------------------------------------------
+class RawStore:
+    """Collects candidates per sampled frame, saved in CSR layout"""
+
+    def __init__(self):
+        self.timestamps = []
+        self.frames     = []
+        self.sizes      = []
+        self.conf       = []
+        self.cls        = []
+        self.xywh       = []
+        self.species    = None
+
+    def append(self, boxd, raw):
+        self.timestamps.append(boxd["timestamp"])
+        self.frames.append(boxd.get("frame_index", -1))
+        self.sizes.append((boxd["frame_width"], boxd["frame_height"]))
+        self.conf.append(np.asarray(raw["conf"], dtype=np.float32))
+        self.cls.append(np.asarray(raw["cls"], dtype=np.float32))
+        self.xywh.append(np.asarray(raw["xywh"], dtype=np.float32).reshape(-1, 4))
+        self.species = boxd.get("species")
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def save(self, path, floor, iou):
+        order   = np.argsort(self.timestamps, kind="stable")
+        counts  = np.array([len(self.conf[i]) for i in order], dtype=np.int64)
+        offsets = np.zeros(len(order) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        tmp_path = path + f".{os.getpid()}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            timestamps  = np.array(self.timestamps, dtype=np.float64)[order],
+            frames      = np.array(self.frames, dtype=np.int64)[order],
+            sizes       = np.array(self.sizes, dtype=np.int64).reshape(-1, 2)[order],
+            offsets     = offsets,
+            conf        = np.concatenate([self.conf[i] for i in order]) if len(order) else np.empty(0, np.float32),
+            cls         = np.concatenate([self.cls[i] for i in order]) if len(order) else np.empty(0, np.float32),
+            xywh        = np.concatenate([self.xywh[i] for i in order]) if len(order) else np.empty((0, 4), np.float32),
+            floor       = np.float64(floor),
+            iou         = np.float64(iou),
+            species     = str(self.species or ""),
+        )
+        os.replace(tmp_path, path)
+
+
+def raw_path(json_path):
+    return os.path.splitext(json_path)[0] + ".raw.npz"
+
+
+def rethreshold(raw, conf_thres, iou_thres):
+    """Scan records (the scanf JSON schema) for other thresholds"""
+    if conf_thres < float(raw["floor"]):
+        print(f"<< conf {conf_thres} is below the stored floor {float(raw['floor'])}, boxes under it are missing >>")
+
+    offsets = raw["offsets"]
+    species = str(raw["species"])
+    above   = raw["conf"] >= conf_thres
+
+    records = []
+    for n, timestamp in enumerate(raw["timestamps"]):
+        a, b    = offsets[n], offsets[n + 1]
+        idx     = np.flatnonzero(above[a:b]) + a
+        if len(idx) > 1:
+            idx = np.sort(idx[nms(xywh_to_xyxy(raw["xywh"][idx]), raw["conf"][idx], iou_thres, raw["cls"][idx])])
+
+        record = {
+            "timestamp"     : float(timestamp),
+            "species"       : species,
+            "count"         : len(idx),
+            "frame_height"  : int(raw["sizes"][n, 1]),
+            "frame_width"   : int(raw["sizes"][n, 0]),
+            "cls"           : raw["cls"][idx].tolist(),
+            "conf"          : raw["conf"][idx].tolist(),
+            "xywh"          : raw["xywh"][idx].tolist()
+        }
+        if "frames" in raw and raw["frames"][n] >= 0:
+            record["frame_index"] = int(raw["frames"][n])
+        records.append(record)
+
+    return records
+
+
+
+if __name__ == "__main__":
+    # ---------------------------------------------------------------------------
+    import report
+    import detdb
+    from stats import ScanStats
+
+    config              = None
+    config_file_path    = "config.yaml"
+    with open(config_file_path, 'r') as f:
+        config = yaml.safe_load(f)  # Use safe_load for security
+
+    if not config:
+        print(f">> Error: Configuration file not found at {config_file_path} <<")
+        sys.exit()
+
+    if len(sys.argv) < 2:
+        print(">> Error: usage: rawdet.py <video name> [conf] [iou] <<")
+        sys.exit()
+
+    video_name  = sys.argv[1]
+    conf_thres  = float(sys.argv[2]) if len(sys.argv) > 2 else config.get("scanf_conf_thres")
+    iou_thres   = float(sys.argv[3]) if len(sys.argv) > 3 else config.get("scanf_iou_thres")
+
+    result_path = os.path.join(config.get("report_dir", "./report"), video_name)
+    json_path   = os.path.abspath(os.path.join(result_path, video_name + ".json"))
+    if not os.path.exists(raw_path(json_path)):
+        print(f">> Error: no raw detections at {raw_path(json_path)}, scan with a raw floor first <<")
+        sys.exit()
+
+    with np.load(raw_path(json_path)) as data:
+        raw = dict(data)
+
+    records = rethreshold(raw, conf_thres, iou_thres)
+    with open(json_path, 'w') as file:
+        json.dump(records, file, indent=4)
+
+    # the report now describes other thresholds
+    meta        = {}
+    meta_path   = os.path.splitext(json_path)[0] + ".meta.json"
+    if os.path.exists(meta_path):
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        meta.update(conf=conf_thres, iou=iou_thres)
+        with open(meta_path, "w") as f:
+            json.dump(meta, f, indent=4)
+
+    with ScanStats(os.path.join(result_path, video_name), config.get("stats_windows", [60])) as stats:
+        for boxd in records:
+            stats.update_record(boxd)
+
+    title = 'Model count over time: ' + str(raw["species"])
+    report.write_video_report(json_path, title, int(config.get("report_max_points", 2000)), config.get("report_downsample", "minmax"))
+
+    if config.get("detdb_path"):
+        conn = detdb.connect(config["detdb_path"])
+        detdb.store_report(conn, video_name, records, video_path=meta.get("video"))
+        conn.close()
+
+    total = sum(r["count"] for r in records)
+    print(f"<< {video_name}: {total} detection(s) in {len(records)} frame(s) at conf {conf_thres}, iou {iou_thres} >>")
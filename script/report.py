@@ -0,0 +1,295 @@
+"""
+count reports for long scans
+
+per-video plots embed a downsampled count series (min/max buckets or LTTB,
+the exact peaks are always kept), the full series stays in the CSV.
+build_dashboard() gathers every video under report/ into one page and only
+regenerates videos whose detection JSON changed since the last build.
+"""
+
+import numpy as np
+import pandas as pd
+import yaml
+import json
+import sys
+import os
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+
+SUMMARY_COLUMNS = ["video", "samples", "duration", "max_count", "max_at", "mean_count", "first_detection"]
+
+
+# ---------------------------------------------------------------------------
+def minmax_downsample(x, y, max_points):
+    """
+    Indices of the min and max sample of max_points // 2 equal buckets,
+    in order. Peaks and troughs survive exactly.
+    """
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+
+    n_buckets   = max(max_points // 2, 1)
+    edges       = np.linspace(0, n, n_buckets + 1).astype(np.int64)[:-1]
+    bucket      = np.repeat(np.arange(n_buckets), np.diff(np.append(edges, n)))
+
+    # first sample of each bucket equal to the bucket extreme
+    keep = []
+    for reduce in (np.maximum, np.minimum):
+        extreme     = reduce.reduceat(y, edges)
+        hits        = np.flatnonzero(y == extreme[bucket])
+        _, first    = np.unique(bucket[hits], return_index=True)
+        keep.append(hits[first])
+
+    return np.unique(np.concatenate(keep + [[0, n - 1]]))
+
+
+def lttb_downsample(x, y, max_points):
+    """
+    Largest-Triangle-Three-Buckets: per bucket, the sample forming the
+    largest triangle with the previous pick and the next bucket's mean.
+    The global maximum is added back if LTTB skipped it.
+    """
+    n = len(y)
+    if n <= max_points or max_points < 3:
+        return np.arange(n)
+
+    x       = np.asarray(x, dtype=np.float64)
+    y       = np.asarray(y, dtype=np.float64)
+    edges   = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    keep    = np.empty(max_points, dtype=np.int64)
+    keep[0] = 0
+    a       = 0
+
+    for b in range(max_points - 2):
+        lo, hi      = edges[b], edges[b + 1]
+        nlo, nhi    = edges[b + 1], edges[b + 2] if b + 2 < len(edges) else n
+        mx, my      = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+
+        area = np.abs((x[a] - mx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (my - y[a]))
+        a    = lo + int(np.argmax(area))
+        keep[b + 1] = a
+
+    keep[-1] = n - 1
+    return np.unique(np.append(keep, np.argmax(y)))
+
+
+DOWNSAMPLERS = {
+    "minmax"    : minmax_downsample,
+    "lttb"      : lttb_downsample,
+}
+
+
+def downsample(x, y, max_points=2000, method="minmax"):
+    """(x, y) reduced to about max_points samples for display"""
+    x       = np.asarray(x)
+    y       = np.asarray(y)
+    index   = DOWNSAMPLERS[method](x, y, max_points)
+    return x[index], y[index]
+
+
+# ---------------------------------------------------------------------------
+def load_series(json_path):
+    """(timestamps, counts, conf_sums) of a scanf report, sorted by time"""
+    with open(json_path, "r") as f:
+        ds = json.load(f)
+
+    ds          = sorted(ds, key=lambda item: item["timestamp"])
+    timestamps  = np.array([item["timestamp"] for item in ds], dtype=np.float64)
+    counts      = np.array([item["count"] for item in ds], dtype=np.int64)
+    conf_sums   = np.array([sum(item["conf"]) for item in ds], dtype=np.float64)
+    return timestamps, counts, conf_sums
+
+
+def summarize(timestamps, counts):
+    """Headline numbers of one count series"""
+    if not len(counts):
+        return {"samples": 0, "duration": 0., "max_count": 0, "max_at": None, "mean_count": 0., "first_detection": None}
+
+    peak        = int(np.argmax(counts))
+    detected    = np.flatnonzero(counts > 0)
+    return {
+        "samples"           : int(len(counts)),
+        "duration"          : float(timestamps[-1] - timestamps[0]),
+        "max_count"         : int(counts[peak]),
+        "max_at"            : float(timestamps[peak]),
+        "mean_count"        : round(float(counts.mean()), 4),
+        "first_detection"   : float(timestamps[detected[0]]) if len(detected) else None,
+    }
+
+
+def count_figure(timestamps, counts, title, max_points=2000, method="minmax"):
+    """Count-over-time figure with a downsampled trace and the exact maximum"""
+    x, y = downsample(timestamps, counts, max_points, method)
+
+    fig = make_subplots()
+    fig.add_trace(
+        go.Scatter(
+            x=x,
+            y=y,
+            mode='lines+markers',
+            name='Fish Count',
+            line=dict(color='blue', width=2),
+            marker=dict(size=1)
+        )
+    )
+
+    if len(counts):
+        max_fish_count = int(np.max(counts))
+        fig.add_hline(
+            y=max_fish_count,
+            line_dash="dash",
+            line_color="red",
+            annotation_text=f"Max: {max_fish_count}",
+            annotation_position="top right"
+        )
+
+    fig.update_layout(
+        title=title,
+        xaxis_title='Timestamp',
+        yaxis_title='Number of Fish',
+        template='plotly_white',
+        hovermode='x unified',
+        legend=dict(x=0.01, y=0.99, orientation='h'),
+        margin=dict(l=50, r=50, t=80, b=50)
+    )
+
+    # fish count is discrete
+    fig.update_yaxes(dtick=1)
+    return fig
+
+
+def series_path(json_path):
+    return os.path.splitext(json_path)[0] + ".series.npz"
+
+
+def write_video_report(json_path, title, max_points=2000, method="minmax"):
+    """
+    Write <video>.html (downsampled plot), <video>.csv (full series) and
+    <video>.series.npz (downsampled series and summary for the dashboard)
+    next to the JSON. Returns the summary.
+    """
+    timestamps, counts, conf_sums = load_series(json_path)
+    base = os.path.splitext(json_path)[0]
+
+    fig = count_figure(timestamps, counts, title, max_points, method)
+    fig.write_html(base + ".html")
+
+    df = pd.DataFrame({
+        "timestamp"     : timestamps,
+        "fish-count"    : counts,
+        "conf-sum"      : conf_sums
+    })
+    df.to_csv(base + ".csv")
+
+    summary = summarize(timestamps, counts)
+    x, y    = downsample(timestamps, counts, max_points, method)
+
+    # written last: its mtime marks the outputs as up to date
+    tmp_path = base + f".series.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, timestamps=x, counts=y, summary=json.dumps(summary))
+    os.replace(tmp_path, series_path(json_path))
+    return summary
+
+
+# ---------------------------------------------------------------------------
+def find_reports(report_dir):
+    """{video name: json path} for every report/<name>/<name>.json"""
+    reports = {}
+    for name in sorted(os.listdir(report_dir)):
+        json_path = os.path.join(report_dir, name, name + ".json")
+        if os.path.isfile(json_path):
+            reports[name] = json_path
+    return reports
+
+
+def is_stale(json_path):
+    """True when the JSON changed after its outputs were last written"""
+    npz_path = series_path(json_path)
+    return not os.path.exists(npz_path) or os.stat(npz_path).st_mtime_ns < os.stat(json_path).st_mtime_ns
+
+
+def build_dashboard(report_dir="./report", output_path=None, species="", max_points=2000, method="minmax", force=False):
+    """
+    Regenerate the reports of changed videos, then write one HTML page
+    (summary table + every count series) and a summary CSV covering all
+    videos in `report_dir`. Returns (summary DataFrame, regenerated names).
+    """
+    output_path = output_path or os.path.join(report_dir, "dashboard.html")
+    reports     = find_reports(report_dir)
+    regenerated = []
+
+    for name, json_path in reports.items():
+        if force or is_stale(json_path):
+            print(f"<< regenerating {name} >>")
+            write_video_report(json_path, f"Model count over time: {species} ({name})", max_points, method)
+            regenerated.append(name)
+
+    # scans rewrite their npz themselves, so the dashboard compares against every npz
+    csv_path = os.path.splitext(output_path)[0] + ".csv"
+    if not regenerated and os.path.exists(output_path) and os.path.exists(csv_path):
+        built   = min(os.stat(output_path).st_mtime_ns, os.stat(csv_path).st_mtime_ns)
+        newest  = max((os.stat(series_path(p)).st_mtime_ns for p in reports.values()), default=0)
+        listed  = pd.read_csv(csv_path)["video"].astype(str).tolist()
+        if listed == list(reports) and newest <= built:
+            print("<< dashboard up to date >>")
+            return pd.read_csv(csv_path), regenerated
+
+    rows    = []
+    series  = go.Figure()
+    for name, json_path in reports.items():
+        with np.load(series_path(json_path)) as data:
+            summary = json.loads(str(data["summary"]))
+            series.add_trace(go.Scatter(x=data["timestamps"], y=data["counts"], mode="lines", name=name))
+        rows.append({"video": name, **summary})
+
+    df = pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+
+    series.update_layout(
+        title=f"Model count over time: {species}",
+        xaxis_title='Timestamp',
+        yaxis_title='Number of Fish',
+        template='plotly_white',
+        hovermode='x unified',
+        margin=dict(l=50, r=50, t=80, b=50)
+    )
+    series.update_yaxes(dtick=1)
+
+    table = go.Figure(go.Table(
+        header=dict(values=SUMMARY_COLUMNS, align="left"),
+        cells=dict(values=[df[c].tolist() for c in SUMMARY_COLUMNS], align="left")
+    ))
+    table.update_layout(title=f"{len(df)} video(s)", template='plotly_white', margin=dict(l=50, r=50, t=80, b=20))
+
+    with open(output_path, "w") as f:
+        f.write("<html><head><meta charset='utf-8'></head><body>\n")
+        f.write(table.to_html(full_html=False, include_plotlyjs=True))
+        f.write(series.to_html(full_html=False, include_plotlyjs=False))
+        f.write("</body></html>\n")
+
+    df.to_csv(csv_path, index=False)
+    print(f"<< dashboard of {len(df)} video(s) saved to {output_path} >>")
+    return df, regenerated
+
+
+
+if __name__ == "__main__":
+    # ---------------------------------------------------------------------------
+    config              = None
+    config_file_path    = "config.yaml"
+    with open(config_file_path, 'r') as f:
+        config = yaml.safe_load(f)  # Use safe_load for security
+
+    if not config:
+        print(f">> Error: Configuration file not found at {config_file_path} <<")
+        sys.exit()
+
+    build_dashboard(
+        report_dir  = config.get("report_dir", "./report"),
+        output_path = config.get("report_dashboard"),
+        species     = config.get("species", ""),
+        max_points  = int(config.get("report_max_points", 2000)),
+        method      = config.get("report_downsample", "minmax"),
+        force       = "force" in sys.argv[1:]
+    )
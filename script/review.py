@@ -0,0 +1,87 @@
+"""
+review video of a scan
+
+annotated sampled frames go into one H.264 file through FFmpegEncoder
+instead of one PNG each. The source timestamp is burned into every frame
+and also written as an .srt next to the video, so a player can show and
+seek by source time.
+"""
+
+import cv2
+import os
+from encoder import FFmpegEncoder
+
+
+def srt_time(seconds):
+    ms      = int(round(seconds * 1000))
+    h, ms   = divmod(ms, 3600 * 1000)
+    m, ms   = divmod(ms, 60 * 1000)
+    s, ms   = divmod(ms, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
+
+
+def clock(seconds):
+    """Source time as HH:MM:SS.ss"""
+    m, s    = divmod(seconds, 60)
+    h, m    = divmod(int(m), 60)
+    return f"{h:02d}:{m:02d}:{s:05.2f}"
+
+
+class ReviewWriter:
+    """
+    One review frame per sampled frame, shown for 1 / fps seconds.
+
+    Frames are resized into the encoder's own buffer and the caption is
+    drawn there, so nothing is allocated per frame.
+    """
+
+    def __init__(self, output_path, width, height, fps=4, scale=1.0, burn_in=True,
+                 codec="libx264", preset="veryfast", crf=23):
+        width           = max(2, int(width * scale) // 2 * 2)
+        height          = max(2, int(height * scale) // 2 * 2)
+        self.encoder    = FFmpegEncoder(output_path, width, height, fps, codec=codec, preset=preset, crf=crf)
+        self.fps        = fps
+        self.burn_in    = burn_in
+        self.srt_path   = os.path.splitext(output_path)[0] + ".srt"
+        self.srt        = None
+        self.count      = 0
+
+    def open(self):
+        self.encoder.open()
+        self.srt = open(self.srt_path, "w")
+        return self
+
+    def add(self, img, timestamp, frame_index, count):
+        """Append one annotated frame taken at `timestamp` seconds of the source"""
+        buf = self.encoder.frame
+        if img.shape == buf.shape:
+            buf[...] = img
+        else:
+            cv2.resize(img, (buf.shape[1], buf.shape[0]), dst=buf, interpolation=cv2.INTER_AREA)
+
+        caption = f"{clock(timestamp)}  frame {frame_index}  count {count}"
+        if self.burn_in:
+            (w, h), baseline = cv2.getTextSize(caption, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 1)
+            cv2.rectangle(buf, (0, 0), (w + 12, h + baseline + 12), (0, 0, 0), -1)
+            cv2.putText(buf, caption, (6, h + 6), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1, cv2.LINE_AA)
+
+        self.encoder.write()
+        start = self.count / self.fps
+        self.srt.write(f"{self.count + 1}\n{srt_time(start)} --> {srt_time(start + 1 / self.fps)}\n{caption}\n\n")
+        self.count += 1
+
+    def close(self):
+        if self.srt:
+            self.srt.close()
+        self.encoder.close()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            if self.srt:
+                self.srt.close()
+            self.encoder.__exit__(exc_type, exc, tb)
@@ -0,0 +1,91 @@
+"""
+regions of interest for fixed camera rigs
+
+a rectangle or polygon per video (or per rig, matched by filename
+pattern) in the config. Frames are cropped to the ROI bounding box at
+decode time, detections are mapped back to full-frame coordinates and
+those centred outside the polygon are dropped.
+
+    roi_masks:
+      "rigA_*": {rect: [x, y, w, h]}
+      "vid_3" : {polygon: [[x, y], [x, y], ...]}
+"""
+
+from fnmatch import fnmatch
+import numpy as np
+
+
+class ROI:
+    """
+    Polygon (n, 2) in full-frame pixels of a width x height video.
+    A rectangle is a four point polygon.
+    """
+
+    def __init__(self, polygon, width, height):
+        polygon     = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+        polygon     = np.clip(polygon, 0, [width, height])
+        if len(polygon) < 3:
+            raise ValueError("ROI polygon needs at least 3 points")
+
+        self.polygon    = polygon
+        self.width      = int(width)
+        self.height     = int(height)
+
+        # bounding box rounded outwards to even pixels for the decoder
+        x0, y0          = np.floor(polygon.min(axis=0) / 2).astype(int) * 2
+        x1, y1          = np.ceil(polygon.max(axis=0) / 2).astype(int) * 2
+        x1, y1          = min(x1, self.width), min(y1, self.height)
+        self.crop       = [int(x0), int(y0), int(x1 - x0), int(y1 - y0)]
+
+        # an axis aligned rectangle needs no point-in-polygon test
+        self.is_rect    = len(polygon) == 4 and len(np.unique(polygon[:, 0])) == 2 and len(np.unique(polygon[:, 1])) == 2
+
+    @classmethod
+    def from_spec(cls, spec, width, height):
+        if "rect" in spec:
+            x, y, w, h = spec["rect"]
+            return cls([[x, y], [x + w, y], [x + w, y + h], [x, y + h]], width, height)
+        if "polygon" in spec:
+            return cls(spec["polygon"], width, height)
+        raise ValueError(f"ROI needs a rect or a polygon: {spec}")
+
+    @property
+    def offset(self):
+        return np.array(self.crop[:2], dtype=np.float64)
+
+    def contains(self, xy):
+        """Boolean (n,) for points (n, 2) inside the polygon (even-odd rule)"""
+        xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+        if self.is_rect:
+            lo, hi = self.polygon.min(axis=0), self.polygon.max(axis=0)
+            return np.all((xy >= lo) & (xy <= hi), axis=1)
+
+        x, y    = xy[:, :1], xy[:, 1:]
+        a       = self.polygon
+        b       = np.roll(self.polygon, -1, axis=0)
+        crosses = (a[:, 1] > y) != (b[:, 1] > y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_at = a[:, 0] + (y - a[:, 1]) * (b[:, 0] - a[:, 0]) / (b[:, 1] - a[:, 1])
+        return (np.sum(crosses & (x < x_at), axis=1) % 2) == 1
+
+    def to_frame(self, xywh):
+        """Boxes (n, 4) from crop to full-frame pixels, and the inside mask"""
+        xywh        = np.asarray(xywh, dtype=np.float64).reshape(-1, 4).copy()
+        xywh[:, :2] += self.offset
+        return xywh, self.contains(xywh[:, :2])
+
+
+def roi_for(video_name, masks, width, height):
+    """
+    ROI of a video from the roi_masks config: an exact name match first,
+    then the first matching filename pattern. None when nothing matches.
+    """
+    if not masks:
+        return None
+
+    spec = masks.get(video_name)
+    if spec is None:
+        spec = next((s for pattern, s in masks.items() if fnmatch(video_name, pattern)), None)
+    if spec is None:
+        return None
+    return ROI.from_spec(spec, width, height)
@@ -5,15 +5,24 @@ first it will trim, then scam
 
 from ultralytics import YOLO
 import cv2
-import pandas as pd
 import yaml
 import sys
 import os
 import re
 import json
 from tqdm import tqdm
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+from frames import iter_frames, probe_video, batched
+from shmring import run_pipeline
+import report
+from stats import ScanStats, in_order
+import detdb
+from roi import roi_for
+import provenance
+import rawdet
+from jobqueue import JobQueue, config_hash, format_eta
+import traceback
+import torch
+import time
 
 
 
@@ -56,6 +65,31 @@ font_scale      = 0.5
 padding         = 3
 thickness       = 1
 
+# per-host settings from `python script/tune.py` override the config,
+# tune is only imported when a profile or a trial (VIXEL_TUNE) can apply
+profile         = {}
+if config.get("bulk_use_profile", True) or os.environ.get("VIXEL_TUNE"):
+    import tune
+    profile     = tune.load_profile(config, infer_imgsz)
+scan_workers    = int(profile.get("workers", config.get("bulk_workers", 1)))
+batch_size      = int(profile.get("batch_size", config.get("bulk_batch_size", 1)))
+torch_threads   = profile.get("torch_threads", config.get("bulk_torch_threads"))
+cv2_threads     = profile.get("cv2_threads", config.get("bulk_cv2_threads"))
+
+if torch_threads:
+    torch.set_num_threads(int(torch_threads))
+if cv2_threads is not None:
+    cv2.setNumThreads(int(cv2_threads))
+
+stats_windows   = config.get("stats_windows", [60])
+detdb_path      = config.get("detdb_path")
+roi_masks       = config.get("roi_masks") or {}
+raw_floor       = config.get("bulk_raw_floor")
+raw_iou         = config.get("bulk_raw_iou", 0.9)
+raw_max_det     = int(config.get("bulk_raw_max_det", 3000))
+report_points   = int(config.get("report_max_points", 2000))
+report_method   = config.get("report_downsample", "minmax")
+
 infer_dir       = config.get("bulk_video_dir")
 infer_dir       = os.path.abspath(infer_dir)
 
@@ -74,12 +108,13 @@ print("<< model loaded >>")
 
 # ---------------------------------------------------------------------------
 def infer(path):
-    # Single image inference
+    # Single image or list of images inference, at the raw floor when candidates are kept
     results = model.predict(
         source      = path,
-        conf        = conf_thres,             
-        iou         = iou_thres,              
-        imgsz       = infer_imgsz,            
+        conf        = raw_floor or conf_thres,
+        iou         = raw_iou if raw_floor else iou_thres,
+        imgsz       = infer_imgsz,
+        max_det     = raw_max_det if raw_floor else 300,
         save        = False,
         verbose     = False
     )
@@ -87,12 +122,50 @@ def infer(path):
     return results
 
 # ---------------------------------------------------------------------------
-def process_inference(results):
+def process_inference(results, roi=None, annotate=True):
+    """
+    Annotated image and the detections as numpy arrays. With an ROI the
+    frame was cropped to it: boxes are mapped back to full-frame pixels
+    and those centred outside the polygon are dropped. Without `annotate`
+    the image is None.
+    """
     # Process results
     r = results[0]
 
     # masks = r.masks
-    boxes = r.boxes  # box object for bounding boxes
+    boxes   = r.boxes  # box object for bounding boxes
+    xyxy    = boxes.xyxy.cpu().numpy()
+    xywh    = boxes.xywh.cpu().numpy()
+    conf    = boxes.conf.cpu().numpy()
+    cls     = boxes.cls.cpu().numpy()
+    frame_height, frame_width = boxes.orig_shape[:2]
+
+    if roi is not None:
+        xywh, inside    = roi.to_frame(xywh)
+        xywh, xyxy      = xywh[inside], xyxy[inside]
+        conf, cls       = conf[inside], cls[inside]
+        frame_height, frame_width = roi.height, roi.width
+
+    # every candidate is kept for rethresholding, the report gets the configured thresholds
+    raw = None
+    if raw_floor:
+        raw     = {"conf": conf, "cls": cls, "xywh": xywh}
+        keep    = rawdet.select(xywh, conf, cls, conf_thres, iou_thres)
+        xywh, xyxy      = xywh[keep], xyxy[keep]
+        conf, cls       = conf[keep], cls[keep]
+
+    dets = {
+        "frame_height"  : int(frame_height),
+        "frame_width"   : int(frame_width),
+        "cls"           : cls,
+        "conf"          : conf,
+        "xywh"          : xywh,
+        "raw"           : raw
+    }
+
+    # rendering is skipped when no image is kept
+    if not annotate:
+        return None, dets
 
     img   = r.plot(
         labels  = False,
@@ -102,18 +175,15 @@ def process_inference(results):
         probs   = False
     )
 
-    for box in boxes:
-        # get box coordinates in (top, left, bottom, right) format
-        x1, y1, x2, y2 = box.xyxy[0]  
-        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-        
+    # boxes are drawn in the coordinates of the image the model saw
+    for (x1, y1, x2, y2), box_cls, box_conf in zip(xyxy.astype(int).tolist(), cls, conf):
         # Draw box
         dw = 1
         cv2.rectangle(img, (x1, y1), (x2, y2), (38, 173, 255), dw)
         cv2.rectangle(img, (x1-dw, y1-dw), (x2+dw, y2+dw), (0, 0, 0), dw)
         
         # Add label
-        label       = f"{model.names[int(box.cls)]} {float(box.conf):.2f}".upper()
+        label       = f"{model.names[int(box_cls)]} {float(box_conf):.2f}".upper()
         (text_width, text_height), baseline = cv2.getTextSize(label, font, font_scale, thickness)
         bg_rect = [
             (x1, y1 - text_height - padding * 2),
@@ -127,8 +197,56 @@ def process_inference(results):
             font, font_scale, (255, 255, 255), thickness,
             cv2.LINE_AA
         )
-    
-    return img, boxes
+
+    return img, dets
+
+
+# -------------------------------------------------------------------
+def scan_batch(stack, indices, timestamps, roi=None):
+    """
+    Infer a batch of sampled frames and return their records. Only the
+    first len(indices) rows of `stack` are frames. Runs in the worker
+    processes when scanning in parallel.
+    """
+    results     = infer(list(stack[:len(indices)]))
+
+    boxd_list   = []
+    for r, i, timestamp in zip(results, indices, timestamps):
+        # bulk keeps no images, nothing is rendered
+        _, dets     = process_inference([r], roi, annotate=False)
+
+        boxd = {
+            "timestamp"     : round(timestamp, 2),
+            "frame_index"   : int(i),
+            "species"       : species,
+            "count"         : len(dets["conf"]),
+            "frame_height"  : dets["frame_height"],
+            "frame_width"   : dets["frame_width"],
+            "cls"           : dets["cls"].tolist(),
+            "conf"          : dets["conf"].tolist(),
+            "xywh"          : dets["xywh"].tolist()
+        } 
+        if dets["raw"] is not None:
+            boxd["raw"] = dets["raw"]
+        boxd_list.append(boxd)
+
+    return boxd_list
+
+
+def scan_video(infer_path, info, sampled, roi=None):
+    """Yield the record of every sampled frame, roughly in time order"""
+    crop        = roi.crop if roi else None
+    frames      = iter_frames(infer_path, frames=sampled, crop=crop, info=info)
+    batches     = batched(frames, batch_size)
+
+    if scan_workers > 1:
+        # batches reach the worker processes through shared memory, not pickled
+        shape   = (batch_size, crop[3], crop[2], 3) if crop else (batch_size, info["height"], info["width"], 3)
+        for _, boxd_list in run_pipeline(batches, shape, scan_batch, (roi,), workers=scan_workers):
+            yield from boxd_list
+    else:
+        for indices, timestamps, stack in batches:
+            yield from scan_batch(stack, indices, timestamps, roi)
 
 
 # -------------------------------------------------------------------
@@ -141,51 +259,35 @@ def run_inference(infer_path):
     os.makedirs(result_path, exist_ok=True)
     os.makedirs(res_img_path, exist_ok=True)
 
-    cap             = cv2.VideoCapture(infer_path)
-    video_fps       = cap.get(cv2.CAP_PROP_FPS)
-
-    if not cap.isOpened():
-        print(f"Error: Could not open video file: {infer_path}")
-        sys.exit()
+    # a bad file fails its job, not the whole run
+    info        = probe_video(infer_path)
 
-    max_frame   = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))    
+    video_fps   = info["fps"]
+    max_frame   = info["frame_count"]
     start_frame = 0
     end_frame   = max_frame
 
-    boxd_list   = []
-    for i in tqdm(range(start_frame, end_frame)):
-        if i % frame_interval != 0:
-            continue
-        
-        cap.set(cv2.CAP_PROP_POS_FRAMES, i)
-        ret, frame  = cap.read() 
-        
-        if not ret:
-            print("Error reading video frame")
-            break
+    # only every frame_interval-th frame is sampled, the rest are skipped by the decoder
+    sampled     = range(start_frame, end_frame, frame_interval)
 
-        results     = infer(frame)
-        img, boxes  = process_inference(results)
+    # with an ROI only its bounding box is decoded and sent to the model
+    roi         = roi_for(video_name, roi_masks, info["width"], info["height"])
+    if roi:
+        print(f"<< ROI crop {roi.crop} >>")
 
-        timestamp   = round(i/video_fps, 2)
-        
-        shape            = boxes.orig_shape
-        frame_height     = shape[0]
-        frame_width      = shape[1]
-        species_count    = len(boxes.conf)
-        
-        boxd = {
-            "timestamp"     : timestamp,
-            "species"       : species,
-            "count"         : species_count,
-            "frame_height"  : frame_height,
-            "frame_width"   : frame_width,
-            "cls"           : boxes.cls.cpu().numpy().tolist(),
-            "conf"          : boxes.conf.cpu().numpy().tolist(),
-            "xywh"          : boxes.xywh.cpu().numpy().tolist()
-        } 
+    scanned     = scan_video(infer_path, info, sampled, roi)
 
-        boxd_list.append(boxd)
+    # statistics are folded in as records arrive, in time order
+    boxd_list   = []
+    raw_store   = rawdet.RawStore()
+    prefix      = os.path.join(result_path, video_name)
+    with ScanStats(prefix, stats_windows) as stats:
+        for boxd in tqdm(in_order(scanned, lag=(scan_workers * 4 + 4) * batch_size), total=len(sampled)):
+            raw = boxd.pop("raw", None)
+            if raw is not None:
+                raw_store.append(boxd, raw)
+            stats.update_record(boxd)
+            boxd_list.append(boxd)
     
     # Pretty print with indentation
     boxd_sorted = sorted(boxd_list, key=lambda x: x['timestamp'])
@@ -193,7 +295,18 @@ def run_inference(infer_path):
     with open(json_path, 'w') as file:
         json.dump(boxd_sorted, file, indent=4)
 
-    cap.release()
+    # candidates down to the raw floor, for `python script/rawdet.py <video> <conf> <iou>`
+    if len(raw_store):
+        raw_store.save(rawdet.raw_path(json_path), raw_floor, raw_iou)
+
+    # lets scans of clips trimmed from this video reuse its detections
+    meta = provenance.scan_meta(infer_path, model_path, conf_thres, iou_thres, infer_imgsz, frame_interval, roi)
+    provenance.write_scan_meta(json_path, meta)
+
+    if detdb_path:
+        conn = detdb.connect(detdb_path)
+        detdb.store_report(conn, video_name, boxd_sorted, video_path=infer_path, fps=video_fps)
+        conn.close()
 
 
 # -------------------------------------------------------------------
@@ -203,80 +316,87 @@ def analyze_result(infer_path):
     json_path       = os.path.join(result_path, video_name+".json")
     json_path       = os.path.abspath(json_path)
 
-    with open(json_path, "r") as f:
-        ds = json.load(f)
-
-    timestamps  = [item['timestamp'] for item in ds]
-    counts      = [item['count'] for item in ds]
-    conf_sums   = [sum(item['conf']) for item in ds]
-
-    df = pd.DataFrame({
-        "timestamp"     : timestamps,
-        "fish-count"    : counts,
-        "conf-sum"      : conf_sums 
-    })
-
-    # Create the plot
-    fig = make_subplots()
-
-    # Add fish count line
-    fig.add_trace(
-        go.Scatter(
-            x=df['timestamp'],
-            y=df['fish-count'],
-            mode='lines+markers',
-            name='Fish Count',
-            line=dict(color='blue', width=2),
-            marker=dict(size=1)
-        )
-    )
+    # html is downsampled for display, the csv keeps every sample
+    report.write_video_report(json_path, 'Model count over time: ' + species, report_points, report_method)
 
-    # Find maximum fish count and add horizontal line
-    max_fish_count = df['fish-count'].max()
-    fig.add_hline(
-        y=max_fish_count,
-        line_dash="dash",
-        line_color="red",
-        annotation_text=f"Max: {max_fish_count}",
-        annotation_position="top right"
-    )
 
-    # Update layout
-    fig.update_layout(
-        title= 'Model count over time: ' + species,
-        xaxis_title='Timestamp',
-        yaxis_title='Number of Fish',
-        template='plotly_white',
-        hovermode='x unified',
-        legend=dict(x=0.01, y=0.99, orientation='h'),
-        margin=dict(l=50, r=50, t=80, b=50)
-    )
 
-    # Make y-axis show only integer values since fish count is discrete
-    fig.update_yaxes(dtick=1)
 
-    # -------------------------------------------------------------------
-    subject_name    = get_base_filename(json_path)
-    subject_dirpath = os.path.dirname(json_path)
-    html_path       = subject_dirpath + "/" + video_name +".html"
-    csv_path        = subject_dirpath + "/" + video_name +".csv"
-    fig.write_html(html_path)
-    df.to_csv(csv_path)
+# -------------------------------------------------------------------
+def calibrate(infer_path, n_frames):
+    """
+    Short scan of the first `n_frames` samples without writing reports,
+    used by tune.py. Prints the measurement as the last output line.
+    Start-up (worker spawn, model load, first batch) is not timed, unless
+    every sample arrives in that first batch.
+    """
+    import tune
+
+    info        = probe_video(infer_path)
+    sampled     = range(0, info["frame_count"], frame_interval)[:n_frames]
+    roi         = roi_for(get_base_filename(infer_path), roi_masks, info["width"], info["height"])
+
+    started     = time.time()
+    arrivals    = [time.time() for _ in scan_video(infer_path, info, sampled, roi)]
+    if not arrivals:
+        raise ValueError(f"no frames decoded from {infer_path}")
+
+    warm        = sum(1 for t in arrivals if t - arrivals[0] < 1e-3)
+    if warm < len(arrivals):
+        timed   = len(arrivals) - warm
+        seconds = arrivals[-1] - arrivals[warm - 1]
+    else:
+        # too few samples to leave the first batch out, start-up is included
+        timed   = len(arrivals)
+        seconds = arrivals[-1] - started
+
+    print(json.dumps({
+        "fps"           : round(timed / seconds, 3),
+        "frames"        : len(arrivals),
+        "seconds"       : round(seconds, 3),
+        "peak_rss_mb"   : tune.peak_rss_mb(scan_workers if scan_workers > 1 else 0)
+    }))
 
 
 
 
 if __name__=="__main__":
-    # bulk mode
-    
-    filenames   = os.listdir(infer_dir)
-    count       = 1
-    for filename in filenames:
-        print(f"<< processing {filename} {count}/{len(filenames)} >>")
-        if filename.lower().endswith(".mp4"):
-            full_path = os.path.join(infer_dir, filename)
-            run_inference(full_path)
-            analyze_result(full_path)
-        count += 1
+    if len(sys.argv) > 2 and sys.argv[1] == "calibrate":
+        calibrate(os.path.abspath(sys.argv[2]), int(sys.argv[3]) if len(sys.argv) > 3 else 64)
+        sys.exit()
+
+    # bulk mode: jobs persist across runs, several runners can share the queue
+    queue       = JobQueue(config.get("bulk_queue_path", "./cache/jobs.sqlite"), config_hash(config))
+    filenames   = sorted(f for f in os.listdir(infer_dir) if f.lower().endswith(".mp4"))
+    added       = queue.enqueue([os.path.join(infer_dir, f) for f in filenames], int(config.get("bulk_max_attempts", 3)))
+    print(f"<< {added} new video(s) queued >>")
+
+    while True:
+        job = queue.claim()
+        if job is None:
+            break
+
+        state = queue.status()
+        print(f"<< processing {os.path.basename(job['video'])} ({job['duration']:.0f}s, attempt {job['attempts']}), "
+              f"{state['counts'].get('pending', 0)} pending, ETA {format_eta(state['eta'])} >>")
+        try:
+            run_inference(job["video"])
+            analyze_result(job["video"])
+        except KeyboardInterrupt:
+            queue.interrupt(job["id"])
+            raise
+        except Exception:
+            print(f"<< failed {job['video']} >>")
+            traceback.print_exc()
+            queue.fail(job["id"], traceback.format_exc())
+        else:
+            queue.finish(job["id"])
+
+    state = queue.status()
+    print(f"<< queue drained: {state['counts']} >>")
+    queue.close()
+
+    # one page over every video in report/, unchanged videos are not rebuilt
+    report.build_dashboard("./report", species=species, max_points=report_points, method=report_method)
 
 
@@ -5,15 +5,21 @@ first it will trim, then scam
 
 from ultralytics import YOLO
 import cv2
-import pandas as pd
 import yaml
 import sys
 import os
 import re
 import json
 from tqdm import tqdm
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+from frames import iter_frames, probe_video
+from shmring import run_pipeline
+import report
+from stats import ScanStats, in_order
+import detdb
+from roi import roi_for
+import provenance
+import rawdet
+from review import ReviewWriter
 
 
 
@@ -56,7 +62,22 @@ res_img_path    = os.path.join(result_path, "images")
 # result_path     = os.path.abspath(config.get("scanf_output_path"))
 # res_img_path    = os.path.join(result_path, "images")
 
+# true / "all" writes every annotated frame as PNG, "detections" only frames with a count
 store_images    = config["scanf_store_images"]
+store_images    = "all" if store_images is True else (store_images or None)
+review_video    = config.get("scanf_review_video", False)
+review_fps      = config.get("scanf_review_fps", 4)
+review_scale    = config.get("scanf_review_scale", 1.0)
+review_crf      = config.get("scanf_review_crf", 23)
+scan_workers    = int(config.get("scanf_workers", 1))
+stats_windows   = config.get("stats_windows", [60])
+detdb_path      = config.get("detdb_path")
+roi_masks       = config.get("roi_masks") or {}
+raw_floor       = config.get("scanf_raw_floor")
+raw_iou         = config.get("scanf_raw_iou", 0.9)
+raw_max_det     = int(config.get("scanf_raw_max_det", 3000))
+report_points   = int(config.get("report_max_points", 2000))
+report_method   = config.get("report_downsample", "minmax")
 full_scan       = config["scanf_full_scan"]
 
 conf_thres      = config.get("scanf_conf_thres")
@@ -90,12 +111,13 @@ print("<< model loaded >>")
 
 # ---------------------------------------------------------------------------
 def infer(path):
-    # Single image inference
+    # Single image inference, at the raw floor when candidates are kept
     results = model.predict(
         source      = path,
-        conf        = conf_thres,             
-        iou         = iou_thres,              
-        imgsz       = infer_imgsz,            
+        conf        = raw_floor or conf_thres,
+        iou         = raw_iou if raw_floor else iou_thres,
+        imgsz       = infer_imgsz,
+        max_det     = raw_max_det if raw_floor else 300,
         save        = False,
         verbose     = False
     )
@@ -103,12 +125,50 @@ def infer(path):
     return results
 
 # ---------------------------------------------------------------------------
-def process_inference(results):
+def process_inference(results, roi=None, annotate=True):
+    """
+    Annotated image and the detections as numpy arrays. With an ROI the
+    frame was cropped to it: boxes are mapped back to full-frame pixels
+    and those centred outside the polygon are dropped. Without `annotate`
+    the image is None.
+    """
     # Process results
     r = results[0]
 
     # masks = r.masks
-    boxes = r.boxes  # box object for bounding boxes
+    boxes   = r.boxes  # box object for bounding boxes
+    xyxy    = boxes.xyxy.cpu().numpy()
+    xywh    = boxes.xywh.cpu().numpy()
+    conf    = boxes.conf.cpu().numpy()
+    cls     = boxes.cls.cpu().numpy()
+    frame_height, frame_width = boxes.orig_shape[:2]
+
+    if roi is not None:
+        xywh, inside    = roi.to_frame(xywh)
+        xywh, xyxy      = xywh[inside], xyxy[inside]
+        conf, cls       = conf[inside], cls[inside]
+        frame_height, frame_width = roi.height, roi.width
+
+    # every candidate is kept for rethresholding, the report gets the configured thresholds
+    raw = None
+    if raw_floor:
+        raw     = {"conf": conf, "cls": cls, "xywh": xywh}
+        keep    = rawdet.select(xywh, conf, cls, conf_thres, iou_thres)
+        xywh, xyxy      = xywh[keep], xyxy[keep]
+        conf, cls       = conf[keep], cls[keep]
+
+    dets = {
+        "frame_height"  : int(frame_height),
+        "frame_width"   : int(frame_width),
+        "cls"           : cls,
+        "conf"          : conf,
+        "xywh"          : xywh,
+        "raw"           : raw
+    }
+
+    # rendering is skipped when no image is kept
+    if not annotate:
+        return None, dets
 
     img   = r.plot(
         labels  = False,
@@ -118,18 +178,15 @@ def process_inference(results):
         probs   = False
     )
 
-    for box in boxes:
-        # get box coordinates in (top, left, bottom, right) format
-        x1, y1, x2, y2 = box.xyxy[0]  
-        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-        
+    # boxes are drawn in the coordinates of the image the model saw
+    for (x1, y1, x2, y2), box_cls, box_conf in zip(xyxy.astype(int).tolist(), cls, conf):
         # Draw box
         dw = 1
         cv2.rectangle(img, (x1, y1), (x2, y2), (38, 173, 255), dw)
         cv2.rectangle(img, (x1-dw, y1-dw), (x2+dw, y2+dw), (0, 0, 0), dw)
         
         # Add label
-        label       = f"{model.names[int(box.cls)]} {float(box.conf):.2f}".upper()
+        label       = f"{model.names[int(box_cls)]} {float(box_conf):.2f}".upper()
         (text_width, text_height), baseline = cv2.getTextSize(label, font, font_scale, thickness)
         bg_rect = [
             (x1, y1 - text_height - padding * 2),
@@ -143,69 +200,153 @@ def process_inference(results):
             font, font_scale, (255, 255, 255), thickness,
             cv2.LINE_AA
         )
-    
-    return img, boxes
+
+    return img, dets
+
+
+# -------------------------------------------------------------------
+def scan_frame(frame, i, timestamp, roi=None):
+    """
+    Infer one sampled frame and return its record. Runs in the worker
+    processes when scanning in parallel.
+    """
+    results     = infer(frame)
+    img, dets   = process_inference(results, roi, annotate=bool(review_video or store_images))
+
+    boxd = {
+        "timestamp"     : round(timestamp, 2),
+        "frame_index"   : int(i),
+        "species"       : species,
+        "count"         : len(dets["conf"]),
+        "frame_height"  : dets["frame_height"],
+        "frame_width"   : dets["frame_width"],
+        "cls"           : dets["cls"].tolist(),
+        "conf"          : dets["conf"].tolist(),
+        "xywh"          : dets["xywh"].tolist()
+    } 
+    if dets["raw"] is not None:
+        boxd["raw"] = dets["raw"]
+
+    # the annotated image goes back to the main process, which writes it in time order
+    if img is not None:
+        boxd["image"] = img
+
+    return boxd
+
+
+# -------------------------------------------------------------------
+def merge_reused(sampled, reused, scanned):
+    """
+    Reused records in the slots of their samples, scanned ones in the
+    other slots as they arrive (completion order with scanf_workers > 1,
+    in_order sorts them afterwards). Ends with the scan, when the decoder
+    stops short of the probed frame count.
+    """
+    scanned = iter(scanned)
+    for i in sampled:
+        if i in reused:
+            yield reused[i]
+            continue
+
+        boxd = next(scanned, None)
+        if boxd is None:
+            return
+        yield boxd
 
 
 # -------------------------------------------------------------------
 def run_inference():
     global start_frame, end_frame
-    cap             = cv2.VideoCapture(infer_path)
-    video_fps       = cap.get(cv2.CAP_PROP_FPS)
-
-    if not cap.isOpened():
+    try:
+        info        = probe_video(infer_path)
+    except ValueError:
         print(f"Error: Could not open video file: {infer_path}")
         sys.exit()
 
-    max_frame   = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))    
+    video_fps   = info["fps"]
+    max_frame   = info["frame_count"]
 
     if full_scan:
         start_frame = 0
         end_frame   = max_frame
-    else:
-        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
 
+    # only every frame_interval-th frame is sampled, the rest are skipped by the decoder
+    first       = -(-start_frame // frame_interval) * frame_interval
+
+    # with an ROI only its bounding box is decoded and sent to the model
+    roi         = roi_for(video_name, roi_masks, info["width"], info["height"])
+    crop        = roi.crop if roi else None
+    if roi:
+        print(f"<< ROI crop {crop} >>")
+
+    meta        = provenance.scan_meta(infer_path, model_path, conf_thres, iou_thres, infer_imgsz, frame_interval, roi)
+
+    # a trimmed clip takes the detections of frames its source scan already covered
+    reused      = {}
+    clip        = provenance.load_provenance(infer_path)
+    # reused samples would have no raw candidates
+    source      = provenance.source_records(clip, meta) if clip and not raw_floor else None
+    if source:
+        offset, source_interval, records = source
+        if frame_interval % source_interval == 0:
+            # sample on the source's grid so the samples coincide
+            first = start_frame + (-(start_frame + offset)) % source_interval
+
+        for i in range(first, end_frame, frame_interval):
+            record = records.get(i + offset)
+            if record is not None:
+                reused[i] = dict(record, timestamp=round(i/video_fps, 2), frame_index=i)
+
+    sampled     = range(first, end_frame, frame_interval)
+    missing     = [i for i in sampled if i not in reused]
+    if clip:
+        print(f"<< {len(reused)} of {len(sampled)} samples reused from {os.path.basename(clip['source'])} >>")
+
+    frames      = iter_frames(infer_path, frames=missing, crop=crop, info=info)
+    if scan_workers > 1:
+        # frames reach the worker processes through shared memory, not pickled
+        shape   = (crop[3], crop[2], 3) if crop else (info["height"], info["width"], 3)
+        scanned = (boxd for _, boxd in run_pipeline(frames, shape, scan_frame, (roi,), workers=scan_workers))
+    else:
+        scanned = (scan_frame(frame, i, timestamp, roi) for i, timestamp, frame in frames)
 
+    if reused:
+        scanned = merge_reused(sampled, reused, scanned)
 
+    # statistics are folded in as records arrive, in time order
     boxd_list   = []
-    for i in tqdm(range(start_frame, end_frame)):
-        if i % frame_interval != 0:
-            continue
-        
-        cap.set(cv2.CAP_PROP_POS_FRAMES, i)
-        ret, frame  = cap.read() 
-        
-        if not ret:
-            print("Error reading video frame")
-            break
-
-        results     = infer(frame)
-        img, boxes  = process_inference(results)
-
-        # Save the annotated image
-        if store_images:
-            fpath   = os.path.join(res_img_path, "frame-"+str(i)+".png")
-            cv2.imwrite(fpath, img)
-
-        timestamp   = round(i/video_fps, 2)
-        
-        shape            = boxes.orig_shape
-        frame_height     = shape[0]
-        frame_width      = shape[1]
-        species_count    = len(boxes.conf)
-        
-        boxd = {
-            "timestamp"     : timestamp,
-            "species"       : species,
-            "count"         : species_count,
-            "frame_height"  : frame_height,
-            "frame_width"   : frame_width,
-            "cls"           : boxes.cls.cpu().numpy().tolist(),
-            "conf"          : boxes.conf.cpu().numpy().tolist(),
-            "xywh"          : boxes.xywh.cpu().numpy().tolist()
-        } 
-
-        boxd_list.append(boxd)
+    raw_store   = rawdet.RawStore()
+    prefix      = os.path.join(result_path, video_name)
+    review      = None
+    try:
+        with ScanStats(prefix, stats_windows) as stats:
+            for boxd in tqdm(in_order(scanned, lag=scan_workers * 4 + 4), total=len(sampled)):
+                raw = boxd.pop("raw", None)
+                if raw is not None:
+                    raw_store.append(boxd, raw)
+
+                # reused records have no image, they were not inferred here
+                img = boxd.pop("image", None)
+                i   = boxd["frame_index"]
+                if img is not None:
+                    if review_video:
+                        if review is None:
+                            height, width = img.shape[:2]
+                            review = ReviewWriter(
+                                prefix + "-review.mp4", width, height,
+                                fps=review_fps, scale=review_scale, crf=review_crf
+                            ).open()
+                        review.add(img, boxd["timestamp"], i, boxd["count"])
+
+                    if store_images == "all" or (store_images == "detections" and boxd["count"]):
+                        cv2.imwrite(os.path.join(res_img_path, "frame-"+str(i)+".png"), img)
+
+                stats.update_record(boxd)
+                boxd_list.append(boxd)
+    finally:
+        if review is not None:
+            review.close()
+            print(f"<< review video: {review.count} frame(s) in {review.encoder.output_path} >>")
     
     # Pretty print with indentation
     boxd_sorted = sorted(boxd_list, key=lambda x: x['timestamp'])
@@ -213,7 +354,15 @@ def run_inference():
     with open(json_path, 'w') as file:
         json.dump(boxd_sorted, file, indent=4)
 
-    cap.release()
+    # candidates down to the raw floor, for `python script/rawdet.py <video> <conf> <iou>`
+    if len(raw_store):
+        raw_store.save(rawdet.raw_path(json_path), raw_floor, raw_iou)
+    provenance.write_scan_meta(json_path, meta)
+
+    if detdb_path:
+        conn = detdb.connect(detdb_path)
+        detdb.store_report(conn, video_name, boxd_sorted, video_path=infer_path, fps=video_fps)
+        conn.close()
 
 
 # -------------------------------------------------------------------
@@ -221,65 +370,8 @@ def analyze_result():
     json_path   = os.path.join(result_path, video_name+".json")
     json_path   = os.path.abspath(json_path)
 
-    with open(json_path, "r") as f:
-        ds = json.load(f)
-
-    timestamps  = [item['timestamp'] for item in ds]
-    counts      = [item['count'] for item in ds]
-    conf_sums   = [sum(item['conf']) for item in ds]
-
-    df = pd.DataFrame({
-        "timestamp"     : timestamps,
-        "fish-count"    : counts,
-        "conf-sum"      : conf_sums 
-    })
-
-    # Create the plot
-    fig = make_subplots()
-
-    # Add fish count line
-    fig.add_trace(
-        go.Scatter(
-            x=df['timestamp'],
-            y=df['fish-count'],
-            mode='lines+markers',
-            name='Fish Count',
-            line=dict(color='blue', width=2),
-            marker=dict(size=1)
-        )
-    )
-
-    # Find maximum fish count and add horizontal line
-    max_fish_count = df['fish-count'].max()
-    fig.add_hline(
-        y=max_fish_count,
-        line_dash="dash",
-        line_color="red",
-        annotation_text=f"Max: {max_fish_count}",
-        annotation_position="top right"
-    )
-
-    # Update layout
-    fig.update_layout(
-        title= 'Model count over time: ' + species,
-        xaxis_title='Timestamp',
-        yaxis_title='Number of Fish',
-        template='plotly_white',
-        hovermode='x unified',
-        legend=dict(x=0.01, y=0.99, orientation='h'),
-        margin=dict(l=50, r=50, t=80, b=50)
-    )
-
-    # Make y-axis show only integer values since fish count is discrete
-    fig.update_yaxes(dtick=1)
-
-    # -------------------------------------------------------------------
-    subject_name    = get_base_filename(json_path)
-    subject_dirpath = os.path.dirname(json_path)
-    html_path       = subject_dirpath + "/" + video_name +".html"
-    csv_path        = subject_dirpath + "/" + video_name +".csv"
-    fig.write_html(html_path)
-    df.to_csv(csv_path)
+    # html is downsampled for display, the csv keeps every sample
+    report.write_video_report(json_path, 'Model count over time: ' + species, report_points, report_method)
 
 
 
@@ -0,0 +1,234 @@
+"""
+shared-memory frame ring for handing frames to worker processes
+
+pixel data is written once into fixed-size slots of a
+multiprocessing.shared_memory block, the queues only carry slot indices
+and (frame index, timestamp) metadata
+"""
+
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import queue
+import time
+import sys
+import numpy as np
+
+
+class SharedFrameRing:
+    """
+    `slots` frames of `shape` in one shared memory block.
+
+    The creating process owns the block (close + unlink), workers attach
+    through the picklable handle().
+    """
+
+    def __init__(self, slots, shape, dtype=np.uint8, name=None):
+        self.slots      = slots
+        self.shape      = tuple(shape)
+        self.dtype      = np.dtype(dtype)
+        self.owner      = name is None
+        nbytes          = int(np.prod(self.shape)) * self.dtype.itemsize
+
+        if self.owner:
+            self.shm    = shared_memory.SharedMemory(create=True, size=slots * nbytes)
+        else:
+            self.shm    = shared_memory.SharedMemory(name=name)
+
+        self.frames     = np.ndarray((slots,) + self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    def handle(self):
+        return (self.shm.name, self.slots, self.shape, self.dtype.str)
+
+    @classmethod
+    def attach(cls, handle):
+        name, slots, shape, dtype = handle
+        return cls(slots, shape, dtype, name=name)
+
+    def view(self, slot):
+        return self.frames[slot]
+
+    def close(self):
+        # views into the buffer must be dropped before the block can close
+        self.frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# -------------------------------------------------------------------
+def _worker_main(handle, tasks, free, results, worker, worker_args):
+    """
+    Worker process: call worker(frame, frame_index, timestamp, *args) on
+    every slot it is handed, then give the slot back. The frame view is
+    only valid during the call.
+    """
+    ring = SharedFrameRing.attach(handle)
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+
+            slot, frame_index, timestamp = task
+            try:
+                result = worker(ring.view(slot), frame_index, timestamp, *worker_args)
+                results.put(("ok", frame_index, result))
+            except Exception as e:
+                results.put(("error", frame_index, repr(e)))
+            finally:
+                free.put(slot)
+    finally:
+        results.put(("done", None, None))
+        ring.close()
+
+
+def run_pipeline(frames, shape, worker, worker_args=(), workers=2, slots=None, start_method="spawn"):
+    """
+    Feed (frame_index, timestamp, ndarray) items from `frames` to
+    `workers` processes through a SharedFrameRing.
+
+    `worker` must be a module-level function; it runs in the worker
+    processes and its return values are yielded here as
+    (frame_index, result), in completion order. Worker errors are
+    reported on stderr and skipped.
+    """
+    ctx         = mp.get_context(start_method)
+    slots       = slots or workers * 2 + 2
+    ring        = SharedFrameRing(slots, shape)
+    free        = ctx.Queue()
+    tasks       = ctx.Queue()
+    results     = ctx.Queue()
+
+    for slot in range(slots):
+        free.put(slot)
+
+    processes = [
+        ctx.Process(target=_worker_main, args=(ring.handle(), tasks, free, results, worker, worker_args), daemon=True)
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    def collect(timeout=None):
+        """Finished results so far, waiting up to `timeout` for the first one"""
+        items = []
+        try:
+            items.append(results.get(timeout=timeout) if timeout else results.get_nowait())
+            while True:
+                items.append(results.get_nowait())
+        except queue.Empty:
+            pass
+        return items
+
+    done = 0
+    try:
+        for frame_index, timestamp, frame in frames:
+            slot = None
+            while slot is None:
+                try:
+                    slot = free.get(timeout=0.1)
+                except queue.Empty:
+                    if not any(p.is_alive() for p in processes):
+                        raise RuntimeError("all worker processes exited")
+
+            np.copyto(ring.view(slot), frame)
+            tasks.put((slot, frame_index, timestamp))
+
+            for status, index, result in collect():
+                if status == "ok":
+                    yield index, result
+                elif status == "error":
+                    print(f"<< worker failed on frame {index}: {result} >>", file=sys.stderr)
+                else:
+                    done += 1
+
+        for _ in processes:
+            tasks.put(None)
+
+        while done < len(processes):
+            items = collect(timeout=0.5)
+            if not items and not any(p.is_alive() for p in processes):
+                break
+            for status, index, result in items:
+                if status == "ok":
+                    yield index, result
+                elif status == "error":
+                    print(f"<< worker failed on frame {index}: {result} >>", file=sys.stderr)
+                else:
+                    done += 1
+
+    finally:
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        ring.close()
+
+
+# -------------------------------------------------------------------
+def _bench_worker(frame, frame_index, timestamp):
+    return float(frame[::64, ::64].mean())
+
+
+def _queue_worker(tasks, results):
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        frame_index, timestamp, frame = task
+        results.put((frame_index, _bench_worker(frame, frame_index, timestamp)))
+    results.put(None)
+
+
+def bench_queue(frames, workers, start_method="spawn"):
+    """Same work as run_pipeline, but pickling every frame through a queue"""
+    ctx         = mp.get_context(start_method)
+    tasks       = ctx.Queue(maxsize=workers * 2 + 2)
+    results     = ctx.Queue()
+    processes   = [ctx.Process(target=_queue_worker, args=(tasks, results), daemon=True) for _ in range(workers)]
+    for process in processes:
+        process.start()
+
+    count = 0
+    for item in frames:
+        tasks.put(item)
+        while not results.empty():
+            results.get()
+            count += 1
+    for _ in processes:
+        tasks.put(None)
+
+    finished = 0
+    while finished < workers:
+        if results.get() is None:
+            finished += 1
+        else:
+            count += 1
+    for process in processes:
+        process.join()
+    return count
+
+
+def bench(n_frames=200, shape=(2160, 3840, 3), workers=2):
+    """Compare queue pickling with the shared-memory ring on synthetic frames"""
+    frame   = np.random.default_rng(0).integers(0, 255, shape, dtype=np.uint8)
+    source  = lambda: ((i, i / 60., frame) for i in range(n_frames))
+    mb      = frame.nbytes / 1e6
+
+    print(f"<< {n_frames} frames of {shape} ({mb:.1f} MB), {workers} workers >>")
+
+    start   = time.time()
+    count   = bench_queue(source(), workers)
+    elapsed = time.time() - start
+    print(f"queue pickling     : {count / elapsed:8.1f} frames/s  ({elapsed:.2f}s)")
+
+    start   = time.time()
+    count   = sum(1 for _ in run_pipeline(source(), shape, _bench_worker, workers=workers))
+    elapsed = time.time() - start
+    print(f"shared-memory ring : {count / elapsed:8.1f} frames/s  ({elapsed:.2f}s)")
+
+
+
+if __name__ == "__main__":
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    bench(workers=workers)
@@ -0,0 +1,214 @@
+"""
+streaming count statistics
+
+scan records are folded in one at a time as they come out of the
+detector: rolling MaxN over sliding windows (monotonic deque), MaxN per
+fixed window, time to first detection, mean count and
+confidence-weighted count. Closed windows are appended to disk right
+away, so long scans need neither the full report in memory nor a second
+pass over it.
+"""
+
+from collections import deque
+import heapq
+import json
+import csv
+import os
+
+
+# ---------------------------------------------------------------------------
+class RollingMaxN:
+    """
+    Maximum count over the last `window` seconds.
+
+    Counts are kept in a deque with decreasing values, every sample is
+    pushed and popped at most once: amortised O(1) per update.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.items  = deque()
+
+    def update(self, t, count):
+        while self.items and self.items[-1][1] <= count:
+            self.items.pop()
+        self.items.append((t, count))
+
+        while self.items[0][0] <= t - self.window:
+            self.items.popleft()
+
+        return self.items[0][1]
+
+
+class WindowedMaxN:
+    """
+    MaxN per consecutive `window`-second bin [k * window, (k + 1) * window).
+
+    update() returns the row of the bin that closed, or None.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.index  = None
+
+    def _open(self, index):
+        self.index      = index
+        self.maxn       = 0
+        self.maxn_at    = None
+        self.samples    = 0
+        self.count_sum  = 0
+        self.conf_sum   = 0.
+
+    def _row(self):
+        return {
+            "window"            : self.window,
+            "start"             : self.index * self.window,
+            "end"               : (self.index + 1) * self.window,
+            "maxn"              : self.maxn,
+            "maxn_at"           : self.maxn_at,
+            "mean_count"        : round(self.count_sum / self.samples, 4),
+            "mean_conf_count"   : round(self.conf_sum / self.samples, 4),
+            "samples"           : self.samples,
+        }
+
+    def update(self, t, count, conf_count):
+        index   = int(t // self.window)
+        closed  = None
+        if self.index is None:
+            self._open(index)
+        elif index != self.index:
+            closed = self._row()
+            self._open(index)
+
+        if self.maxn_at is None or count > self.maxn:
+            self.maxn       = count
+            self.maxn_at    = t
+        self.samples    += 1
+        self.count_sum  += count
+        self.conf_sum   += conf_count
+        return closed
+
+    def flush(self):
+        """Row of the bin still open, if any"""
+        if self.index is None or not self.samples:
+            return None
+        row         = self._row()
+        self.index  = None
+        return row
+
+
+# ---------------------------------------------------------------------------
+class ScanStats:
+    """
+    All statistics of one scan, written next to the report as
+    <prefix>.rolling.csv (one row per sample), <prefix>.maxn.csv (one row
+    per closed window) and <prefix>.stats.json (summary, refreshed every
+    time a window closes).
+
+    Records must arrive in time order, see in_order().
+    """
+
+    def __init__(self, prefix, windows=(60,)):
+        self.windows    = [float(w) for w in windows]
+        self.rolling    = [RollingMaxN(w) for w in self.windows]
+        self.binned     = [WindowedMaxN(w) for w in self.windows]
+        self.json_path  = prefix + ".stats.json"
+
+        self.samples            = 0
+        self.count_sum          = 0
+        self.conf_sum           = 0.
+        self.maxn               = 0
+        self.maxn_at            = None
+        self.first_detection    = None
+        self.start              = None
+        self.end                = None
+
+        self.rolling_file   = open(prefix + ".rolling.csv", "w", newline="")
+        self.rolling_csv    = csv.writer(self.rolling_file)
+        self.rolling_csv.writerow(
+            ["timestamp", "count", "conf_count"] + [f"rolling_maxn_{w:g}s" for w in self.windows]
+        )
+
+        self.maxn_file      = open(prefix + ".maxn.csv", "w", newline="")
+        self.maxn_csv       = csv.DictWriter(
+            self.maxn_file, ["window", "start", "end", "maxn", "maxn_at", "mean_count", "mean_conf_count", "samples"]
+        )
+        self.maxn_csv.writeheader()
+
+    def update(self, t, count, conf_count):
+        if self.start is None:
+            self.start = t
+        self.end            = t
+        self.samples        += 1
+        self.count_sum      += count
+        self.conf_sum       += conf_count
+
+        if self.maxn_at is None or count > self.maxn:
+            self.maxn       = count
+            self.maxn_at    = t
+        if count > 0 and self.first_detection is None:
+            self.first_detection = t
+
+        rolling = [r.update(t, count) for r in self.rolling]
+        self.rolling_csv.writerow([t, count, round(conf_count, 4)] + rolling)
+
+        closed = [row for row in (b.update(t, count, conf_count) for b in self.binned) if row]
+        if closed:
+            self.maxn_csv.writerows(closed)
+            self.maxn_file.flush()
+            self.rolling_file.flush()
+            self.write_summary()
+
+    def update_record(self, boxd):
+        """Fold in one scanf record"""
+        self.update(boxd["timestamp"], boxd["count"], sum(boxd["conf"]))
+
+    def summary(self):
+        return {
+            "samples"               : self.samples,
+            "start"                 : self.start,
+            "end"                   : self.end,
+            "maxn"                  : self.maxn,
+            "maxn_at"               : self.maxn_at,
+            "time_to_first"         : None if self.first_detection is None else round(self.first_detection - self.start, 4),
+            "first_detection"       : self.first_detection,
+            "mean_count"            : round(self.count_sum / self.samples, 4) if self.samples else 0.,
+            "mean_conf_count"       : round(self.conf_sum / self.samples, 4) if self.samples else 0.,
+            "windows"               : self.windows,
+        }
+
+    def write_summary(self):
+        tmp_path = f"{self.json_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.summary(), f, indent=4)
+        os.replace(tmp_path, self.json_path)
+
+    def close(self):
+        rows = [row for row in (b.flush() for b in self.binned) if row]
+        self.maxn_csv.writerows(rows)
+        self.maxn_file.close()
+        self.rolling_file.close()
+        self.write_summary()
+        return self.summary()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ---------------------------------------------------------------------------
+def in_order(records, lag=16, key=lambda boxd: boxd["timestamp"]):
+    """
+    Re-sort records that arrive slightly out of order (parallel workers)
+    with a heap of at most `lag` items
+    """
+    heap = []
+    for n, record in enumerate(records):
+        heapq.heappush(heap, (key(record), n, record))
+        if len(heap) > lag:
+            yield heapq.heappop(heap)[2]
+
+    while heap:
+        yield heapq.heappop(heap)[2]
@@ -0,0 +1,250 @@
+"""
+automatic stereo measurement from scanf detections
+
+left and right detections of a synchronised video pair are matched per
+timestamp by latitude consistency (both cameras share the latitude model),
+then every matched pair is triangulated in one batched pass to estimate
+fish length from the bounding box major axis
+"""
+
+import numpy as np
+import pandas as pd
+import yaml
+import json
+import sys
+import os
+from tqdm import tqdm
+from frames import iter_frames, probe_video
+import measure
+
+
+# ---------------------------------------------------------------------------
+def load_report(json_path):
+    """
+    Read a scanf report into {timestamp: (xywh (n, 4), conf (n,))} plus
+    the frame size
+    """
+    with open(json_path, "r") as f:
+        ds = json.load(f)
+
+    detections = {}
+    size       = None
+    for item in ds:
+        xywh = np.asarray(item["xywh"], dtype=np.float64).reshape(-1, 4)
+        conf = np.asarray(item["conf"], dtype=np.float64)
+        detections[round(item["timestamp"], 2)] = (xywh, conf)
+        size = (item["frame_width"], item["frame_height"])
+
+    return detections, size
+
+
+def align_report(left_dets, right_dets, offset):
+    """
+    Right detections keyed by the left timestamp they are closest to once
+    the clock `offset` (right - left, seconds) is applied. Right samples
+    more than half a left sample period away from any left one are dropped.
+    """
+    left_t  = np.array(sorted(left_dets))
+    right_t = np.array(sorted(right_dets))
+    if len(left_t) == 0 or len(right_t) == 0:
+        return {}
+
+    shifted = right_t - offset
+    period  = np.median(np.diff(left_t)) if len(left_t) > 1 else np.inf
+
+    # nearest shifted right timestamp of every left one
+    after   = np.clip(np.searchsorted(shifted, left_t), 0, len(shifted) - 1)
+    before  = np.clip(after - 1, 0, len(shifted) - 1)
+    nearest = np.where(np.abs(shifted[before] - left_t) <= np.abs(shifted[after] - left_t), before, after)
+    close   = np.abs(shifted[nearest] - left_t) <= period / 2
+
+    return {float(t): right_dets[right_t[j]] for t, j in zip(left_t[close], nearest[close])}
+
+
+def scan_pair(left_video, right_video, interval, offset, scan_config):
+    """
+    Run the detector on both videos at the same instants: every
+    `interval`-th left frame and the right frame closest to it after
+    applying the clock `offset` (right - left, seconds)
+    """
+    from ultralytics import YOLO
+
+    model       = YOLO(os.path.abspath(scan_config["scanf_model_path"]))
+    left_info   = probe_video(left_video)
+    right_info  = probe_video(right_video)
+
+    left_frames     = range(0, left_info["frame_count"], interval)
+    right_frames    = [int(round((i / left_info["fps"] + offset) * right_info["fps"])) for i in left_frames]
+
+    left_iter   = iter_frames(left_video, frames=left_frames, info=left_info)
+    right_iter  = iter_frames(right_video, frames=[r for r in right_frames if r >= 0], info=right_info)
+
+    left_dets   = {}
+    right_dets  = {}
+    right_next  = next(right_iter, None)
+
+    for i, timestamp, left_frame in tqdm(left_iter, total=len(left_frames)):
+        target = int(round((timestamp + offset) * right_info["fps"]))
+        while right_next is not None and right_next[0] < target:
+            right_next = next(right_iter, None)
+        if right_next is None or right_next[0] != target:
+            continue
+
+        results = model.predict(
+            source  = [left_frame, right_next[2]],
+            conf    = scan_config.get("scanf_conf_thres"),
+            iou     = scan_config.get("scanf_iou_thres"),
+            imgsz   = scan_config.get("scanf_rescale_size"),
+            save    = False,
+            verbose = False
+        )
+
+        key = round(timestamp, 2)
+        for dets, r in zip((left_dets, right_dets), results):
+            dets[key] = (r.boxes.xywh.cpu().numpy().astype(np.float64), r.boxes.conf.cpu().numpy().astype(np.float64))
+
+    size = (left_info["width"], left_info["height"])
+    return left_dets, right_dets, size
+
+
+# ---------------------------------------------------------------------------
+def box_axis(xywh, horizontal):
+    """Endpoints (n, 2, 2) of the box axis, horizontal or vertical per box"""
+    x, y, w, h  = xywh[:, 0], xywh[:, 1], xywh[:, 2], xywh[:, 3]
+    dx          = np.where(horizontal, w / 2, 0)
+    dy          = np.where(horizontal, 0, h / 2)
+    return np.stack([np.stack([x - dx, y - dy], -1), np.stack([x + dx, y + dy], -1)], axis=1)
+
+
+def match_frame(model, left_xywh, right_xywh, lat_tolerance):
+    """
+    Match left and right boxes of one instant.
+
+    The cost of a pair is the mean latitude difference of the box top,
+    center and bottom, computed for all pairs at once by broadcasting.
+    Pairs are accepted greedily by increasing cost while under
+    `lat_tolerance` degrees. Returns (left_idx, right_idx, cost).
+    """
+    if len(left_xywh) == 0 or len(right_xywh) == 0:
+        empty = np.empty(0, dtype=np.intp)
+        return empty, empty, np.empty(0)
+
+    def edge_lats(xywh, side):
+        x, y, h = xywh[:, 0], xywh[:, 1], xywh[:, 3]
+        pts     = np.stack([np.stack([x, y - h / 2], -1), np.stack([x, y], -1), np.stack([x, y + h / 2], -1)], 1)
+        return model.lonlat(pts, side)[1]        # (n, 3)
+
+    left_lat    = edge_lats(left_xywh, "left")
+    right_lat   = edge_lats(right_xywh, "right")
+    cost        = np.abs(left_lat[:, None, :] - right_lat[None, :, :]).mean(-1)
+
+    order       = np.argsort(cost, axis=None)
+    li, ri      = np.unravel_index(order, cost.shape)
+    used_l      = set()
+    used_r      = set()
+    matches     = []
+    for l, r in zip(li, ri):
+        if cost[l, r] > lat_tolerance:
+            break
+        if l in used_l or r in used_r:
+            continue
+        used_l.add(l)
+        used_r.add(r)
+        matches.append((l, r))
+
+    if not matches:
+        empty = np.empty(0, dtype=np.intp)
+        return empty, empty, np.empty(0)
+
+    l, r = np.array(matches).T
+    return l, r, cost[l, r]
+
+
+def measure_detections(left_dets, right_dets, size, lat_tolerance):
+    """
+    Pair detections of every shared timestamp, then triangulate all pairs
+    together. Returns a DataFrame with one row per matched fish.
+    """
+    width, height   = size
+    model           = measure.get_camera_model(width, height)
+
+    rows            = {k: [] for k in ("timestamp", "left_idx", "right_idx", "left_conf", "right_conf", "lat_cost")}
+    left_boxes      = []
+    right_boxes     = []
+
+    for timestamp in sorted(set(left_dets) & set(right_dets)):
+        (lxywh, lconf), (rxywh, rconf) = left_dets[timestamp], right_dets[timestamp]
+        l, r, cost = match_frame(model, lxywh, rxywh, lat_tolerance)
+
+        rows["timestamp"].append(np.full(len(l), timestamp))
+        rows["left_idx"].append(l)
+        rows["right_idx"].append(r)
+        rows["left_conf"].append(lconf[l])
+        rows["right_conf"].append(rconf[r])
+        rows["lat_cost"].append(cost)
+        left_boxes.append(lxywh[l])
+        right_boxes.append(rxywh[r])
+
+    columns = {k: np.concatenate(v) if v else np.empty(0) for k, v in rows.items()}
+    if not left_boxes or len(columns["timestamp"]) == 0:
+        return pd.DataFrame(columns=list(rows) + ["length_cm", "range_m", "x", "y", "z"])
+
+    left_boxes  = np.concatenate(left_boxes)
+    right_boxes = np.concatenate(right_boxes)
+
+    # measure along the longer side of the left box, in both views
+    horizontal  = left_boxes[:, 2] >= left_boxes[:, 3]
+    coords      = measure.triangulate(
+        box_axis(left_boxes, horizontal), box_axis(right_boxes, horizontal), width, height
+    )
+    center      = coords.mean(axis=1)
+
+    df = pd.DataFrame(columns)
+    df["length_cm"] = np.round(measure.get_distance_3d(coords[:, 0], coords[:, 1]) * 100, 3)
+    df["range_m"]   = np.round(np.linalg.norm(center, axis=-1), 4)
+    df["x"]         = center[:, 0]
+    df["y"]         = center[:, 1]
+    df["z"]         = center[:, 2]
+
+    # rays that do not converge in front of the rig are not measurements
+    valid = np.isfinite(df["length_cm"]) & (df["y"] > 0)
+    return df[valid].reset_index(drop=True)
+
+
+
+if __name__ == "__main__":
+    # ---------------------------------------------------------------------------
+    config              = None
+    config_file_path    = "config.yaml"
+    with open(config_file_path, 'r') as f:
+        config = yaml.safe_load(f)  # Use safe_load for security
+
+    if not config:
+        print(f">> Error: Configuration file not found at {config_file_path} <<")
+        sys.exit()
+
+    left_json       = config.get("stereo_left_json")
+    right_json      = config.get("stereo_right_json")
+    output_path     = config.get("stereo_output", "./report/stereo-lengths.csv")
+    lat_tolerance   = config.get("stereo_lat_tolerance", 2.0)
+
+    if left_json and right_json:
+        print("<< using existing scanf reports >>")
+        left_dets, size = load_report(left_json)
+        right_dets, _   = load_report(right_json)
+        right_dets      = align_report(left_dets, right_dets, float(config.get("stereo_offset", 0.0)))
+    else:
+        print("<< scanning stereo pair >>")
+        left_dets, right_dets, size = scan_pair(
+            os.path.abspath(config["stereo_left_video"]),
+            os.path.abspath(config["stereo_right_video"]),
+            int(config.get("stereo_interval", 30)),
+            float(config.get("stereo_offset", 0.0)),
+            config
+        )
+
+    df = measure_detections(left_dets, right_dets, size, lat_tolerance)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    df.to_csv(output_path, index=False)
+    print(f"<< {len(df)} paired detection(s) measured, saved to {output_path} >>")
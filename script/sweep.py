@@ -0,0 +1,300 @@
+"""
+accuracy versus speed sweep for scanf settings
+
+every reference clip is inferred densely once per (imgsz, backend), at the
+lowest confidence of the grid, and the detections are cached. Any
+sampling interval and confidence threshold is then evaluated from the
+cache without new inference: subsample the frames, rethreshold the boxes,
+compare the count series and MaxN with the dense reference run. Speed is
+the inference time per sample plus the decode time per sample of one
+real sampled pass per interval, since the frames in between still have
+to be grabbed.
+
+    python script/sweep.py
+
+writes report/sweep/sweep.csv (every grid point, Pareto flag) and
+report/sweep/sweep.html (frames/s vs count error)
+"""
+
+import itertools
+import hashlib
+import yaml
+import json
+import time
+import sys
+import os
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from tqdm import tqdm
+from frames import iter_frames, probe_video
+from provenance import file_fingerprint
+
+
+# exported model next to the .pt for each backend, see ultralytics export
+BACKEND_SUFFIX = {
+    "pt"            : ".pt",
+    "torchscript"   : ".torchscript",
+    "onnx"          : ".onnx",
+    "engine"        : ".engine",
+    "openvino"      : "_openvino_model",
+}
+
+
+# ---------------------------------------------------------------------------
+def backend_model(model_path, backend):
+    return os.path.splitext(model_path)[0] + BACKEND_SUFFIX[backend]
+
+
+def dense_key(clip_path, model_path, imgsz, conf, iou, interval):
+    ident = "|".join(str(v) for v in (
+        file_fingerprint(clip_path), os.path.abspath(model_path), os.stat(model_path).st_mtime_ns,
+        imgsz, conf, iou, interval, "infer"
+    ))
+    return hashlib.sha1(ident.encode()).hexdigest()[:16]
+
+
+def dense_detections(clip_path, model_path, imgsz, conf, iou, interval=1, cache_dir="./cache/sweep"):
+    """
+    Detections of every `interval`-th frame, cached as .npz:
+    frames (n,), infer_seconds (n,) per-frame inference time, and the
+    boxes in CSR layout (offsets (n + 1,), conf, cls, xywh)
+    """
+    key         = dense_key(clip_path, model_path, imgsz, conf, iou, interval)
+    cache_path  = os.path.join(cache_dir, key + ".npz")
+    if os.path.exists(cache_path):
+        return dict(np.load(cache_path))
+
+    from ultralytics import YOLO
+
+    model       = YOLO(model_path)
+    info        = probe_video(clip_path)
+    sampled     = range(0, info["frame_count"], interval)
+
+    frames, seconds, counts = [], [], []
+    confs, classes, boxes   = [], [], []
+    for i, _, frame in tqdm(iter_frames(clip_path, frames=sampled, info=info), total=len(sampled), desc=os.path.basename(clip_path)):
+        tick = time.perf_counter()
+        r = model.predict(source=frame, conf=conf, iou=iou, imgsz=imgsz, save=False, verbose=False)[0]
+        seconds.append(time.perf_counter() - tick)
+
+        confs.append(r.boxes.conf.cpu().numpy())
+        classes.append(r.boxes.cls.cpu().numpy())
+        boxes.append(r.boxes.xywh.cpu().numpy().reshape(-1, 4))
+        counts.append(len(confs[-1]))
+        frames.append(i)
+
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    dense   = {
+        "frames"        : np.array(frames, dtype=np.int64),
+        "infer_seconds" : np.array(seconds, dtype=np.float64),
+        "offsets"       : offsets,
+        "conf"          : np.concatenate(confs) if confs else np.empty(0, np.float32),
+        "cls"           : np.concatenate(classes) if classes else np.empty(0, np.float32),
+        "xywh"          : np.concatenate(boxes) if boxes else np.empty((0, 4), np.float32),
+        "fps"           : np.float64(info["fps"]),
+    }
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = cache_path + f".{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, **dense)
+    os.replace(tmp_path, cache_path)
+    return dense
+
+
+def decode_seconds(clip_path, interval, cache_dir="./cache/sweep"):
+    """
+    Seconds per sample of decoding every `interval`-th frame the way scanf
+    does (frames in between are grabbed or seeked over), measured on one
+    real pass without inference and cached
+    """
+    key         = hashlib.sha1(f"{file_fingerprint(clip_path)}|decode|{interval}".encode()).hexdigest()[:16]
+    cache_path  = os.path.join(cache_dir, key + ".json")
+    if os.path.exists(cache_path):
+        with open(cache_path, "r") as f:
+            return json.load(f)["seconds"]
+
+    info    = probe_video(clip_path)
+    sampled = range(0, info["frame_count"], interval)
+    n       = 0
+    tick    = time.perf_counter()
+    for _ in iter_frames(clip_path, frames=sampled, info=info):
+        n += 1
+    seconds = (time.perf_counter() - tick) / max(n, 1)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(cache_path, "w") as f:
+        json.dump({"clip": clip_path, "interval": interval, "samples": n, "seconds": seconds}, f)
+    return seconds
+
+
+def counts_at(dense, conf):
+    """Per-frame count of boxes at or above `conf`"""
+    frame_of_box = np.repeat(np.arange(len(dense["frames"])), np.diff(dense["offsets"]))
+    return np.bincount(frame_of_box[dense["conf"] >= conf], minlength=len(dense["frames"]))
+
+
+# ---------------------------------------------------------------------------
+def evaluate(dense, reference, interval, conf, decode=0.):
+    """
+    One grid point on one clip against the reference counts (dense
+    frames of the reference run). The sampled series is held until the
+    next sample, as a player or a MaxN reading would see it. `decode` is
+    the decode time per sample at this interval, see decode_seconds.
+    """
+    frames      = dense["frames"]
+    keep        = frames % interval == 0
+    sample      = counts_at(dense, conf)[keep]
+    sample_at   = frames[keep]
+
+    ref_frames, ref_counts = reference
+    held        = sample[np.clip(np.searchsorted(sample_at, ref_frames, side="right") - 1, 0, None)]
+    ref_maxn    = int(ref_counts.max()) if len(ref_counts) else 0
+    maxn        = int(sample.max()) if len(sample) else 0
+
+    # the first sample is paid with model start-up, leave it out
+    infer       = dense["infer_seconds"]
+    per_sample  = (float(np.median(infer[1:])) if len(infer) > 1 else float(infer.sum())) + decode
+    return {
+        "count_mae"         : float(np.abs(held - ref_counts).mean()),
+        "maxn"              : maxn,
+        "ref_maxn"          : ref_maxn,
+        "maxn_error"        : abs(maxn - ref_maxn),
+        "source_fps"        : interval / per_sample if per_sample > 0 else np.inf,
+        "realtime"          : interval / per_sample / float(dense["fps"]) if per_sample > 0 else np.inf,
+    }
+
+
+def pareto(df, speed="source_fps", error="count_mae"):
+    """True for rows no other row beats on both speed and error"""
+    s   = df[speed].to_numpy()
+    e   = df[error].to_numpy()
+    dominated = ((s[None, :] >= s[:, None]) & (e[None, :] <= e[:, None]) &
+                 ((s[None, :] > s[:, None]) | (e[None, :] < e[:, None]))).any(axis=1)
+    return ~dominated
+
+
+def run_sweep(clips, model_path, grid, reference, iou, dense_interval=1, cache_dir="./cache/sweep"):
+    """
+    Every combination of grid["interval"], grid["imgsz"], grid["conf"]
+    and grid["backend"] on every clip. `reference` is the dict
+    (imgsz, conf, backend) of the dense run taken as ground truth.
+    Returns one row per grid point, averaged over clips.
+    """
+    conf_floor  = min(list(grid["conf"]) + [reference["conf"]])
+    passes      = sorted(set(itertools.product(grid["imgsz"], grid["backend"])) | {(reference["imgsz"], reference["backend"])})
+
+    dense = {}
+    for imgsz, backend in passes:
+        path = backend_model(model_path, backend)
+        if not os.path.exists(path):
+            print(f"<< no {backend} model at {path}, export it first: skipped >>")
+            continue
+        for clip in clips:
+            dense[clip, imgsz, backend] = dense_detections(clip, path, imgsz, conf_floor, iou, dense_interval, cache_dir)
+
+    rows = []
+    for clip in clips:
+        ref = dense.get((clip, reference["imgsz"], reference["backend"]))
+        if ref is None:
+            print(f">> Error: no reference run for {clip} <<")
+            continue
+        ref_series = (ref["frames"], counts_at(ref, reference["conf"]))
+
+        for interval, imgsz, conf, backend in itertools.product(grid["interval"], grid["imgsz"], grid["conf"], grid["backend"]):
+            if (clip, imgsz, backend) not in dense or interval % dense_interval:
+                continue
+            decode  = decode_seconds(clip, interval, cache_dir)
+            row     = evaluate(dense[clip, imgsz, backend], ref_series, interval, conf, decode)
+            rows.append({"clip": os.path.basename(clip), "interval": interval, "imgsz": imgsz,
+                         "conf": conf, "backend": backend, **row})
+
+    per_clip    = pd.DataFrame(rows)
+    if per_clip.empty:
+        return per_clip, per_clip
+
+    keys        = ["interval", "imgsz", "conf", "backend"]
+    df          = per_clip.groupby(keys, as_index=False).agg(
+        count_mae   = ("count_mae", "mean"),
+        maxn_error  = ("maxn_error", "mean"),
+        source_fps  = ("source_fps", "mean"),
+        realtime    = ("realtime", "mean"),
+    )
+    df["pareto"] = pareto(df)
+    return df.sort_values(["pareto", "source_fps"], ascending=[False, False]).reset_index(drop=True), per_clip
+
+
+def sweep_figure(df):
+    """frames/s against count error, Pareto front drawn as a line"""
+    label   = df.apply(lambda r: f"interval {r['interval']}, imgsz {r['imgsz']}, conf {r['conf']}, {r['backend']}"
+                                 f"<br>MaxN error {r['maxn_error']:.2f}", axis=1)
+    front   = df[df["pareto"]].sort_values("source_fps")
+
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=df["source_fps"], y=df["count_mae"], mode="markers", name="grid point",
+        text=label, hoverinfo="text", marker=dict(color="lightgray", size=7)
+    ))
+    fig.add_trace(go.Scatter(
+        x=front["source_fps"], y=front["count_mae"], mode="lines+markers", name="Pareto front",
+        text=label[front.index], hoverinfo="text", line=dict(color="blue", width=2), marker=dict(size=8)
+    ))
+    fig.update_layout(
+        title='Count error versus speed',
+        xaxis_title='Source frames per second (sampling included)',
+        yaxis_title='Count MAE against the dense reference',
+        xaxis_type='log',
+        template='plotly_white',
+        margin=dict(l=50, r=50, t=80, b=50)
+    )
+    return fig
+
+
+
+if __name__ == "__main__":
+    # ---------------------------------------------------------------------------
+    config              = None
+    config_file_path    = "config.yaml"
+    with open(config_file_path, 'r') as f:
+        config = yaml.safe_load(f)  # Use safe_load for security
+
+    if not config:
+        print(f">> Error: Configuration file not found at {config_file_path} <<")
+        sys.exit()
+
+    clips       = [os.path.abspath(p) for p in config.get("sweep_clips") or [config["scanf_video_path"]]]
+    output_dir  = config.get("sweep_output_dir", "./report/sweep")
+    grid        = {
+        "interval"  : config.get("sweep_intervals", [1, 5, 15, 30, 60]),
+        "imgsz"     : config.get("sweep_imgsz", [320, 480, 640]),
+        "conf"      : config.get("sweep_conf", [0.15, 0.25, 0.35]),
+        "backend"   : config.get("sweep_backends", ["pt"]),
+    }
+    reference   = {
+        "imgsz"     : config.get("sweep_reference_imgsz", max(grid["imgsz"])),
+        "conf"      : config.get("sweep_reference_conf", config.get("scanf_conf_thres", 0.25)),
+        "backend"   : config.get("sweep_reference_backend", "pt"),
+    }
+
+    df, per_clip = run_sweep(
+        clips,
+        os.path.abspath(config["scanf_model_path"]),
+        grid,
+        reference,
+        iou             = config.get("scanf_iou_thres", 0.7),
+        dense_interval  = int(config.get("sweep_dense_interval", 1)),
+        cache_dir       = config.get("sweep_cache_dir", "./cache/sweep")
+    )
+
+    if df.empty:
+        print(">> Error: nothing to evaluate <<")
+        sys.exit()
+
+    os.makedirs(output_dir, exist_ok=True)
+    df.to_csv(os.path.join(output_dir, "sweep.csv"), index=False)
+    per_clip.to_csv(os.path.join(output_dir, "sweep-per-clip.csv"), index=False)
+    sweep_figure(df).write_html(os.path.join(output_dir, "sweep.html"))
+
+    print(df[df["pareto"]].to_string(index=False))
+    print(f"<< {len(df)} grid point(s), {int(df['pareto'].sum())} on the Pareto front, saved to {output_dir} >>")
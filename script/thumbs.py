@@ -0,0 +1,106 @@
+"""
+keyframe thumbnail strips for fast scrubbing
+
+the strip is generated once per video by decoding keyframes only and
+cached on disk as memory-mapped .npy files, later sessions reopen it
+instantly
+"""
+
+import subprocess
+import threading
+import hashlib
+import re
+import os
+import numpy as np
+from frames import probe_video
+
+
+PTS_TIME = re.compile(r'pts_time:\s*(-?\d+(?:\.\d+)?)')
+
+
+def strip_key(video_path, height):
+    """Cache key from the path, size and mtime of the video"""
+    stat    = os.stat(video_path)
+    ident   = f"{os.path.abspath(video_path)}|{stat.st_size}|{stat.st_mtime_ns}|{height}"
+    return hashlib.sha1(ident.encode()).hexdigest()[:16]
+
+
+def _generate(video_path, width, height):
+    """Decode keyframes only, return (timestamps, RGB thumbnails)"""
+    command = [
+        'ffmpeg',
+        '-nostdin',
+        '-loglevel', 'info',
+        '-skip_frame', 'nokey',         # the decoder drops everything but keyframes
+        '-i', video_path,
+        '-vf', f'scale={width}:{height}:flags=area,showinfo',
+        '-vsync', '0',
+        '-an',
+        '-f', 'rawvideo',
+        '-pix_fmt', 'rgb24',
+        '-'
+    ]
+    process     = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    timestamps  = []
+
+    # showinfo reports on stderr, drain it concurrently so neither pipe fills up
+    def read_stderr():
+        for line in process.stderr:
+            match = PTS_TIME.search(line.decode(errors='replace'))
+            if match:
+                timestamps.append(float(match.group(1)))
+
+    reader = threading.Thread(target=read_stderr, daemon=True)
+    reader.start()
+
+    frame_bytes = width * height * 3
+    raw         = process.stdout.read()
+    process.wait()
+    reader.join()
+
+    if process.returncode != 0:
+        raise RuntimeError(f"thumbnail extraction failed for {video_path}")
+
+    count   = min(len(raw) // frame_bytes, len(timestamps))
+    thumbs  = np.frombuffer(raw, dtype=np.uint8, count=count * frame_bytes).reshape(count, height, width, 3)
+    return np.array(timestamps[:count], dtype=np.float64), thumbs
+
+
+def keyframe_strip(video_path, height=54, min_step=1.0, cache_dir="./cache/thumbs"):
+    """
+    (timestamps, thumbnails) of the video's keyframes, at most one per
+    `min_step` seconds, thumbnails `height` pixels high in RGB.
+
+    Both arrays are memory-mapped from the cache, generated on first use.
+    """
+    key         = strip_key(video_path, height)
+    ts_path     = os.path.join(cache_dir, f"{key}-pts.npy")
+    img_path    = os.path.join(cache_dir, f"{key}-thumbs.npy")
+
+    if not (os.path.exists(ts_path) and os.path.exists(img_path)):
+        info    = probe_video(video_path)
+        width   = max(2, int(round(height * info["width"] / info["height"] / 2)) * 2)
+        timestamps, thumbs = _generate(video_path, width, height)
+
+        keep, last = [], None
+        for i, t in enumerate(timestamps):
+            if last is None or t - last >= min_step:
+                keep.append(i)
+                last = t
+
+        os.makedirs(cache_dir, exist_ok=True)
+        # thumbs first: the pts file marks a complete strip
+        for path, array in ((img_path, thumbs[keep]), (ts_path, timestamps[keep])):
+            tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+            np.save(tmp_path, array)
+            os.replace(tmp_path, path)
+
+    return np.load(ts_path, mmap_mode="r"), np.load(img_path, mmap_mode="r")
+
+
+def thumbnail_at(timestamps, thumbs, t):
+    """Thumbnail of the last keyframe at or before `t`"""
+    if not len(timestamps):
+        return None
+    i = max(int(np.searchsorted(timestamps, t, side="right")) - 1, 0)
+    return thumbs[i]
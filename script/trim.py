@@ -4,11 +4,15 @@ import yaml
 import sys
 import os
 import cv2
+from tqdm import tqdm
+from encoder import FFmpegEncoder
+from frames import iter_frames, probe_video, output_size, time_to_seconds
+import provenance
 
 # -------------------------------------------------------------------
 def trim_video_ffmpeg(input_path, output_path, start_time, end_time):
     """
-    Trim video using FFmpeg
+    Trim video using FFmpeg, True when ffmpeg succeeded
     """
     try:
         # FFmpeg command
@@ -26,83 +30,125 @@ def trim_video_ffmpeg(input_path, output_path, start_time, end_time):
         # Run FFmpeg command
         subprocess.run(command, check=True)
         print(f"Video trimmed successfully! Saved to {output_path}")
+        return True
         
     except subprocess.CalledProcessError as e:
         print(f"An error occurred while running FFmpeg: {str(e)}")
     except Exception as e:
         print(f"An error occurred: {str(e)}")
+    return False
 
 
 # -------------------------------------------------------------------
-def trim_video_opencv(input_path, output_path, start_time, end_time):
+def trim_video_opencv(input_path, output_path, start_time, end_time,
+                      crop=None, scale=None, denoise=0,
+                      codec="libx264", preset="veryfast", crf=20, threads=0):
     """
-    Trim a video file based on start and end times.
-    
+    Trim and re-encode a video, optionally cropping, scaling or denoising.
+
+    Frames come from frames.iter_frames, which crops and scales at decode
+    time, and are piped into a multithreaded ffmpeg encoder.
+
     Parameters:
     input_path (str): Path to input video file
     output_path (str): Path to save trimmed video
-    start_time (str): Start time in format "HH:MM:SS"
-    end_time (str): End time in format "HH:MM:SS"
+    start_time (str): Start time in format "HH:MM:SS" or seconds
+    end_time (str): End time in format "HH:MM:SS" or seconds
+    crop (list): [x, y, w, h] region of the source frame, or None
+    scale (list): [w, h] output size, or None
+    denoise (int): strength of non-local means denoising, 0 disables it
     """
+    encoder = None
+
     try:
-        # Open the video file
-        video = cv2.VideoCapture(input_path)
-        
-        # Get video properties
-        fps = video.get(cv2.CAP_PROP_FPS)
-        width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        
-        # Convert time strings to seconds
-        def time_to_seconds(time_str):
-            h, m, s = map(int, time_str.split(':'))
-            return h * 3600 + m * 60 + s
-        
+        info            = probe_video(input_path)
+        out_w, out_h    = output_size(info["width"], info["height"], crop, scale)
         start_seconds   = time_to_seconds(start_time)
         end_seconds     = time_to_seconds(end_time)
-        
-        # Calculate start and end frames
-        start_frame     = int(start_seconds * fps)
-        end_frame       = int(end_seconds * fps)
-        
-        # Set video writer
-        fourcc  = cv2.VideoWriter_fourcc(*'mp4v')
-        out     = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
-        
-        # Set frame position to start_frame
-        video.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
-        
-        # Read and write frames
-        current_frame = start_frame
-        
-        while current_frame <= end_frame:
-            ret, frame = video.read()
-            
-            if not ret:
-                break
-                
-            out.write(frame)
-            current_frame += 1
-            
-            # Optional: Show progress
-            print(f"Processing frame {current_frame} of {end_frame}", end='\r')
-        
-        # Release resources
-        video.release()
-        out.release()
-        
-        print(f"\nVideo trimmed successfully! Saved to {output_path}")
-        
+
+        encoder = FFmpegEncoder(
+            output_path, out_w, out_h, info["fps"],
+            codec   = codec,
+            preset  = preset,
+            crf     = crf,
+            threads = threads
+        ).open()
+
+        frames  = iter_frames(input_path, start_seconds, end_seconds, crop=crop, scale=scale, info=info)
+        total   = int((end_seconds - start_seconds) * info["fps"])
+
+        # progress output is throttled, printing every frame costs more than the copy
+        for _, _, frame in tqdm(frames, total=total, mininterval=0.5, desc="encoding"):
+            if denoise:
+                cv2.fastNlMeansDenoisingColored(frame, encoder.frame, denoise, denoise, 3, 9)
+                encoder.write()
+            else:
+                encoder.write(frame)
+
+        encoder.close()
+        print(f"Video trimmed successfully! Saved to {output_path}")
+        return encoder.frames_written
+
     except Exception as e:
         print(f"An error occurred: {str(e)}")
-    
-    finally:
-        # Ensure resources are released
-        if 'video' in locals():
-            video.release()
-        if 'out' in locals():
-            out.release()
-        cv2.destroyAllWindows()
+        if encoder is not None and encoder.process is not None:
+            encoder.process.kill()
+        return 0
+
+
+# -------------------------------------------------------------------
+def trim_video_cv2writer(input_path, output_path, start_time, end_time):
+    """
+    Legacy re-encode path through cv2.VideoWriter (mp4v), kept for benchmarking
+    """
+    video   = cv2.VideoCapture(input_path)
+    fps     = video.get(cv2.CAP_PROP_FPS)
+    width   = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height  = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    start_frame = int(time_to_seconds(start_time) * fps)
+    end_frame   = int(time_to_seconds(end_time) * fps)
+
+    fourcc  = cv2.VideoWriter_fourcc(*'mp4v')
+    out     = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+
+    video.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+    frames  = 0
+    for _ in range(start_frame, end_frame + 1):
+        ret, frame = video.read()
+        if not ret:
+            break
+        out.write(frame)
+        frames += 1
+
+    video.release()
+    out.release()
+    return frames
+
+
+# -------------------------------------------------------------------
+def bench_reencode(input_path, output_path, start_time, end_time, **encode_args):
+    """
+    Compare throughput and output size of the piped encoder against cv2.VideoWriter
+    """
+    base, ext   = os.path.splitext(output_path)
+    runs        = [
+        ("cv2.VideoWriter mp4v", base + "_bench_mp4v" + ext,
+            lambda path: trim_video_cv2writer(input_path, path, start_time, end_time)),
+        (f"ffmpeg pipe {encode_args.get('codec', 'libx264')}", base + "_bench_pipe" + ext,
+            lambda path: trim_video_opencv(input_path, path, start_time, end_time, **encode_args)),
+    ]
+
+    print("<< re-encode bench >>")
+    for name, path, run in runs:
+        start   = time.time()
+        frames  = run(path)
+        elapsed = time.time() - start
+        size_mb = os.path.getsize(path) / 1e6 if os.path.exists(path) else 0
+        fps     = frames / elapsed if elapsed > 0 else 0
+        print(f"{name:<28} frames: {frames:>6}  time: {elapsed:7.2f}s  "
+              f"throughput: {fps:7.1f} fps  size: {size_mb:8.2f} MB")
 
 
 
@@ -135,9 +181,39 @@ if __name__ == "__main__":
     os.makedirs(output_dir, exist_ok=True)
     output_file = os.path.abspath(output_video)
 
-    # Test FFmpeg
+    trim_mode           = config.get("trim_mode", "copy")
+    encode_args         = {
+        "crop"      : config.get("trim_crop"),
+        "scale"     : config.get("trim_scale"),
+        "denoise"   : config.get("trim_denoise", 0),
+        "codec"     : config.get("trim_codec", "libx264"),
+        "preset"    : config.get("trim_preset", "veryfast"),
+        "crf"       : config.get("trim_crf", 20),
+        "threads"   : config.get("trim_threads", 0),
+    }
+
+    if config.get("trim_bench", False):
+        bench_reencode(input_video, output_file, start_time, end_time, **encode_args)
+        sys.exit()
+
     start = time.time()
-    trim_video_ffmpeg(input_video, output_file, start_time, end_time)
-    ffmpeg_time = time.time() - start
-    print(f"FFmpeg processing time: {ffmpeg_time:.2f} seconds")
+    if trim_mode == "encode":
+        trimmed = trim_video_opencv(input_video, output_file, start_time, end_time, **encode_args) > 0
+    else:
+        trimmed = trim_video_ffmpeg(input_video, output_file, start_time, end_time)
+    elapsed = time.time() - start
+    print(f"Processing time ({trim_mode}): {elapsed:.2f} seconds")
 
+    # where the clip really starts in the source: stream copy snaps to a keyframe.
+    # A failed trim may leave an older output behind, it gets no sidecar
+    if config.get("trim_provenance", True) and trimmed:
+        prov = provenance.write_provenance(
+            input_video, output_file,
+            time_to_seconds(start_time), time_to_seconds(end_time),
+            trim_mode,
+            crop    = encode_args["crop"] if trim_mode == "encode" else None,
+            scale   = encode_args["scale"] if trim_mode == "encode" else None,
+            denoise = encode_args["denoise"] if trim_mode == "encode" else 0
+        )
+        print(f"<< clip starts at source frame {prov['frame_offset']} ({prov['offset_seconds']:.3f}s, "
+              f"snap {prov['keyframe_snap']:+.3f}s), verified: {prov['verified']} >>")
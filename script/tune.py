@@ -0,0 +1,191 @@
+"""
+per-host tuning of scanf-bulk
+
+short calibration scans of a sample video sweep batch size, worker
+processes and torch / OpenCV intra-op threads. Every trial runs in its
+own process, so thread settings and memory peaks do not leak between
+trials. The fastest setting that fits the memory budget is written to a
+per-host profile that scanf-bulk loads on start.
+
+    python script/tune.py [video]
+"""
+
+import subprocess
+import itertools
+import socket
+import yaml
+import json
+import time
+import sys
+import os
+import pandas as pd
+
+
+TUNE_ENV        = "VIXEL_TUNE"
+SETTING_KEYS    = ["batch_size", "workers", "torch_threads", "cv2_threads"]
+
+
+# ---------------------------------------------------------------------------
+def profile_path(profile_dir="./cache/tune"):
+    return os.path.join(profile_dir, socket.gethostname() + ".yaml")
+
+
+def load_profile(config, imgsz):
+    """
+    Settings scanf-bulk should use on this host: the trial settings when
+    running under tune.py, else the saved profile when bulk_use_profile
+    is on and it was tuned for the same rescale size. {} otherwise.
+    """
+    if os.environ.get(TUNE_ENV):
+        return json.loads(os.environ[TUNE_ENV])
+
+    path = profile_path(config.get("tune_profile_dir", "./cache/tune"))
+    if not config.get("bulk_use_profile", True) or not os.path.exists(path):
+        return {}
+
+    with open(path, "r") as f:
+        profile = yaml.safe_load(f) or {}
+
+    if profile.get("rescale_size") != imgsz:
+        print(f"<< tune profile {path} is for rescale size {profile.get('rescale_size')}, not {imgsz}: ignored >>")
+        return {}
+
+    print(f"<< using tune profile {path} >>")
+    return profile.get("settings", {})
+
+
+def peak_rss_mb(workers=0):
+    """
+    Peak resident memory of this process plus `workers` children (Linux
+    ru_maxrss is in KiB, the children figure is the largest finished one).
+    On Windows only this process is counted, through psutil when it is
+    installed, else None.
+    """
+    if sys.platform == "win32":
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return round(psutil.Process().memory_info().peak_wset / 2**20, 1)
+
+    import resource
+    # macOS reports bytes
+    unit        = 2**20 if sys.platform == "darwin" else 1024
+    own         = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children    = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round((own + children * workers) / unit, 1)
+
+
+# ---------------------------------------------------------------------------
+def trial_grid(config):
+    """Settings to try, skipping those that oversubscribe the CPUs"""
+    cpus = os.cpu_count() or 1
+    grid = itertools.product(
+        config.get("tune_batch_sizes", [1, 4, 8]),
+        config.get("tune_workers", [1, 2, 4]),
+        config.get("tune_torch_threads", [1, 2, 4]),
+        config.get("tune_cv2_threads", [1]),
+    )
+
+    trials = []
+    for batch_size, workers, torch_threads, cv2_threads in grid:
+        if workers * torch_threads > cpus:
+            continue
+        trials.append(dict(zip(SETTING_KEYS, (batch_size, workers, torch_threads, cv2_threads))))
+    return trials
+
+
+def run_trial(settings, video_path, frames, timeout=None):
+    """
+    One calibration scan through scanf-bulk in a fresh process, returns
+    its measurement {fps, frames, seconds, peak_rss_mb} or None on failure
+    """
+    env     = dict(os.environ, **{TUNE_ENV: json.dumps(settings)})
+    script  = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scanf-bulk.py")
+    command = [sys.executable, script, "calibrate", video_path, str(frames)]
+
+    try:
+        done = subprocess.run(command, env=env, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        print(f"<< trial {settings} timed out >>")
+        return None
+
+    if done.returncode != 0:
+        print(f"<< trial {settings} failed: {done.stderr.strip().splitlines()[-1:]} >>")
+        return None
+
+    # the measurement is the last line of the output
+    return json.loads(done.stdout.strip().splitlines()[-1])
+
+
+def tune(video_path, config):
+    """
+    Run every trial, write the results table and the host profile.
+    Returns (results DataFrame, best settings or None).
+    """
+    frames      = int(config.get("tune_frames", 64))
+    max_memory  = config.get("tune_max_memory_mb")
+    timeout     = config.get("tune_timeout", 600)
+    profile_dir = config.get("tune_profile_dir", "./cache/tune")
+    trials      = trial_grid(config)
+
+    rows = []
+    for n, settings in enumerate(trials, 1):
+        print(f"<< trial {n}/{len(trials)}: {settings} >>")
+        measured = run_trial(settings, video_path, frames, timeout)
+        if measured:
+            peak = measured["peak_rss_mb"]
+            print(f"   {measured['fps']:.2f} frames/s, peak {'?' if peak is None else f'{peak:.0f}'} MB")
+            rows.append({**settings, **measured})
+
+    df = pd.DataFrame(rows, columns=SETTING_KEYS + ["fps", "frames", "seconds", "peak_rss_mb"])
+    os.makedirs(profile_dir, exist_ok=True)
+    results_path = os.path.splitext(profile_path(profile_dir))[0] + "-results.csv"
+    df.sort_values("fps", ascending=False).to_csv(results_path, index=False)
+
+    fits = df if max_memory is None else df[df["peak_rss_mb"] <= max_memory]
+    if fits.empty:
+        print("<< no trial succeeded within the memory budget, profile not written >>")
+        return df, None
+
+    best        = fits.loc[fits["fps"].idxmax()]
+    settings    = {k: int(best[k]) for k in SETTING_KEYS}
+    profile     = {
+        "host"          : socket.gethostname(),
+        "tuned_at"      : time.strftime("%Y-%m-%d %H:%M:%S"),
+        "video"         : os.path.abspath(video_path),
+        "rescale_size"  : config.get("bulk_rescale_size"),
+        "settings"      : settings,
+        "fps"           : round(float(best["fps"]), 3),
+        "peak_rss_mb"   : float(best["peak_rss_mb"]),
+    }
+
+    with open(profile_path(profile_dir), "w") as f:
+        yaml.safe_dump(profile, f, sort_keys=False)
+
+    print(f"<< best {settings} at {profile['fps']} frames/s, saved to {profile_path(profile_dir)} >>")
+    return df, settings
+
+
+
+if __name__ == "__main__":
+    # ---------------------------------------------------------------------------
+    config              = None
+    config_file_path    = "config.yaml"
+    with open(config_file_path, 'r') as f:
+        config = yaml.safe_load(f)  # Use safe_load for security
+
+    if not config:
+        print(f">> Error: Configuration file not found at {config_file_path} <<")
+        sys.exit()
+
+    video_path = sys.argv[1] if len(sys.argv) > 1 else config.get("tune_video")
+    if not video_path:
+        video_dir   = config.get("bulk_video_dir")
+        videos      = sorted(f for f in os.listdir(video_dir) if f.lower().endswith(".mp4"))
+        if not videos:
+            print(f">> Error: no sample video, set tune_video <<")
+            sys.exit()
+        video_path  = os.path.join(video_dir, videos[0])
+
+    tune(os.path.abspath(video_path), config)
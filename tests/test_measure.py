@@ -0,0 +1,99 @@
+"""
+vectorised stereo measurement against the scalar reference
+
+    python -m pytest tests
+"""
+
+import os
+import sys
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "script"))
+
+
+@pytest.fixture(scope="module")
+def measure(tmp_path_factory):
+    # measure.py reads config.yaml from the working directory on import
+    cwd = os.getcwd()
+    os.chdir(ROOT)
+    try:
+        import measure
+    finally:
+        os.chdir(cwd)
+
+    # camera model tables go to a temporary cache
+    cache = measure.config.get("cam_model_cache")
+    measure.config["cam_model_cache"] = str(tmp_path_factory.mktemp("cammodel"))
+    measure.camera_models.clear()
+    yield measure
+    measure.config["cam_model_cache"] = cache
+    measure.camera_models.clear()
+
+
+def labelme_pair(left, right, width=1920, height=1080):
+    shapes = lambda pts: [{"label": f"s{i}", "points": p.tolist()} for i, p in enumerate(pts)]
+    return (
+        {"imageWidth": width, "imageHeight": height, "shapes": shapes(left)},
+        {"imageWidth": width, "imageHeight": height, "shapes": shapes(right)},
+    )
+
+
+def random_pair(samples, seed, width=1920, height=1080):
+    rng     = np.random.default_rng(seed)
+    scale   = np.array([width, height], dtype=np.float64)
+    left    = rng.uniform(0.05, 0.95, (samples, 2, 2)) * scale
+    # shift the right view so both rays converge in front of the rig
+    right   = np.clip(left - [width * 0.1, 0], 0, scale - 1)
+    return labelme_pair(left, right, width, height)
+
+
+def compare(measure, left_cam, right_cam):
+    labels, sizes, _, _ = measure.measure_pair(left_cam, right_cam)
+    reference           = measure.measure_pair_scalar(left_cam, right_cam)
+    expected            = np.array([reference[k] for k in labels])
+    return labels, sizes, expected
+
+
+def test_matches_scalar_on_random_segments(measure):
+    labels, sizes, expected = compare(measure, *random_pair(1000, seed=0))
+
+    assert len(labels) == 1000
+    np.testing.assert_array_equal(np.isfinite(sizes), np.isfinite(expected))
+    finite = np.isfinite(sizes)
+    assert finite.any()
+    np.testing.assert_allclose(sizes[finite], expected[finite], rtol=1e-9, atol=1e-3)
+
+
+def test_matches_scalar_at_image_edges(measure):
+    corners = np.array([
+        [[0, 0], [1919, 1079]],
+        [[0, 1079], [1919, 0]],
+        [[960, 540], [961, 541]],
+    ], dtype=np.float64)
+    right   = np.clip(corners - [192, 0], 0, [1919, 1079])
+    labels, sizes, expected = compare(measure, *labelme_pair(corners, right))
+
+    np.testing.assert_array_equal(np.isfinite(sizes), np.isfinite(expected))
+    finite = np.isfinite(sizes)
+    assert finite.any()
+    np.testing.assert_allclose(sizes[finite], expected[finite], rtol=1e-9, atol=1e-3)
+
+
+def test_unpaired_labels_are_reported(measure):
+    left_cam, right_cam = random_pair(3, seed=1)
+    right_cam["shapes"] = right_cam["shapes"][:2]
+    left_cam["shapes"][1]["points"] = left_cam["shapes"][1]["points"][:1]
+
+    labels, sizes, _, mismatched = measure.measure_pair(left_cam, right_cam)
+    assert labels == ["s0"]
+    assert sorted(mismatched) == ["s1", "s2"]
+
+
+def test_name_timestamp_across_month_and_year(measure):
+    stamp = lambda name: measure.name_timestamp(name)
+
+    assert stamp("left_20240201_000000.json") - stamp("left_20240131_235959.json") == 1
+    assert stamp("left_20250101-000010.json") - stamp("left_20241231-235950.json") == 20
+    assert stamp("left-00h02m00.333s.json") == pytest.approx(120.333)